@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.mailer import Mailer, UnsentMailException
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Alert:
+    emails: List[str]
+    subject: str
+    contents: str
+
+
+class AlertDispatcher:
+    """
+    Sends alert emails in the background so recording trade volumes never waits on the mail API
+
+    Mailers are synchronous, so a fixed pool of workers runs them in threads. That bounds how many requests are in
+    flight at once no matter how many alerts are queued
+    """
+
+    def __init__(
+        self,
+        mailer: Mailer,
+        concurrency: int = 4,
+        max_attempts: int = 5,
+        base_backoff_seconds: float = 1.0,
+    ):
+        self._mailer = mailer
+        self._concurrency = concurrency
+        self._max_attempts = max_attempts
+        self._base_backoff_seconds = base_backoff_seconds
+        # Created in start so they belong to the running event loop
+        self._queue: Optional["asyncio.Queue[Alert]"] = None
+        self._workers: List["asyncio.Task[None]"] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._concurrency, thread_name_prefix="alert-mailer"
+        )
+        self._workers = [
+            asyncio.ensure_future(self._work()) for _ in range(self._concurrency)
+        ]
+
+    def enqueue(self, alert: Alert) -> None:
+        if self._queue is None:
+            raise RuntimeError("AlertDispatcher must be started before enqueueing")
+
+        self._queue.put_nowait(alert)
+
+    async def drain(self) -> None:
+        """
+        Wait until every queued alert has been sent or has given up
+        """
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        """
+        Send everything that's queued, then shut the workers down
+        """
+        await self.drain()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def _work(self) -> None:
+        assert self._queue is not None
+        while True:
+            alert = await self._queue.get()
+            try:
+                await self._send(alert)
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, alert: Alert) -> None:
+        loop = asyncio.get_running_loop()
+        emails = alert.emails
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                await loop.run_in_executor(
+                    self._executor,
+                    self._mailer.send_bulk_mail,
+                    emails,
+                    alert.subject,
+                    alert.contents,
+                )
+                return
+            except Exception as e:
+                # Only retry the recipients that didn't get it, so nobody gets the same alert twice
+                if isinstance(e, UnsentMailException):
+                    emails = e.emails
+                if attempt == self._max_attempts:
+                    logger.exception(
+                        "Giving up on alert to %d recipients after %d attempts",
+                        len(emails),
+                        attempt,
+                    )
+                    return
+
+                # Full jitter keeps retries from every worker from hitting the mail API in lockstep
+                backoff = random.uniform(
+                    0, self._base_backoff_seconds * 2 ** (attempt - 1)
+                )
+                logger.warning(
+                    "Failed to send alert, retrying in %.2fs", backoff, exc_info=True
+                )
+                await asyncio.sleep(backoff)
@@ -0,0 +1,146 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from databases import Database
+
+
+@dataclass
+class AlertState:
+    currency_pair: str
+    email: str
+    last_alert_time: Optional[datetime]
+    armed: bool
+    """
+    Whether the currency pair's volume has dropped back down since the last alert, see AlertStateTracker
+    """
+
+
+class AlertStateStore:
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def get_alert_states(self) -> List[AlertState]:
+        rows = await self._db.fetch_all(
+            "SELECT currency_pair, email, last_alert_time, armed FROM alert_states"
+        )
+        return [
+            AlertState(
+                currency_pair=row["currency_pair"],
+                email=row["email"],
+                last_alert_time=row["last_alert_time"],
+                armed=row["armed"],
+            )
+            for row in rows
+        ]
+
+    async def save_alert_states(self, states: List[AlertState]) -> None:
+        query = """
+            INSERT INTO alert_states (currency_pair, email, last_alert_time, armed)
+            VALUES (:currency_pair, :email, :last_alert_time, :armed)
+            ON CONFLICT (currency_pair, email) DO UPDATE SET
+                last_alert_time = EXCLUDED.last_alert_time,
+                armed = EXCLUDED.armed
+        """
+        values: List[Dict[str, Any]] = [
+            {
+                "currency_pair": state.currency_pair,
+                "email": state.email,
+                "last_alert_time": state.last_alert_time,
+                "armed": state.armed,
+            }
+            for state in states
+        ]
+        # Only the states that changed this tick are saved, which is a handful of rows at most
+        await self._db.execute_many(query=query, values=values)
+
+
+class AlertStateTracker:
+    """
+    Decides whether a recipient should hear about a notable volume change, so a sustained spike sends one alert
+    instead of one every tick
+
+    After an alert a currency pair is disarmed for that recipient. It's re-armed once its volume drops below rearm_ratio
+    times the currency pair's own alert threshold (hysteresis, so a volume hovering around the threshold doesn't flap),
+    and even when armed a recipient hears about a currency pair at most once per cooldown
+    """
+
+    def __init__(
+        self,
+        cooldown: timedelta,
+        rearm_ratio: float,
+        store: Optional[AlertStateStore] = None,
+    ):
+        """
+        :param rearm_ratio: Below 1, otherwise a currency pair re-arms while it's still above its alert threshold
+        :param store: Where states are persisted so restarts don't re-send alerts, states are only kept in memory
+        without it
+        """
+        if not 0 < rearm_ratio < 1:
+            raise ValueError("rearm_ratio must be between 0 and 1")
+
+        self._cooldown = cooldown
+        self._rearm_ratio = rearm_ratio
+        self._store = store
+        self._states: Dict[Tuple[str, str], AlertState] = {}
+        self._changed: Dict[Tuple[str, str], AlertState] = {}
+
+    async def load(self) -> None:
+        if self._store is None:
+            return
+
+        self._states = {
+            (state.currency_pair, state.email): state
+            for state in await self._store.get_alert_states()
+        }
+
+    def observe(
+        self,
+        currency_pair: str,
+        volume: float,
+        threshold: Optional[float],
+        emails: List[str],
+    ) -> None:
+        """
+        Re-arm alerts for the given currency pair if its volume has dropped back down, call this for every currency
+        pair every tick whether or not its change was notable
+
+        :param threshold: The currency pair's alert threshold this tick, see AlertThresholds.threshold. Nothing is
+        re-armed without one
+        """
+        if threshold is None or float(volume) >= threshold * self._rearm_ratio:
+            return
+
+        for email in emails:
+            state = self._states.get((currency_pair, email))
+            if state is not None and not state.armed:
+                state.armed = True
+                self._changed[(currency_pair, email)] = state
+
+    def should_alert(self, currency_pair: str, email: str, now: datetime) -> bool:
+        """
+        Check whether to alert the recipient about a notable change, and if so record that they've been alerted
+        """
+        key = (currency_pair, email)
+        state = self._states.get(key)
+        if state is not None:
+            if not state.armed:
+                return False
+            if (
+                state.last_alert_time is not None
+                and now - state.last_alert_time < self._cooldown
+            ):
+                return False
+
+        state = AlertState(currency_pair, email, last_alert_time=now, armed=False)
+        self._states[key] = state
+        self._changed[key] = state
+        return True
+
+    async def save(self) -> None:
+        """
+        Persist every state that changed since the last save
+        """
+        if self._store is not None and self._changed:
+            await self._store.save_alert_states(list(self._changed.values()))
+        self._changed = {}
@@ -0,0 +1,155 @@
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Dict, List, Mapping, Optional
+
+from app.currency_trade_volume_store import CurrencyPairAvg
+from app.types import CurrencyTradeVolumeRecord
+from app.volume_statistics import VolumeStatistics
+
+
+def parse_threshold_multipliers(value: str) -> Dict[str, float]:
+    """
+    Parse per currency pair multipliers written as "XEM/BTC=5,DGB/BTC=2.5"
+    """
+    multipliers: Dict[str, float] = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+
+        currency_pair, separator, multiplier = item.partition("=")
+        if not separator:
+            raise ValueError(f"Expected CURRENCY_PAIR=MULTIPLIER, got {item!r}")
+        multipliers[currency_pair.strip()] = float(multiplier)
+
+    return multipliers
+
+
+class AlertMetric(str, Enum):
+    """
+    What a trade volume is compared against, every metric except AVERAGE needs the currency pair's VolumeStatistics
+    """
+
+    AVERAGE = "average"
+    """
+    At least multiplier times the hourly average volume
+    """
+    EWMA = "ewma"
+    """
+    At least multiplier times the exponentially weighted moving average, which follows recent volumes more closely
+    """
+    PERCENTILE = "percentile"
+    """
+    At least multiplier times the 95th percentile volume of the last 24 hours
+    """
+    Z_SCORE = "z_score"
+    """
+    At least multiplier standard deviations above the mean volume of the last 24 hours
+    """
+
+
+@dataclass
+class AlertThresholds:
+    """
+    A trade volume is notable when it's at least the currency pair's multiplier times its average volume, or
+    whatever metric says instead
+    """
+
+    default_multiplier: float = 3
+    multipliers: Mapping[str, float] = field(default_factory=dict)
+    """
+    Overrides the default multiplier for individual currency pairs
+    """
+    metric: AlertMetric = AlertMetric.AVERAGE
+
+    def multiplier(self, currency_pair: str) -> float:
+        return self.multipliers.get(currency_pair, self.default_multiplier)
+
+    def threshold(
+        self,
+        currency_pair: str,
+        avg_volume: float,
+        statistics: Optional[VolumeStatistics] = None,
+    ) -> Optional[float]:
+        """
+        The volume from which on a trade volume is notable, None if there's nothing to compare against
+        """
+        multiplier = self.multiplier(currency_pair)
+        if self.metric == AlertMetric.AVERAGE:
+            # Averages from the database are Decimals, which can't be multiplied by a float
+            return float(avg_volume) * multiplier if avg_volume > 0 else None
+
+        if statistics is None:
+            return None
+        if self.metric == AlertMetric.Z_SCORE:
+            # A currency pair that always trades the same volume has no spread to measure against
+            if not statistics.std_dev:
+                return None
+            return statistics.mean + multiplier * statistics.std_dev
+
+        baseline = (
+            statistics.ewma
+            if self.metric == AlertMetric.EWMA
+            else statistics.percentile
+        )
+        return baseline * multiplier if baseline > 0 else None
+
+    def is_notable(
+        self,
+        currency_pair: str,
+        volume: float,
+        avg_volume: float,
+        statistics: Optional[VolumeStatistics] = None,
+    ) -> bool:
+        threshold = self.threshold(currency_pair, avg_volume, statistics)
+        return threshold is not None and float(volume) >= threshold
+
+
+@dataclass
+class VolumeChange:
+    trade_volume: CurrencyTradeVolumeRecord
+    avg_volume: float
+    threshold: Optional[float]
+    """
+    See AlertThresholds.threshold
+    """
+    notable: bool
+
+
+def find_volume_changes(
+    trade_volumes: List[CurrencyTradeVolumeRecord],
+    avg_trade_volumes: List[CurrencyPairAvg],
+    thresholds: AlertThresholds,
+    statistics: Optional[Mapping[str, VolumeStatistics]] = None,
+) -> List[VolumeChange]:
+    """
+    Compare every trade volume against its currency pair's average in a single pass, trade volumes without an average
+    are left out
+
+    :param statistics: Every currency pair's statistics, needed unless thresholds uses AlertMetric.AVERAGE
+    """
+    avg_volumes = {avg.currency_pair: avg.avg_volume for avg in avg_trade_volumes}
+    changes: List[VolumeChange] = []
+    for trade_volume in trade_volumes:
+        avg_volume = avg_volumes.get(trade_volume.currency_pair)
+        if avg_volume is None:
+            continue
+
+        threshold = thresholds.threshold(
+            trade_volume.currency_pair,
+            avg_volume,
+            (
+                statistics.get(trade_volume.currency_pair)
+                if statistics is not None
+                else None
+            ),
+        )
+        changes.append(
+            VolumeChange(
+                trade_volume,
+                avg_volume,
+                threshold,
+                threshold is not None and float(trade_volume.volume) >= threshold,
+            )
+        )
+
+    return changes
@@ -0,0 +1,162 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import AbstractSet, Callable, Dict, FrozenSet, Iterable, List, Optional
+
+from databases import Database
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownCurrencyPairException(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class TrackedCurrencyPair:
+    id: int
+    symbol: str
+    enabled: bool = True
+    """
+    Disabled currency pairs are no longer fetched, they keep their id so their history can still be read
+    """
+
+
+class CurrencyPairRegistry:
+    """
+    The currency pairs we track, loaded from the tracked_currency_pairs table so pairs can be added without a deploy
+
+    Storage refers to currency pairs by integer id, the registry maps between ids and symbols in memory. Lookups never
+    hit the database, refresh reloads the table
+    """
+
+    def __init__(
+        self,
+        db: Optional[Database] = None,
+        refresh_seconds: float = 60,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param db: Where to load currency pairs from, without it the registry only holds the pairs it's given
+        :param refresh_seconds: How often refresh_if_stale reloads the table
+        """
+        self._db = db
+        self._refresh_seconds = refresh_seconds
+        self._clock = clock
+        self._loaded_at: Optional[float] = None
+        self._set_pairs([])
+
+    @classmethod
+    def from_pairs(cls, symbols: Iterable[str]) -> "CurrencyPairRegistry":
+        """
+        Registry of the given currency pairs that isn't backed by the database, ids are assigned in order from 1
+        """
+        registry = cls()
+        registry._set_pairs(
+            [
+                TrackedCurrencyPair(id=index + 1, symbol=symbol)
+                for index, symbol in enumerate(symbols)
+            ]
+        )
+        return registry
+
+    def _set_pairs(self, pairs: List[TrackedCurrencyPair]) -> None:
+        # Swap whole maps in rather than mutating them so readers never see a half loaded registry
+        self._ids: Dict[str, int] = {pair.symbol: pair.id for pair in pairs}
+        self._symbols: Dict[int, str] = {pair.id: pair.symbol for pair in pairs}
+        self._enabled: FrozenSet[str] = frozenset(
+            pair.symbol for pair in pairs if pair.enabled
+        )
+
+    async def refresh(self) -> None:
+        if self._db is None:
+            return
+
+        rows = await self._db.fetch_all(
+            "SELECT id, symbol, enabled FROM tracked_currency_pairs"
+        )
+        self._set_pairs(
+            [
+                TrackedCurrencyPair(
+                    id=row["id"], symbol=row["symbol"], enabled=row["enabled"]
+                )
+                for row in rows
+            ]
+        )
+        self._loaded_at = self._clock()
+        logger.debug("Loaded %d tracked currency pairs", len(self._enabled))
+
+    async def refresh_if_stale(self) -> None:
+        if (
+            self._loaded_at is None
+            or self._clock() - self._loaded_at >= self._refresh_seconds
+        ):
+            await self.refresh()
+
+    @property
+    def symbols(self) -> AbstractSet[str]:
+        """
+        Symbols of every currency pair that is currently tracked
+        """
+        return self._enabled
+
+    def __contains__(self, symbol: object) -> bool:
+        return symbol in self._enabled
+
+    def __len__(self) -> int:
+        return len(self._enabled)
+
+    def shard_symbols(
+        self, shards: AbstractSet[int], shard_count: int
+    ) -> FrozenSet[str]:
+        """
+        Symbols of the tracked currency pairs in the given shards, currency pairs are spread over shards by id
+        """
+        return frozenset(
+            symbol
+            for symbol in self._enabled
+            if self._ids[symbol] % shard_count in shards
+        )
+
+    def id(self, symbol: str) -> int:
+        try:
+            return self._ids[symbol]
+        except KeyError:
+            raise UnknownCurrencyPairException(symbol) from None
+
+    def symbol(self, currency_pair_id: int) -> str:
+        try:
+            return self._symbols[currency_pair_id]
+        except KeyError:
+            raise UnknownCurrencyPairException(currency_pair_id) from None
+
+    async def add(self, symbol: str) -> int:
+        """
+        Start tracking a currency pair, or re-enable one that was disabled, and return its id
+        """
+        if self._db is None:
+            raise RuntimeError("Only registries backed by the database can be changed")
+
+        currency_pair_id = await self._db.fetch_val(
+            """
+            INSERT INTO tracked_currency_pairs (symbol, enabled) VALUES (:symbol, true)
+            ON CONFLICT (symbol) DO UPDATE SET enabled = true
+            RETURNING id
+            """,
+            {"symbol": symbol},
+        )
+        await self.refresh()
+        return int(currency_pair_id)
+
+    async def disable(self, symbol: str) -> None:
+        """
+        Stop fetching a currency pair, its history is kept until retention prunes it
+        """
+        if self._db is None:
+            raise RuntimeError("Only registries backed by the database can be changed")
+
+        await self._db.execute(
+            "UPDATE tracked_currency_pairs SET enabled = false WHERE symbol = :symbol",
+            {"symbol": symbol},
+        )
+        await self.refresh()
@@ -1,68 +1,123 @@
-from dataclasses import dataclass
+from datetime import datetime, timezone
 from enum import Enum
-from typing import List, Optional
+from typing import AbstractSet, Collection, Dict, List, Optional, Sequence
 
-from app.currency_trade_volume_store import CurrencyTradeVolumeStore, CurrencyPairAvg
-from app.livecoin_api import LivecoinApi
+from app.alert_dispatcher import Alert, AlertDispatcher
+from app.alert_state import AlertStateTracker
+from app.alert_thresholds import AlertMetric, AlertThresholds, find_volume_changes
+from app.currency_pair_registry import (
+    CurrencyPairRegistry,
+    UnknownCurrencyPairException,
+)
+from app.currency_trade_volume_store import CurrencyPairRank, CurrencyTradeVolumeStore
+from app.exchange_source import ExchangeSource
 from app.mailer import Mailer
-from app.types import CurrencyTradeVolumeRecord
+from app.read_router import ReadRouter
+from app.snapshot_cache import SnapshotCache
+from app.types import (
+    CurrencyPairSnapshot,
+    CurrencyTradeVolumeRecord,
+    HistoryResolution,
+)
+from app.volume_aggregates import VolumeAggregates
+from app.volume_rollup_store import VolumeRollupStore, select_resolution
+from app.volume_statistics import VolumeMetric
+from app.volume_updates import VolumeTick, VolumeUpdatePublisher
 
 
 # Free heroku database can only hold 10,000 rows so just store a couple of them
 # as an example. These were picked by looking for ones that have a larger
-# variance in short time scales
+# variance in short time scales. The tracked_currency_pairs table is seeded with
+# these, add more there (see app/track_currency_pair.py)
 class CurrencyPair(str, Enum):
     XEM_TO_BTC = "XEM/BTC"
     OTON_TO_BTC = "OTON/BTC"
     DGB_TO_BTC = "DGB/BTC"
 
 
-_TRACKED_PAIRS = [pair.value for pair in CurrencyPair]
+DEFAULT_CURRENCY_PAIRS = [pair.value for pair in CurrencyPair]
 
 
 class PairNotFoundException(Exception):
     pass
 
 
-@dataclass
-class CurrencyPairSnapshot:
-    currency_pair: str
-    history: List[CurrencyTradeVolumeRecord]
-    rank: int
-    """
-    The currency pair's position in the list of all tracked currency pairs
-    sorted by the standard deviation of their trade volume over the last 24
-    hours
-    """
-    total_tracked_currency_pairs: int
-
-
-def _find_avg_volume(
-    currency_pair: str, avg_trade_volumes: List[CurrencyPairAvg]
-) -> Optional[float]:
-    for avg_volume_record in avg_trade_volumes:
-        if avg_volume_record.currency_pair == currency_pair:
-            return avg_volume_record.avg_volume
-
-    return None
-
-
-def _is_notable_volume_change(new_trade_volume: float, avg_trade_volume: float) -> bool:
-    return avg_trade_volume > 0 and new_trade_volume >= avg_trade_volume * 3
-
-
 class CurrencyTradeVolumeService:
     def __init__(
         self,
         store: CurrencyTradeVolumeStore,
-        api: LivecoinApi,
+        api: ExchangeSource,
         mailer: Mailer,
         notify_emails: List[str],
+        aggregates: Optional[VolumeAggregates] = None,
+        snapshot_cache: Optional[SnapshotCache] = None,
+        rollup_store: Optional[VolumeRollupStore] = None,
+        alert_dispatcher: Optional[AlertDispatcher] = None,
+        alert_tracker: Optional[AlertStateTracker] = None,
+        alert_thresholds: Optional[AlertThresholds] = None,
+        registry: Optional[CurrencyPairRegistry] = None,
+        update_publisher: Optional[VolumeUpdatePublisher] = None,
+        rank_metric: VolumeMetric = VolumeMetric.STD_DEV,
+        reads: Optional[ReadRouter] = None,
     ):
+        """
+        :param aggregates: When given, averages and ranks are computed in memory instead of by the database. Only
+        valid if every trade volume is recorded through this service instance (see load_volume_aggregates)
+        :param snapshot_cache: When given, snapshots are served from the cache until the next batch of trade volumes
+        is recorded
+        :param rollup_store: When given, rollups are kept up to date with every batch of trade volumes and snapshots
+        can be requested at lower resolutions. Without it every snapshot has the raw history
+        :param alert_dispatcher: When given, alert emails are queued and sent in the background with one request for
+        all recipients. Without it they are sent one recipient at a time before update_trade_volumes returns
+        :param alert_tracker: When given, recipients are only alerted about a currency pair again once it has calmed
+        down and its cooldown has passed. Without it every notable change is sent every time
+        :param alert_thresholds: What counts as a notable change, defaults to 3 times the average for every currency pair
+        :param registry: The currency pairs to track, should be the same registry the stores use. Defaults to
+        DEFAULT_CURRENCY_PAIRS
+        :param update_publisher: When given, every tick's new trade volumes and ranks are published to it for live
+        update subscribers
+        :param rank_metric: What currency pairs are ranked by, in-memory aggregates can only rank by STD_DEV
+        :param reads: The read router the stores use, if any. Snapshots built for a new cache generation are only read
+        from replicas that have replayed the tick behind it
+        """
+        if aggregates is not None and rank_metric != VolumeMetric.STD_DEV:
+            raise ValueError("In-memory aggregates can only rank by std_dev")
+
         self._store = store
         self._api = api
         self._mailer = mailer
         self._notify_emails = notify_emails
+        self._aggregates = aggregates
+        self._snapshot_cache = snapshot_cache
+        self._rollup_store = rollup_store
+        self._alert_dispatcher = alert_dispatcher
+        self._alert_tracker = alert_tracker
+        self._alert_thresholds = alert_thresholds or AlertThresholds()
+        self._update_publisher = update_publisher
+        self._rank_metric = rank_metric
+        self._reads = reads
+        self._synced_generation: Optional[int] = None
+        # Not `registry or ...`, an empty registry that hasn't been loaded yet is falsy
+        self._registry = (
+            registry
+            if registry is not None
+            else CurrencyPairRegistry.from_pairs(DEFAULT_CURRENCY_PAIRS)
+        )
+        # Only tracked for in-memory aggregates, otherwise the ranks table records when each tick finished
+        self._last_tick_at: Optional[datetime] = None
+
+    async def load(self):
+        """
+        Load any in-memory state from the database, must be called on startup before using the service
+        """
+        await self._registry.refresh()
+        await self._store.load()
+        if self._aggregates is not None:
+            since = datetime.now(timezone.utc) - self._aggregates.history_window
+            self._aggregates.load(await self._store.get_trade_volumes_since(since))
+
+        if self._alert_tracker is not None:
+            await self._alert_tracker.load()
 
     async def update_trade_volumes(self):
         """
@@ -70,39 +125,379 @@ class CurrencyTradeVolumeService:
         Send out email alerts for notable changes in trade volume
         """
 
-        trade_volumes = await self._api.fetch_trade_volumes(_TRACKED_PAIRS)
+        await self._registry.refresh_if_stale()
+        trade_volumes = await self._ingest(self._registry.symbols)
+        await self._process_tick(trade_volumes)
+
+    async def update_trade_volume_shards(
+        self, shards: AbstractSet[int], shard_count: int
+    ):
+        """
+        Load and record the trade volumes of the currency pairs in the given shards only. Averages and alerts are left to
+        finalize_tick, which runs once all shards have been recorded
+        """
+        await self._registry.refresh_if_stale()
+        currency_pairs = self._registry.shard_symbols(shards, shard_count)
+        if currency_pairs:
+            await self._ingest(currency_pairs)
+
+    async def finalize_tick(self, tick_start: datetime):
+        """
+        Send out email alerts for every trade volume recorded since tick_start, by any shard
+        """
+        latest_trade_volumes: Dict[str, CurrencyTradeVolumeRecord] = {}
+        for record in await self._store.get_trade_volumes_since(tick_start):
+            latest_trade_volumes[record.currency_pair] = record
+
+        if self._alert_tracker is not None:
+            # Whichever worker finalized the previous tick may have changed alert states since this one loaded them
+            await self._alert_tracker.load()
+        await self._process_tick(list(latest_trade_volumes.values()))
+
+    async def _ingest(
+        self, currency_pairs: AbstractSet[str]
+    ) -> List[CurrencyTradeVolumeRecord]:
+        trade_volumes = await self._api.fetch_trade_volumes(currency_pairs)
         await self._store.record_trade_volumes(trade_volumes)
-        avg_trade_volumes = await self._store.get_currency_pair_averages()
-
-        # We could likely trade memory usage for speed if there are huge numbers of tracked currency pairs here by first
-        # creating a hash map of average trade volumes indexed by currency pair instead of searching for them in the
-        # list every time
-        for trade_volume in trade_volumes:
-            avg_volume = _find_avg_volume(trade_volume.currency_pair, avg_trade_volumes)
-            if avg_volume is not None and _is_notable_volume_change(
-                trade_volume.volume, avg_volume
-            ):
-                for email in self._notify_emails:
-                    self._mailer.send_mail(
-                        email,
-                        "CryptoTracker Alert",
-                        f"{trade_volume.currency_pair} is trading at {trade_volume.volume}",
-                    )
+        if self._rollup_store is not None:
+            await self._rollup_store.record_rollups(trade_volumes)
+        if self._aggregates is not None:
+            self._aggregates.record(trade_volumes)
+
+        return trade_volumes
+
+    async def _process_tick(self, trade_volumes: List[CurrencyTradeVolumeRecord]):
+        # Scanned once for both the ranks and the alert thresholds that need it
+        statistics = None
+        if self._alert_thresholds.metric != AlertMetric.AVERAGE or (
+            self._aggregates is None and self._rank_metric != VolumeMetric.STD_DEV
+        ):
+            statistics = await self._store.get_volume_statistics()
+
+        if self._aggregates is not None:
+            self._last_tick_at = datetime.now(timezone.utc)
+            avg_trade_volumes = self._aggregates.get_currency_pair_averages(
+                datetime.now(timezone.utc)
+            )
+        else:
+            avg_trade_volumes = await self._store.get_currency_pair_averages()
+            await self._store.refresh_currency_pair_ranks(
+                self._rank_metric, statistics
+            )
+
+        if self._snapshot_cache is not None:
+            await self._snapshot_cache.invalidate()
+
+        if self._update_publisher is not None:
+            await self._update_publisher.publish(
+                await self._make_volume_tick(trade_volumes)
+            )
+
+        notable_trade_volumes: List[CurrencyTradeVolumeRecord] = []
+        for change in find_volume_changes(
+            trade_volumes, avg_trade_volumes, self._alert_thresholds, statistics
+        ):
+            if self._alert_tracker is not None:
+                self._alert_tracker.observe(
+                    change.trade_volume.currency_pair,
+                    change.trade_volume.volume,
+                    change.threshold,
+                    self._notify_emails,
+                )
+            if change.notable:
+                notable_trade_volumes.append(change.trade_volume)
+
+        await self._send_alerts(notable_trade_volumes)
+
+    async def load_volume_tick(self, since: datetime) -> VolumeTick:
+        """
+        The trade volumes recorded since the given time with the current ranks, for publishing a tick that was recorded
+        by another process
+        """
+        return await self._make_volume_tick(
+            await self._store.get_trade_volumes_since(since)
+        )
+
+    async def _make_volume_tick(
+        self, trade_volumes: List[CurrencyTradeVolumeRecord]
+    ) -> VolumeTick:
+        if self._aggregates is not None:
+            return VolumeTick(
+                trade_volumes,
+                self._aggregates.get_currency_pair_ranks(
+                    datetime.now(timezone.utc), self._registry.symbols
+                ),
+                len(self._registry),
+                self._last_tick_at,
+            )
+
+        ranks = await self._store.get_latest_currency_pair_ranks()
+        computed_at = [
+            rank.computed_at for rank in ranks if rank.computed_at is not None
+        ]
+        return VolumeTick(
+            trade_volumes,
+            ranks,
+            len(self._registry),
+            max(computed_at) if computed_at else None,
+        )
+
+    async def _send_alerts(
+        self, notable_trade_volumes: List[CurrencyTradeVolumeRecord]
+    ):
+        """
+        Send each recipient a single digest of all the notable changes they should hear about
+        """
+        now = datetime.now(timezone.utc)
+        # Recipients that get the same digest can share a single request
+        recipients_by_digest: Dict[str, List[str]] = {}
+        for email in self._notify_emails:
+            lines = [
+                f"{trade_volume.currency_pair} is trading at {trade_volume.volume}"
+                for trade_volume in notable_trade_volumes
+                if self._alert_tracker is None
+                or self._alert_tracker.should_alert(
+                    trade_volume.currency_pair, email, now
+                )
+            ]
+            if lines:
+                recipients_by_digest.setdefault("<br>".join(lines), []).append(email)
+
+        if self._alert_tracker is not None:
+            await self._alert_tracker.save()
+
+        for contents, emails in recipients_by_digest.items():
+            if self._alert_dispatcher is not None:
+                self._alert_dispatcher.enqueue(
+                    Alert(emails, "CryptoTracker Alert", contents)
+                )
+                continue
+
+            for email in emails:
+                self._mailer.send_mail(email, "CryptoTracker Alert", contents)
+
+    async def get_snapshot_updated_at(self, currency_pair: str) -> Optional[datetime]:
+        """
+        When the data behind the currency pair's snapshots last changed, without building a snapshot. None if unknown
+
+        :raises UnknownCurrencyPairException: If the currency pair isn't tracked
+        """
+        await self._registry.refresh_if_stale()
+        if currency_pair not in self._registry:
+            raise UnknownCurrencyPairException(currency_pair)
+
+        if self._aggregates is not None:
+            return self._last_tick_at
+
+        rank = await self._store.get_currency_pair_rank(currency_pair)
+        return rank.computed_at if rank is not None else None
 
     async def get_currency_pair_snapshot(
-        self, currency_pair: CurrencyPair
+        self,
+        currency_pair: str,
+        resolution: Optional[HistoryResolution] = None,
+        max_points: Optional[int] = None,
     ) -> CurrencyPairSnapshot:
         """
         Get a history trade volume history for the last 24 hours of the given currency pair as well as a ranking for the
         amount of fluctuation in the given pair amongst all currency pair trade volumes
+
+        :param resolution: Return rolled up history at this resolution instead of every sample
+        :param max_points: Pick the finest resolution that returns at most this many points. Ignored if resolution is
+        given
+        :raises UnknownCurrencyPairException: If the currency pair isn't tracked
+        """
+        await self._registry.refresh_if_stale()
+        if currency_pair not in self._registry:
+            raise UnknownCurrencyPairException(currency_pair)
+
+        resolution = self._pick_resolution(resolution, max_points)
+        if self._snapshot_cache is None:
+            return await self._build_currency_pair_snapshot(currency_pair, resolution)
+
+        cache_key = currency_pair + "@" + resolution
+        cached = await self._snapshot_cache.get(cache_key)
+        if cached.snapshot is not None:
+            return cached.snapshot
+
+        await self._sync_reads(cached.generation)
+        # Checked before building, what's in the database now includes the tick behind the generation
+        cacheable = not await self._store.is_behind()
+        snapshot = await self._build_currency_pair_snapshot(currency_pair, resolution)
+        if cacheable:
+            await self._snapshot_cache.set(cache_key, snapshot, cached.generation)
+        return snapshot
+
+    async def check_tracked(self, currency_pairs: Collection[str]) -> None:
+        """
+        :raises UnknownCurrencyPairException: If any of the currency pairs isn't tracked
+        """
+        await self._registry.refresh_if_stale()
+        for currency_pair in currency_pairs:
+            if currency_pair not in self._registry:
+                raise UnknownCurrencyPairException(currency_pair)
+
+    async def get_currency_pair_snapshots(
+        self,
+        currency_pairs: Sequence[str],
+        resolution: Optional[HistoryResolution] = None,
+        max_points: Optional[int] = None,
+    ) -> List[CurrencyPairSnapshot]:
+        """
+        Get the snapshots of several currency pairs at once, see get_currency_pair_snapshot. Ranks and histories of
+        every pair that isn't cached are loaded with one query each instead of two queries per pair
+
+        :return: Snapshots in the order they were asked for, currency pairs without any data yet are left out
+        :raises UnknownCurrencyPairException: If any of the currency pairs isn't tracked
+        """
+        await self.check_tracked(currency_pairs)
+        # Drop duplicates but keep the order
+        requested = list(dict.fromkeys(currency_pairs))
+
+        resolution = self._pick_resolution(resolution, max_points)
+        snapshots: Dict[str, CurrencyPairSnapshot] = {}
+        generations: Dict[str, int] = {}
+        if self._snapshot_cache is not None:
+            for currency_pair in requested:
+                cached = await self._snapshot_cache.get(
+                    currency_pair + "@" + resolution
+                )
+                if cached.snapshot is not None:
+                    snapshots[currency_pair] = cached.snapshot
+                else:
+                    generations[currency_pair] = cached.generation
+            for generation in sorted(set(generations.values())):
+                await self._sync_reads(generation)
+
+        cacheable = (
+            self._snapshot_cache is not None
+            and bool(generations)
+            and not await self._store.is_behind()
+        )
+        built = await self._build_currency_pair_snapshots(
+            [pair for pair in requested if pair not in snapshots], resolution
+        )
+        for currency_pair, snapshot in built.items():
+            snapshots[currency_pair] = snapshot
+            if self._snapshot_cache is not None and cacheable:
+                await self._snapshot_cache.set(
+                    currency_pair + "@" + resolution,
+                    snapshot,
+                    generations[currency_pair],
+                )
+
+        return [snapshots[pair] for pair in requested if pair in snapshots]
+
+    async def get_snapshots_updated_at(
+        self, currency_pairs: Sequence[str]
+    ) -> Optional[datetime]:
+        """
+        When the data behind any of the currency pairs' snapshots last changed, see get_snapshot_updated_at
+
+        :raises UnknownCurrencyPairException: If any of the currency pairs isn't tracked
+        """
+        await self.check_tracked(currency_pairs)
+        if self._aggregates is not None:
+            return self._last_tick_at
+
+        ranks = await self._store.get_currency_pair_ranks_by_pair(currency_pairs)
+        computed_at = [
+            rank.computed_at for rank in ranks.values() if rank.computed_at is not None
+        ]
+        return max(computed_at) if computed_at else None
+
+    async def _sync_reads(self, generation: int) -> None:
         """
-        ranks = await self._store.get_currency_pair_ranks()
-        history = await self._store.get_currency_pair_history(currency_pair)
+        A new cache generation means another tick was recorded, replicas that haven't replayed it yet would have its
+        snapshots cached with the previous tick's data
+        """
+        if self._reads is None or generation == self._synced_generation:
+            return
+
+        await self._reads.sync_with_primary()
+        self._synced_generation = generation
+
+    def _pick_resolution(
+        self, resolution: Optional[HistoryResolution], max_points: Optional[int]
+    ) -> HistoryResolution:
+        if self._rollup_store is None:
+            return HistoryResolution.RAW
+        if resolution is not None:
+            return resolution
+        if max_points is not None:
+            return select_resolution(max_points)
+        return HistoryResolution.RAW
+
+    async def _build_currency_pair_snapshots(
+        self, currency_pairs: List[str], resolution: HistoryResolution
+    ) -> Dict[str, CurrencyPairSnapshot]:
+        if not currency_pairs:
+            return {}
+
+        ranks: Dict[str, CurrencyPairRank]
+        if self._aggregates is not None:
+            wanted = set(currency_pairs)
+            ranks = {
+                rank.currency_pair: rank
+                for rank in self._aggregates.get_currency_pair_ranks(
+                    datetime.now(timezone.utc), self._registry.symbols
+                )
+                if rank.currency_pair in wanted
+            }
+        else:
+            ranks = await self._store.get_currency_pair_ranks_by_pair(currency_pairs)
+
+        ranked = [pair for pair in currency_pairs if pair in ranks]
+        if not ranked:
+            return {}
 
+        histories: Dict[str, List[CurrencyTradeVolumeRecord]]
+        if resolution == HistoryResolution.RAW or self._rollup_store is None:
+            histories = await self._store.get_currency_pair_histories(ranked)
+        else:
+            histories = {
+                currency_pair: list(history)
+                for currency_pair, history in (
+                    await self._rollup_store.get_rollup_histories(ranked, resolution)
+                ).items()
+            }
+
+        return {
+            currency_pair: CurrencyPairSnapshot(
+                currency_pair,
+                histories[currency_pair],
+                ranks[currency_pair].rank,
+                len(self._registry),
+                resolution,
+                ranks[currency_pair].computed_at or self._last_tick_at,
+            )
+            for currency_pair in ranked
+        }
+
+    async def _build_currency_pair_snapshot(
+        self, currency_pair: str, resolution: HistoryResolution
+    ) -> CurrencyPairSnapshot:
         target_rank: Optional[int] = None
-        for rank in ranks:
-            if rank.currency_pair == currency_pair:
-                target_rank = rank.rank
+        updated_at = self._last_tick_at
+        if self._aggregates is not None:
+            for rank in self._aggregates.get_currency_pair_ranks(
+                datetime.now(timezone.utc), self._registry.symbols
+            ):
+                if rank.currency_pair == currency_pair:
+                    target_rank = rank.rank
+        else:
+            stored_rank = await self._store.get_currency_pair_rank(currency_pair)
+            if stored_rank is not None:
+                target_rank = stored_rank.rank
+                updated_at = stored_rank.computed_at
+
+        history: List[CurrencyTradeVolumeRecord]
+        if resolution == HistoryResolution.RAW or self._rollup_store is None:
+            history = await self._store.get_currency_pair_history(currency_pair)
+        else:
+            history = list(
+                await self._rollup_store.get_rollup_history(currency_pair, resolution)
+            )
 
         if target_rank is None:
             # TODO: Log requested currency pair and results
@@ -112,5 +507,10 @@ class CurrencyTradeVolumeService:
             raise PairNotFoundException()
 
         return CurrencyPairSnapshot(
-            currency_pair, history, target_rank, len(_TRACKED_PAIRS)
+            currency_pair,
+            history,
+            target_rank,
+            len(self._registry),
+            resolution,
+            updated_at,
         )
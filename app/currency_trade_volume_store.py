@@ -1,16 +1,43 @@
+import logging
+import time
 from dataclasses import dataclass
-from typing import List
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Collection, Dict, List, Mapping, Optional
 
 from databases import Database
 
+from app.currency_pair_registry import CurrencyPairRegistry
+from app.read_router import ReadRouter
 from app.types import CurrencyTradeVolumeRecord
+from app.volume_statistics import (
+    EWMA_ALPHA,
+    SPIKE_PERCENTILE,
+    VolumeMetric,
+    VolumeStatistics,
+    order_by_metric,
+    statistics_from_aggregates,
+)
+
+logger = logging.getLogger(__name__)
+
+# Postgres allows at most 32767 bind parameters in a single statement and each record uses three of them
+MAX_INSERT_BATCH_SIZE = 32767 // 3
+DEFAULT_INSERT_BATCH_SIZE = 1000
 
 
 @dataclass
 class CurrencyPairRank:
     rank: int
     currency_pair: str
-    volume_std_dev: float
+    volume_std_dev: Optional[float]
+    """
+    None when there's only been a single sample in the last 24 hours
+    """
+    computed_at: Optional[datetime] = None
+    """
+    When ingest stored the rank, it changes once per tick so it doubles as the version of the tick's data
+    """
 
 
 @dataclass
@@ -19,34 +46,104 @@ class CurrencyPairAvg:
     avg_volume: float
 
 
+@dataclass
+class RecordTradeVolumesResult:
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+def rank_by_metric(
+    statistics: Mapping[str, VolumeStatistics], metric: VolumeMetric
+) -> List[CurrencyPairRank]:
+    return [
+        CurrencyPairRank(
+            rank=index + 1,
+            currency_pair=currency_pair,
+            volume_std_dev=statistics[currency_pair].std_dev,
+        )
+        for index, currency_pair in enumerate(order_by_metric(statistics, metric))
+    ]
+
+
+@lru_cache(maxsize=8)
+def _multi_row_insert_query(row_count: int) -> str:
+    # Batches are almost always the same size, so only build each statement once
+    rows = ",".join(
+        f"(:fetch_time_{i}, :volume_{i}, :currency_pair_id_{i})"
+        for i in range(row_count)
+    )
+    return f"INSERT INTO currency_pair_volumes(fetch_time, volume, currency_pair_id) VALUES {rows}"
+
+
 class CurrencyTradeVolumeStore:
-    def __init__(self, db: Database):
+    def __init__(
+        self,
+        db: Database,
+        registry: CurrencyPairRegistry,
+        insert_batch_size: int = DEFAULT_INSERT_BATCH_SIZE,
+        reads: Optional[ReadRouter] = None,
+    ):
+        """
+        :param reads: Where history and ranks are read from for the API, the primary database without it. Ingest always
+        reads from the primary since it needs to see what it just wrote
+        """
+        if not 0 < insert_batch_size <= MAX_INSERT_BATCH_SIZE:
+            raise ValueError(
+                f"insert_batch_size must be between 1 and {MAX_INSERT_BATCH_SIZE}"
+            )
+
         self._db = db
+        self._registry = registry
+        self._insert_batch_size = insert_batch_size
+        self._reads = reads if reads is not None else ReadRouter(db, [])
 
-    async def record_trade_volumes(self, records: List[CurrencyTradeVolumeRecord]):
+    async def load(self) -> None:
         """
-        Store the given trade volumes
+        Load any in-memory state, the database store doesn't have any
         """
 
-        query = """
-        INSERT INTO currency_pair_volumes(fetch_time, volume, currency_pair)
-        VALUES (:fetch_time, :volume, :currency_pair)
+    async def is_behind(self) -> bool:
         """
-        values = [
-            {
-                "fetch_time": record.time,
-                "volume": record.volume,
-                "currency_pair": record.currency_pair,
-            }
-            for record in records
-        ]
-        # TODO: Use a real bulk insert here
-        # This will perform a seperate insert for each value. Since we only track
-        # three currency pairs and update once a minute right now it doesn't really
-        # matter for performance but it will matter as we scale to tracking more
-        # currency pairs. Once we do bulk insert, we will want to make sure we're
-        # batching the inserts as necessary to keep under the max query size.
-        await self._db.execute_many(query=query, values=values)
+        Whether the database has trade volumes that reads from this store don't include yet. Snapshots built while it's
+        behind shouldn't be cached for the tick that recorded them. Never the case when reading from the database
+        """
+        return False
+
+    async def record_trade_volumes(
+        self, records: List[CurrencyTradeVolumeRecord]
+    ) -> RecordTradeVolumesResult:
+        """
+        Store the given trade volumes
+
+        Records are written with one multi-row insert per batch, all in a single transaction so a tick is never
+        partially recorded
+        """
+        start = time.perf_counter()
+        async with self._db.transaction():
+            for offset in range(0, len(records), self._insert_batch_size):
+                batch = records[offset : offset + self._insert_batch_size]
+                values: Dict[str, Any] = {}
+                for i, record in enumerate(batch):
+                    values[f"fetch_time_{i}"] = record.time
+                    values[f"volume_{i}"] = record.volume
+                    values[f"currency_pair_id_{i}"] = self._registry.id(
+                        record.currency_pair
+                    )
+
+                await self._db.execute(_multi_row_insert_query(len(batch)), values)
+
+        result = RecordTradeVolumesResult(len(records), time.perf_counter() - start)
+        logger.info(
+            "Recorded %d trade volumes in %.3fs (%.0f rows/s)",
+            result.rows,
+            result.seconds,
+            result.rows_per_second,
+        )
+        return result
 
     async def get_currency_pair_averages(self) -> List[CurrencyPairAvg]:
         """
@@ -54,10 +151,11 @@ class CurrencyTradeVolumeStore:
         """
 
         query = """
-            SELECT currency_pair, avg(volume) as avg_volume
-            FROM currency_pair_volumes
+            SELECT pair.symbol AS currency_pair, avg(volume) as avg_volume
+            FROM currency_pair_volumes volume
+            JOIN tracked_currency_pairs pair ON pair.id = volume.currency_pair_id
             WHERE fetch_time >= NOW() - INTERVAL '1 HOUR'
-            GROUP BY currency_pair
+            GROUP BY pair.symbol
         """
 
         rows = await self._db.fetch_all(query)
@@ -68,16 +166,76 @@ class CurrencyTradeVolumeStore:
             for row in rows
         ]
 
-    async def get_currency_pair_ranks(self) -> List[CurrencyPairRank]:
+    async def get_volume_statistics(self) -> Dict[str, VolumeStatistics]:
+        """
+        Statistics of every enabled currency pair's trade volumes over the last 24 hours. Postgres aggregates the window
+        on its own, so only a row per currency pair is sent back however many samples there are
+        """
+        # The EWMA weighs every sample by how many samples old it is, like compute_volume_statistics
+        query = """
+            SELECT
+                pair.symbol AS currency_pair,
+                count(*) AS count,
+                avg(volume.volume) AS mean,
+                stddev(volume.volume) AS std_dev,
+                max(volume.volume) FILTER (WHERE volume.age = 0) AS latest,
+                sum(volume.volume * power(CAST(:decay AS double precision), volume.age))
+                    / sum(power(CAST(:decay AS double precision), volume.age)) AS ewma,
+                percentile_cont(CAST(:fraction AS double precision))
+                    WITHIN GROUP (ORDER BY volume.volume) AS percentile
+            FROM (
+                SELECT
+                    currency_pair_id,
+                    CAST(volume AS double precision) AS volume,
+                    CAST(
+                        row_number() OVER (PARTITION BY currency_pair_id ORDER BY fetch_time DESC) - 1
+                        AS double precision
+                    ) AS age
+                FROM currency_pair_volumes
+                WHERE fetch_time >= NOW() - INTERVAL '24 HOURS'
+            ) volume
+            JOIN tracked_currency_pairs pair ON pair.id = volume.currency_pair_id
+            WHERE pair.enabled
+            GROUP BY pair.symbol
+        """
+
+        rows = await self._db.fetch_all(
+            query, {"decay": 1 - EWMA_ALPHA, "fraction": SPIKE_PERCENTILE / 100}
+        )
+        return {
+            row["currency_pair"]: statistics_from_aggregates(
+                count=row["count"],
+                mean=row["mean"],
+                std_dev=row["std_dev"],
+                latest=row["latest"],
+                ewma=row["ewma"],
+                percentile=row["percentile"],
+            )
+            for row in rows
+        }
+
+    async def get_currency_pair_ranks(
+        self,
+        metric: VolumeMetric = VolumeMetric.STD_DEV,
+        statistics: Optional[Mapping[str, VolumeStatistics]] = None,
+    ) -> List[CurrencyPairRank]:
         """
-        Fetch a list of currency pair volume standard deviations over the last 24 hours
+        Fetch a list of enabled currency pair volume standard deviations over the last 24 hours
+
+        :param metric: What to rank by, every metric except STD_DEV is computed from get_volume_statistics
+        :param statistics: The result of get_volume_statistics when the caller already has it
         """
+        if metric != VolumeMetric.STD_DEV:
+            if statistics is None:
+                statistics = await self.get_volume_statistics()
+            return rank_by_metric(statistics, metric)
 
         query = """
-            SELECT currency_pair, stddev(volume) as volume_std_dev
-            FROM currency_pair_volumes
-            WHERE fetch_time >= NOW() - INTERVAL '24 HOURS'
-            GROUP BY currency_pair
+            SELECT pair.symbol AS currency_pair, stddev(volume) as volume_std_dev
+            FROM currency_pair_volumes volume
+            JOIN tracked_currency_pairs pair ON pair.id = volume.currency_pair_id
+            WHERE fetch_time >= NOW() - INTERVAL '24 HOURS' AND pair.enabled
+            GROUP BY pair.symbol
             ORDER BY
                 volume_std_dev DESC,
                 -- Sort by currency pair as well so that results are consistent even when the
@@ -85,7 +243,7 @@ class CurrencyTradeVolumeStore:
                 currency_pair DESC
         """
 
-        rows = await self._db.fetch_all(query)
+        rows = await self._reads.fetch_all(query)
         # Query sorts by std_dev, so they are in rank order, but have to add one since ranks aren't zero-indexed
         return [
             CurrencyPairRank(
@@ -96,6 +254,177 @@ class CurrencyTradeVolumeStore:
             for index, row in enumerate(rows)
         ]
 
+    async def refresh_currency_pair_ranks(
+        self,
+        metric: VolumeMetric = VolumeMetric.STD_DEV,
+        statistics: Optional[Mapping[str, VolumeStatistics]] = None,
+    ) -> None:
+        """
+        Recompute every currency pair's rank into the currency_pair_ranks table, so reads are a primary key lookup
+        instead of aggregating the last 24 hours. Ingest calls this once per tick
+
+        :param metric: What to rank by, see get_currency_pair_ranks
+        :param statistics: The result of get_volume_statistics when the caller already has it
+        """
+        if metric != VolumeMetric.STD_DEV:
+            await self._replace_currency_pair_ranks(
+                await self.get_currency_pair_ranks(metric, statistics)
+            )
+            return
+
+        query = """
+            INSERT INTO currency_pair_ranks (currency_pair_id, rank, volume_std_dev, computed_at)
+            SELECT
+                pair.id,
+                -- Same order as get_currency_pair_ranks, including the tie-break on the currency pair
+                row_number() OVER (ORDER BY stddev(volume) DESC, pair.symbol DESC),
+                stddev(volume),
+                now()
+            FROM currency_pair_volumes volume
+            JOIN tracked_currency_pairs pair ON pair.id = volume.currency_pair_id
+            WHERE fetch_time >= NOW() - INTERVAL '24 HOURS' AND pair.enabled
+            GROUP BY pair.id, pair.symbol
+        """
+
+        # Readers keep seeing the previous ranks until the new ones are committed
+        async with self._db.transaction():
+            await self._db.execute("DELETE FROM currency_pair_ranks")
+            await self._db.execute(query)
+
+    async def _replace_currency_pair_ranks(self, ranks: List[CurrencyPairRank]) -> None:
+        # Arrays instead of a bind parameter per value, so there's no limit on the number of currency pairs
+        query = """
+            INSERT INTO currency_pair_ranks (currency_pair_id, rank, volume_std_dev, computed_at)
+            SELECT currency_pair_id, rank, volume_std_dev, now()
+            FROM unnest(
+                CAST(:currency_pair_ids AS integer[]),
+                CAST(:ranks AS integer[]),
+                CAST(:volume_std_devs AS double precision[])
+            ) AS ranks(currency_pair_id, rank, volume_std_dev)
+        """
+
+        async with self._db.transaction():
+            await self._db.execute("DELETE FROM currency_pair_ranks")
+            await self._db.execute(
+                query,
+                {
+                    "currency_pair_ids": [
+                        self._registry.id(rank.currency_pair) for rank in ranks
+                    ],
+                    "ranks": [rank.rank for rank in ranks],
+                    "volume_std_devs": [rank.volume_std_dev for rank in ranks],
+                },
+            )
+
+    async def get_latest_currency_pair_ranks(self) -> List[CurrencyPairRank]:
+        """
+        Every rank stored by refresh_currency_pair_ranks, read from the primary so a refresh that was just committed is
+        always included
+        """
+        query = """
+            SELECT pair.symbol AS currency_pair, rank, volume_std_dev, computed_at
+            FROM currency_pair_ranks
+            JOIN tracked_currency_pairs pair ON pair.id = currency_pair_ranks.currency_pair_id
+            ORDER BY rank
+        """
+
+        rows = await self._db.fetch_all(query)
+        return [
+            CurrencyPairRank(
+                rank=row["rank"],
+                currency_pair=row["currency_pair"],
+                volume_std_dev=row["volume_std_dev"],
+                computed_at=row["computed_at"],
+            )
+            for row in rows
+        ]
+
+    async def get_currency_pair_rank(
+        self, currency_pair: str
+    ) -> Optional[CurrencyPairRank]:
+        """
+        Fetch the rank computed by the last refresh_currency_pair_ranks, None if the currency pair had no trade volumes
+        """
+        row = await self._reads.fetch_one(
+            """
+            SELECT rank, volume_std_dev, computed_at FROM currency_pair_ranks
+            WHERE currency_pair_id = :currency_pair_id
+            """,
+            {"currency_pair_id": self._registry.id(currency_pair)},
+        )
+        if row is None:
+            return None
+
+        return CurrencyPairRank(
+            rank=row["rank"],
+            currency_pair=currency_pair,
+            volume_std_dev=row["volume_std_dev"],
+            computed_at=row["computed_at"],
+        )
+
+    async def get_currency_pair_ranks_by_pair(
+        self, currency_pairs: Collection[str]
+    ) -> Dict[str, CurrencyPairRank]:
+        """
+        Fetch the ranks of several currency pairs in one query, currency pairs without a rank are left out
+        """
+        rows = await self._reads.fetch_all(
+            """
+            SELECT currency_pair_id, rank, volume_std_dev, computed_at
+            FROM currency_pair_ranks
+            WHERE currency_pair_id = ANY(:currency_pair_ids)
+            """,
+            {
+                "currency_pair_ids": [
+                    self._registry.id(currency_pair) for currency_pair in currency_pairs
+                ]
+            },
+        )
+
+        ranks: Dict[str, CurrencyPairRank] = {}
+        for row in rows:
+            currency_pair = self._registry.symbol(row["currency_pair_id"])
+            ranks[currency_pair] = CurrencyPairRank(
+                rank=row["rank"],
+                currency_pair=currency_pair,
+                volume_std_dev=row["volume_std_dev"],
+                computed_at=row["computed_at"],
+            )
+        return ranks
+
+    async def get_currency_pair_histories(
+        self, currency_pairs: Collection[str]
+    ) -> Dict[str, List[CurrencyTradeVolumeRecord]]:
+        """
+        Fetch the trade volumes for the past 24 hours of several currency pairs in one query
+        """
+        query = """
+            SELECT currency_pair_id, fetch_time, volume
+            FROM currency_pair_volumes
+            WHERE fetch_time >= NOW() - INTERVAL '24 hours'
+            AND currency_pair_id = ANY(:currency_pair_ids)
+        """
+
+        histories: Dict[str, List[CurrencyTradeVolumeRecord]] = {
+            currency_pair: [] for currency_pair in currency_pairs
+        }
+        rows = await self._reads.fetch_all(
+            query,
+            {
+                "currency_pair_ids": [
+                    self._registry.id(currency_pair) for currency_pair in currency_pairs
+                ]
+            },
+        )
+        for row in rows:
+            currency_pair = self._registry.symbol(row["currency_pair_id"])
+            histories[currency_pair].append(
+                CurrencyTradeVolumeRecord(
+                    row["fetch_time"], currency_pair, row["volume"]
+                )
+            )
+        return histories
+
     async def get_currency_pair_history(
         self, currency_pair: str,
     ) -> List[CurrencyTradeVolumeRecord]:
@@ -103,13 +432,36 @@ class CurrencyTradeVolumeStore:
         Fetch all of the trade volumes for the past 24 hours for the given currency pair
         """
         query = """
-            SELECT currency_pair, fetch_time, volume
+            SELECT fetch_time, volume
             FROM currency_pair_volumes
             WHERE fetch_time >= NOW() - INTERVAL '24 hours'
-            AND currency_pair = :currency_pair
+            AND currency_pair_id = :currency_pair_id
+        """
+
+        rows = await self._reads.fetch_all(
+            query, {"currency_pair_id": self._registry.id(currency_pair)}
+        )
+
+        return [
+            CurrencyTradeVolumeRecord(row["fetch_time"], currency_pair, row["volume"])
+            for row in rows
+        ]
+
+    async def get_trade_volumes_since(
+        self, since: datetime,
+    ) -> List[CurrencyTradeVolumeRecord]:
+        """
+        Fetch every trade volume recorded at or after the given time for all currency pairs, oldest first
+        """
+        query = """
+            SELECT pair.symbol AS currency_pair, fetch_time, volume
+            FROM currency_pair_volumes volume
+            JOIN tracked_currency_pairs pair ON pair.id = volume.currency_pair_id
+            WHERE fetch_time >= :since
+            ORDER BY fetch_time
         """
 
-        rows = await self._db.fetch_all(query, {"currency_pair": currency_pair})
+        rows = await self._db.fetch_all(query, {"since": since})
 
         return [
             CurrencyTradeVolumeRecord(
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from databases import Database
+from databases.core import Connection
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ConnectionBudget:
+    """
+    Splits the connections postgres allows between every process that uses the database, so adding web workers shrinks
+    each pool instead of running out of connections
+    """
+
+    max_connections: int
+    """
+    Connections the whole app may open, usually the database plan's limit
+    """
+    web_workers: int
+    ingest_processes: int = 1
+    reserved: int = 0
+    """
+    Kept free for migrations, one off scripts and psql sessions
+    """
+
+    def pool_max_size(self) -> int:
+        processes = self.web_workers + self.ingest_processes
+        available = self.max_connections - self.reserved
+        if processes < 1 or available < processes:
+            raise ValueError(
+                f"{available} connections can't be shared between {processes} processes"
+            )
+
+        return available // processes
+
+
+@dataclass
+class PoolOptions:
+    min_size: int
+    max_size: int
+    acquire_timeout_seconds: Optional[float]
+    """
+    How long a query waits for a free connection before failing, forever when None
+    """
+    statement_cache_size: int
+    """
+    Prepared statements asyncpg keeps per connection, 0 disables the cache (needed behind pgbouncer in transaction
+    mode)
+    """
+
+
+@dataclass
+class PoolMetrics:
+    in_use: int
+    max_size: int
+    acquisitions: int
+    timeouts: int
+    waiting: int
+    """
+    Queries currently waiting for a connection
+    """
+    total_wait_seconds: float
+    max_wait_seconds: float
+
+    @property
+    def avg_wait_seconds(self) -> float:
+        return self.total_wait_seconds / self.acquisitions if self.acquisitions else 0.0
+
+
+class _InstrumentedPool:
+    """
+    Wraps an asyncpg pool to time how long connections take to acquire, everything else goes to the pool as is
+    """
+
+    def __init__(self, pool: Any, acquire_timeout_seconds: Optional[float]):
+        self._pool = pool
+        self._acquire_timeout_seconds = acquire_timeout_seconds
+        self.in_use = 0
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.waiting = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    async def acquire(self) -> Any:
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            connection = await self._pool.acquire(timeout=self._acquire_timeout_seconds)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(
+                "Timed out after %.1fs waiting for a database connection",
+                time.perf_counter() - start,
+            )
+            raise
+        finally:
+            self.waiting -= 1
+
+        wait = time.perf_counter() - start
+        self.in_use += 1
+        self.acquisitions += 1
+        self.total_wait_seconds += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        return connection
+
+    async def release(self, connection: Any) -> None:
+        self.in_use -= 1
+        await self._pool.release(connection)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+
+class PooledDatabase(Database):
+    """
+    Database with an explicitly sized connection pool that keeps track of how long queries wait for connections
+    """
+
+    def __init__(self, url: str, options: PoolOptions):
+        if not 0 <= options.min_size <= options.max_size:
+            raise ValueError("min_size must be between 0 and max_size")
+
+        super().__init__(
+            url,
+            min_size=options.min_size,
+            max_size=options.max_size,
+            statement_cache_size=options.statement_cache_size,
+        )
+        self.pool_options = options
+        self._instrumented: Optional[_InstrumentedPool] = None
+
+    async def connect(self) -> None:
+        await super().connect()
+        # databases has no hook for acquiring connections, so wrap the asyncpg pool its backend created
+        backend: Any = self._backend
+        self._instrumented = _InstrumentedPool(
+            backend._pool, self.pool_options.acquire_timeout_seconds
+        )
+        backend._pool = self._instrumented
+        logger.info(
+            "Connected to the database with a pool of %d to %d connections",
+            self.pool_options.min_size,
+            self.pool_options.max_size,
+        )
+
+    async def disconnect(self) -> None:
+        await super().disconnect()
+        self._instrumented = None
+
+    def dedicated_connection(self) -> Connection:
+        """
+        A pool connection that isn't shared with the current task's queries, for connections that are held on to like
+        the one listening for notifications. database.connection() would hand back the calling task's connection
+        """
+        return Connection(self._backend)
+
+    def pool_metrics(self) -> Optional[PoolMetrics]:
+        """
+        Current state of the pool and wait times since connecting, None when not connected
+        """
+        pool = self._instrumented
+        if pool is None:
+            return None
+
+        return PoolMetrics(
+            in_use=pool.in_use,
+            max_size=self.pool_options.max_size,
+            acquisitions=pool.acquisitions,
+            timeouts=pool.timeouts,
+            waiting=pool.waiting,
+            total_wait_seconds=pool.total_wait_seconds,
+            max_wait_seconds=pool.max_wait_seconds,
+        )
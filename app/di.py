@@ -1,29 +1,154 @@
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
 
 import httpx
-from databases import Database
 from sendgrid import SendGridAPIClient
 
 from app import settings
+from app.alert_dispatcher import AlertDispatcher
+from app.alert_state import AlertStateStore, AlertStateTracker
+from app.alert_thresholds import (
+    AlertMetric,
+    AlertThresholds,
+    parse_threshold_multipliers,
+)
+from app.currency_pair_registry import CurrencyPairRegistry
 from app.currency_trade_volume_service import CurrencyTradeVolumeService
 from app.currency_trade_volume_store import CurrencyTradeVolumeStore
-from app.livecoin_api import LivecoinApi
+from app.db_pool import ConnectionBudget, PooledDatabase, PoolOptions
+from app.exchange_source import (
+    CompositeExchangeSource,
+    RegisteredSource,
+)
+from app.fetch_policy import RetryPolicy, TokenBucket
+from app.in_memory_volume_store import InMemoryTradeVolumeStore
+from app.livecoin_api import FetchStrategy, LivecoinApi
 from app.mailer import SendGridMailer, LoggingMailer, Mailer
+from app.read_router import ReadRouter
+from app.snapshot_cache import (
+    SnapshotCache,
+    InMemorySnapshotCache,
+    RedisSnapshotCache,
+    RespConnection,
+)
+from app.volume_aggregates import VolumeAggregates
+from app.volume_rollup_store import VolumeRollupStore
+from app.volume_statistics import VolumeMetric, require_numpy
+from app.volume_updates import (
+    PostgresVolumeUpdateListener,
+    PostgresVolumeUpdatePublisher,
+    VolumeUpdateHub,
+    VolumeUpdatePublisher,
+)
 
 
 # TODO: FastAPI has a real dependency injection system, we should use that
 @dataclass
 class Deps:
     currency_trade_service: CurrencyTradeVolumeService
-    database: Database
+    database: PooledDatabase
+    read_router: ReadRouter
+    snapshot_cache: Optional[SnapshotCache]
+    alert_dispatcher: AlertDispatcher
+    update_hub: VolumeUpdateHub
+    update_listener: Optional[PostgresVolumeUpdateListener]
+    rate_limiters: List[TokenBucket] = field(default_factory=list)
+    """
+    Of every exchange source, sharded ingest daemons split them between each other
+    """
+
+
+def make_snapshot_cache() -> Optional[SnapshotCache]:
+    if settings.SNAPSHOT_CACHE == "memory":
+        return InMemorySnapshotCache(
+            max_size=settings.SNAPSHOT_CACHE_MAX_SIZE,
+            ttl_seconds=settings.SNAPSHOT_CACHE_TTL_SECONDS,
+        )
+    if settings.SNAPSHOT_CACHE == "redis":
+        return RedisSnapshotCache(
+            RespConnection(
+                settings.REDIS_URL, timeout_seconds=settings.REDIS_TIMEOUT_SECONDS
+            ),
+            ttl_seconds=settings.SNAPSHOT_CACHE_TTL_SECONDS,
+        )
+    if settings.SNAPSHOT_CACHE == "none":
+        return None
+
+    raise ValueError(f"Unknown SNAPSHOT_CACHE: {settings.SNAPSHOT_CACHE}")
+
+
+def make_database(url: str) -> PooledDatabase:
+    max_size = settings.DATABASE_POOL_MAX_SIZE
+    if max_size is None:
+        max_size = ConnectionBudget(
+            max_connections=settings.DATABASE_MAX_CONNECTIONS,
+            web_workers=settings.WEB_CONCURRENCY,
+            ingest_processes=settings.INGEST_PROCESSES,
+            reserved=settings.DATABASE_RESERVED_CONNECTIONS,
+        ).pool_max_size()
+
+    return PooledDatabase(
+        url,
+        PoolOptions(
+            min_size=min(settings.DATABASE_POOL_MIN_SIZE, max_size),
+            max_size=max_size,
+            acquire_timeout_seconds=settings.DATABASE_ACQUIRE_TIMEOUT_SECONDS or None,
+            statement_cache_size=settings.DATABASE_STATEMENT_CACHE_SIZE,
+        ),
+    )
+
+
+def make_livecoin_source(client: httpx.AsyncClient) -> RegisteredSource:
+    rate_limiter = TokenBucket(
+        settings.LIVECOIN_RATE_LIMIT_PER_SECOND,
+        capacity=settings.LIVECOIN_RATE_LIMIT_BURST,
+    )
+    return RegisteredSource(
+        LivecoinApi(
+            client,
+            streaming=settings.STREAM_TICKER_RESPONSE,
+            base_url=settings.LIVECOIN_BASE_URL,
+            rate_limiter=rate_limiter,
+            retry_policy=RetryPolicy(max_attempts=settings.LIVECOIN_MAX_ATTEMPTS),
+            strategy=FetchStrategy(settings.LIVECOIN_FETCH_STRATEGY),
+            max_per_symbol_seconds=settings.LIVECOIN_MAX_PER_SYMBOL_SECONDS,
+        ),
+        timeout_seconds=settings.LIVECOIN_TIMEOUT_SECONDS,
+        rate_limiter=rate_limiter,
+    )
+
+
+# Register new exchange adapters here to make them available to EXCHANGE_SOURCES
+_EXCHANGE_SOURCE_FACTORIES: Dict[
+    str, Callable[[httpx.AsyncClient], RegisteredSource]
+] = {
+    "livecoin": make_livecoin_source,
+}
+
+
+def make_exchange_sources(client: httpx.AsyncClient) -> List[RegisteredSource]:
+    sources: List[RegisteredSource] = []
+    for name in settings.EXCHANGE_SOURCES:
+        if name not in _EXCHANGE_SOURCE_FACTORIES:
+            raise ValueError(f"Unknown exchange source in EXCHANGE_SOURCES: {name}")
+        sources.append(_EXCHANGE_SOURCE_FACTORIES[name](client))
+
+    return sources
 
 
 def make_deps(client: httpx.AsyncClient) -> Deps:
     """
     Create all the dependencies needed to run the app
     """
-    database = Database(settings.DATABASE_URL)
+    database = make_database(settings.DATABASE_URL)
+    read_router = ReadRouter(
+        database,
+        [make_database(url) for url in settings.DATABASE_REPLICA_URLS],
+        max_lag=timedelta(seconds=settings.REPLICA_MAX_LAG_SECONDS),
+        health_check_seconds=settings.REPLICA_HEALTH_CHECK_SECONDS,
+    )
 
     # Declare type ahead of time to tell mypy it's the generic type
     mailer: Mailer
@@ -32,11 +157,89 @@ def make_deps(client: httpx.AsyncClient) -> Deps:
     else:
         mailer = LoggingMailer(logging.getLogger("Mail"))
 
+    snapshot_cache = make_snapshot_cache()
+    registry = CurrencyPairRegistry(
+        database, refresh_seconds=settings.CURRENCY_PAIR_REFRESH_SECONDS
+    )
+    # Has to be started from inside the event loop, see AlertDispatcher.start
+    alert_dispatcher = AlertDispatcher(
+        mailer,
+        concurrency=settings.MAIL_CONCURRENCY,
+        max_attempts=settings.MAIL_MAX_ATTEMPTS,
+    )
+    update_hub = VolumeUpdateHub(max_queued=settings.LIVE_UPDATES_MAX_QUEUED)
+    # With NOTIFY the tick comes back to this process' hub through the listener too
+    update_publisher: VolumeUpdatePublisher = (
+        PostgresVolumeUpdatePublisher(database)
+        if settings.LIVE_UPDATES_NOTIFY
+        else update_hub
+    )
+
+    alert_metric = AlertMetric(settings.ALERT_METRIC)
+    rank_metric = VolumeMetric(settings.RANK_METRIC)
+    if settings.USE_IN_MEMORY_HISTORY and (
+        alert_metric != AlertMetric.AVERAGE or rank_metric != VolumeMetric.STD_DEV
+    ):
+        # Postgres computes the statistics itself, the in-memory store needs numpy. Fail on startup rather than on the
+        # first tick
+        require_numpy()
+
+    exchange_sources = make_exchange_sources(client)
+    store_class = (
+        InMemoryTradeVolumeStore
+        if settings.USE_IN_MEMORY_HISTORY
+        else CurrencyTradeVolumeStore
+    )
+
     service = CurrencyTradeVolumeService(
-        store=CurrencyTradeVolumeStore(database),
-        api=LivecoinApi(client),
+        store=store_class(
+            database,
+            registry,
+            insert_batch_size=settings.INSERT_BATCH_SIZE,
+            reads=read_router,
+        ),
+        api=CompositeExchangeSource(exchange_sources),
         mailer=mailer,
         notify_emails=settings.NOTIFY_EMAILS,
+        aggregates=VolumeAggregates() if settings.USE_VOLUME_AGGREGATES else None,
+        snapshot_cache=snapshot_cache,
+        rollup_store=VolumeRollupStore(database, registry, reads=read_router),
+        alert_dispatcher=alert_dispatcher,
+        alert_tracker=AlertStateTracker(
+            cooldown=timedelta(minutes=settings.ALERT_COOLDOWN_MINUTES),
+            rearm_ratio=settings.ALERT_REARM_RATIO,
+            store=AlertStateStore(database),
+        ),
+        alert_thresholds=AlertThresholds(
+            default_multiplier=settings.ALERT_THRESHOLD_MULTIPLIER,
+            multipliers=parse_threshold_multipliers(
+                settings.ALERT_THRESHOLD_MULTIPLIERS
+            ),
+            metric=alert_metric,
+        ),
+        registry=registry,
+        update_publisher=update_publisher,
+        rank_metric=rank_metric,
+        reads=read_router,
+    )
+    # Has to be started from inside the event loop, see PostgresVolumeUpdateListener.start
+    update_listener = (
+        PostgresVolumeUpdateListener(database, update_hub, service.load_volume_tick)
+        if settings.LIVE_UPDATES_NOTIFY
+        else None
     )
 
-    return Deps(service, database)
+    return Deps(
+        service,
+        database,
+        read_router,
+        snapshot_cache,
+        alert_dispatcher,
+        update_hub,
+        update_listener,
+        [
+            source.rate_limiter
+            for source in exchange_sources
+            if source.rate_limiter is not None
+        ],
+    )
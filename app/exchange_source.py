@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AbstractSet, Dict, List, Optional
+
+from app.fetch_policy import TokenBucket
+from app.types import CurrencyTradeVolumeRecord
+
+logger = logging.getLogger(__name__)
+
+
+class ApiUnavailableException(Exception):
+    pass
+
+
+class ExchangeSource(ABC):
+    """
+    Somewhere trade volumes can be fetched from, usually an exchange's API
+    """
+
+    name = "exchange"
+
+    @abstractmethod
+    async def fetch_trade_volumes(
+        self, currency_pairs: AbstractSet[str]
+    ) -> List[CurrencyTradeVolumeRecord]:
+        """
+        Fetch the current trade volume of as many of the given currency pairs as the source has
+
+        :raises ApiUnavailableException: If the source couldn't be reached
+        """
+        ...
+
+
+@dataclass
+class RegisteredSource:
+    source: ExchangeSource
+    timeout_seconds: float
+    rate_limiter: Optional[TokenBucket] = None
+    """
+    What the source's requests wait on, sharded ingest daemons split its rate between them
+    """
+
+
+class CompositeExchangeSource(ExchangeSource):
+    """
+    Fetches from several sources at once and merges their trade volumes into a single batch
+
+    Sources are fetched concurrently, so a tick takes as long as the slowest source instead of all of them added up. A
+    source that fails or runs past its timeout is left out of the batch without failing the others. When more than one
+    source has the same currency pair, the one registered first wins
+    """
+
+    name = "composite"
+
+    def __init__(self, sources: List[RegisteredSource]):
+        self._sources = sources
+
+    async def _fetch(
+        self, registered: RegisteredSource, currency_pairs: AbstractSet[str]
+    ) -> List[CurrencyTradeVolumeRecord]:
+        start = time.perf_counter()
+        records = await asyncio.wait_for(
+            registered.source.fetch_trade_volumes(currency_pairs),
+            timeout=registered.timeout_seconds,
+        )
+        logger.debug(
+            "Fetched %d trade volumes from %s in %.3fs",
+            len(records),
+            registered.source.name,
+            time.perf_counter() - start,
+        )
+        return records
+
+    async def fetch_trade_volumes(
+        self, currency_pairs: AbstractSet[str]
+    ) -> List[CurrencyTradeVolumeRecord]:
+        results = await asyncio.gather(
+            *(self._fetch(registered, currency_pairs) for registered in self._sources),
+            return_exceptions=True,
+        )
+
+        merged: Dict[str, CurrencyTradeVolumeRecord] = {}
+        failures = 0
+        for registered, result in zip(self._sources, results):
+            if isinstance(result, BaseException):
+                if not isinstance(result, Exception):
+                    raise result
+                failures += 1
+                logger.error(
+                    "Failed to fetch trade volumes from %s",
+                    registered.source.name,
+                    exc_info=result,
+                )
+                continue
+
+            for record in result:
+                merged.setdefault(record.currency_pair, record)
+
+        if self._sources and failures == len(self._sources):
+            raise ApiUnavailableException()
+
+        return list(merged.values())
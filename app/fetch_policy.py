@@ -0,0 +1,107 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+Sleep = Callable[[float], Awaitable[None]]
+
+
+class TokenBucket:
+    """
+    Rate limiter that allows bursts of up to capacity calls, refilling at rate_per_second
+
+    Share one bucket between everything that calls the same API so they stay under its limit together. Waiters are
+    served in the order they arrived
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float,
+        capacity: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Sleep = asyncio.sleep,
+    ):
+        if rate_per_second <= 0 or capacity < 1:
+            raise ValueError("rate_per_second must be positive and capacity at least 1")
+
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._full_rate_per_second = rate_per_second
+        self._full_capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(capacity)
+        self._updated_at = clock()
+        # Created on first use so it belongs to the running event loop
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated_at) * self.rate_per_second,
+        )
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        """
+        Wait until a call is allowed and use it up
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await self._sleep((1 - self._tokens) / self.rate_per_second)
+                self._refill()
+            self._tokens -= 1
+
+    def share(self, processes: int) -> None:
+        """
+        Split the limit evenly between this many processes that each have a bucket for the same API, so they stay
+        under it together. Every process can still burst at least one call
+        """
+        self._refill()
+        processes = max(processes, 1)
+        self.rate_per_second = self._full_rate_per_second / processes
+        self.capacity = max(1, self._full_capacity // processes)
+        self._tokens = min(self._tokens, self.capacity)
+
+    def seconds_to_acquire(self, calls: int) -> float:
+        """
+        How long it would take for the given number of calls to all be allowed, starting from a full bucket
+        """
+        return max(0, calls - self.capacity) / self.rate_per_second
+
+
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 1
+    base_backoff_seconds: float = 1.0
+    max_backoff_seconds: float = 30.0
+
+    def backoff_seconds(
+        self, attempt: int, retry_after_seconds: Optional[float] = None
+    ) -> float:
+        """
+        How long to wait after the given attempt failed
+
+        Full jitter keeps processes that failed together from retrying in lockstep, but never retry sooner than the
+        server asked us to
+        """
+        backoff = random.uniform(
+            0,
+            min(
+                self.max_backoff_seconds,
+                self.base_backoff_seconds * 2 ** (attempt - 1),
+            ),
+        )
+        if retry_after_seconds is not None:
+            backoff = max(backoff, min(retry_after_seconds, self.max_backoff_seconds))
+
+        return backoff
@@ -0,0 +1,201 @@
+import gzip
+import json
+import struct
+import sys
+from array import array
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, List, Optional, Sequence, TypeVar, Union
+
+from app.types import CurrencyPairSnapshot, VolumeRollupRecord
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+Number = TypeVar("Number", int, float, Decimal)
+
+BINARY_MAGIC = b"CTVH"
+BINARY_VERSION = 1
+BINARY_MEDIA_TYPE = "application/vnd.cryptotracker.history"
+# Compressing a handful of points costs more than it saves
+MIN_COMPRESS_BYTES = 512
+
+
+class HistoryFormat(str, Enum):
+    JSON = "json"
+    """
+    A list of point objects, see HistoryApiResponse
+    """
+    COLUMNAR = "columnar"
+    """
+    JSON with one array per column, times are epoch milliseconds
+    """
+    BINARY = "binary"
+    """
+    Same columns as COLUMNAR packed as little endian arrays, see encode_binary_history
+    """
+
+
+def _columns(snapshot: CurrencyPairSnapshot) -> Dict[str, List[Any]]:
+    history = snapshot.history
+    columns: Dict[str, List[Any]] = {
+        "time": [int(record.time.timestamp() * 1000) for record in history],
+        "volume": [record.volume for record in history],
+    }
+    if history and all(isinstance(record, VolumeRollupRecord) for record in history):
+        rollups = [
+            record for record in history if isinstance(record, VolumeRollupRecord)
+        ]
+        columns["min_volume"] = [record.min_volume for record in rollups]
+        columns["max_volume"] = [record.max_volume for record in rollups]
+        columns["last_volume"] = [record.last_volume for record in rollups]
+
+    return columns
+
+
+def delta_encode(values: Sequence[Number]) -> List[Number]:
+    """
+    Keep the first value and replace the rest with the difference to the value before them. Samples are evenly spaced
+    and volumes change slowly, so the differences are small numbers that compress well
+    """
+    return [
+        value - values[index - 1] if index else value
+        for index, value in enumerate(values)
+    ]
+
+
+def delta_decode(deltas: Sequence[Number]) -> List[Number]:
+    values: List[Number] = []
+    for delta in deltas:
+        values.append(values[-1] + delta if values else delta)
+    return values
+
+
+def _json_number(value: Union[int, float, Decimal]) -> Union[int, float]:
+    # Volumes come out of postgres as Decimal, whole ones are written without a fraction to save space
+    if isinstance(value, int):
+        return value
+    if value == int(value):
+        return int(value)
+    return float(value)
+
+
+def _metadata(snapshot: CurrencyPairSnapshot) -> Dict[str, Any]:
+    return {
+        "currency_pair": snapshot.currency_pair,
+        "rank": snapshot.rank,
+        "total_tracked_currency_pairs": snapshot.total_tracked_currency_pairs,
+        "resolution": snapshot.resolution.value,
+    }
+
+
+def columnar_history(
+    snapshot: CurrencyPairSnapshot, delta: bool = False
+) -> Dict[str, Any]:
+    """
+    Snapshot with its history as one array per column instead of an object per point
+
+    :param delta: Delta encode every column, see delta_encode
+    """
+    columns = _columns(snapshot)
+    return {
+        **_metadata(snapshot),
+        "delta": delta,
+        "columns": {
+            name: [
+                _json_number(value)
+                for value in (delta_encode(values) if delta else values)
+            ]
+            for name, values in columns.items()
+        },
+    }
+
+
+def encode_columnar_history(
+    snapshot: CurrencyPairSnapshot, delta: bool = False
+) -> bytes:
+    return json.dumps(columnar_history(snapshot, delta), separators=(",", ":")).encode()
+
+
+def encode_binary_history(snapshot: CurrencyPairSnapshot, delta: bool = False) -> bytes:
+    """
+    Pack the snapshot as:
+
+    - 4 bytes of magic, "CTVH", and a uint8 version
+    - uint32 length of the JSON metadata that follows, the columnar_history fields except columns plus the column
+      names and point count
+    - the columns in order, time as int64 and everything else as float64, all little endian
+    """
+    columns = _columns(snapshot)
+    metadata = {
+        **_metadata(snapshot),
+        "delta": delta,
+        "columns": list(columns),
+        "points": len(snapshot.history),
+    }
+    metadata_bytes = json.dumps(metadata, separators=(",", ":")).encode()
+
+    parts = [
+        BINARY_MAGIC,
+        struct.pack("<BI", BINARY_VERSION, len(metadata_bytes)),
+        metadata_bytes,
+    ]
+    for name, values in columns.items():
+        if delta:
+            values = delta_encode(values)
+        packed = (
+            array("q", [int(value) for value in values])
+            if name == "time"
+            else array("d", [float(value) for value in values])
+        )
+        if sys.byteorder == "big":
+            packed.byteswap()
+        parts.append(packed.tobytes())
+
+    return b"".join(parts)
+
+
+def supported_content_encodings() -> List[str]:
+    """
+    Content encodings that can be produced, in order of preference
+    """
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate_content_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the best supported content encoding from an Accept-Encoding header, None to send the body uncompressed
+    """
+    if not accept_encoding:
+        return None
+
+    quality: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        quality[name.strip().lower()] = q
+
+    best: Optional[str] = None
+    for encoding in supported_content_encodings():
+        q = quality.get(encoding, quality.get("*", 0.0))
+        if q > 0 and (best is None or q > quality.get(best, quality.get("*", 0.0))):
+            best = encoding
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br" and brotli is not None:
+        compressed: bytes = brotli.compress(body, quality=5)
+        return compressed
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+
+    raise ValueError(f"Unsupported content encoding: {encoding}")
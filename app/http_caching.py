@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Mapping
+
+
+def make_etag(updated_at: datetime) -> str:
+    """
+    Weak ETag for data last changed at updated_at. Weak because the same data is served in several encodings
+    """
+    return f'W/"{int(updated_at.timestamp() * 1_000_000)}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, so the W/ prefix doesn't matter on either side
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def is_not_modified(headers: Mapping[str, str], updated_at: datetime) -> bool:
+    """
+    Whether a conditional GET with the given request headers can be answered with 304 Not Modified
+
+    If-None-Match takes precedence over If-Modified-Since when both are sent, as RFC 7232 requires
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, make_etag(updated_at))
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            return False
+        # HTTP dates only have whole seconds
+        return updated_at.replace(microsecond=0) <= since
+
+    return False
+
+
+def cache_headers(
+    updated_at: datetime, interval_seconds: float, now: datetime
+) -> Dict[str, str]:
+    """
+    Validators for data that changes once per ingest tick, cacheable until the next tick is expected to finish
+
+    Once a tick is overdue max-age is 0, so clients and CDNs revalidate on every request, which is cheap with a 304
+    """
+    next_update = updated_at + timedelta(seconds=interval_seconds)
+    max_age = max(0, int((next_update - now).total_seconds()))
+    return {
+        "ETag": make_etag(updated_at),
+        "Last-Modified": format_datetime(
+            updated_at.astimezone(timezone.utc), usegmt=True
+        ),
+        "Cache-Control": f"public, max-age={max_age}",
+    }
+
+
+def conditional_headers_present(headers: Mapping[str, str]) -> bool:
+    return "if-none-match" in headers or "if-modified-since" in headers
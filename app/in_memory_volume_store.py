@@ -0,0 +1,330 @@
+import logging
+import math
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Collection, Dict, List, Mapping, Optional, Tuple
+
+from databases import Database
+
+from app.currency_pair_registry import CurrencyPairRegistry
+from app.currency_trade_volume_store import (
+    DEFAULT_INSERT_BATCH_SIZE,
+    CurrencyPairAvg,
+    CurrencyPairRank,
+    CurrencyTradeVolumeStore,
+    RecordTradeVolumesResult,
+    rank_by_metric,
+)
+from app.read_router import ReadRouter
+from app.types import CurrencyTradeVolumeRecord
+from app.volume_aggregates import AVERAGE_WINDOW, RANK_WINDOW, rank_by_std_dev
+from app.volume_statistics import (
+    VolumeMetric,
+    VolumeStatistics,
+    compute_volume_statistics,
+    numpy_available,
+)
+
+logger = logging.getLogger(__name__)
+
+HISTORY_WINDOW = timedelta(hours=24)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_micros(time: datetime) -> int:
+    # Integer arithmetic on the timedelta, timestamp() would round through a float
+    return (time - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=micros)
+
+
+class VolumeRingBuffer:
+    """
+    The samples of one currency pair over a sliding window of time, as epoch microseconds in an int64 array and volumes
+    in a float64 array. That's 16 bytes per sample, instead of a dataclass with a datetime, a str and a Decimal
+
+    Appending overwrites samples that have fallen out of the window, the arrays only grow when every sample is still
+    inside it. Samples have to be appended in time order
+    """
+
+    def __init__(self, window: timedelta, capacity: int = 64):
+        self._window_micros = window // _MICROSECOND
+        self._times = array("q", [0]) * capacity
+        self._volumes = array("d", [0.0]) * capacity
+        # Index of the oldest sample, the rest follow it and wrap around the end of the arrays
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._times)
+
+    @property
+    def latest_micros(self) -> Optional[int]:
+        if not self._size:
+            return None
+        return self._times[(self._start + self._size - 1) % self.capacity]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes allocated for samples, including free space
+        """
+        return self.capacity * (self._times.itemsize + self._volumes.itemsize)
+
+    def _time_at(self, index: int) -> int:
+        return self._times[(self._start + index) % self.capacity]
+
+    def append(self, micros: int, volume: float) -> bool:
+        """
+        :return: False if the sample isn't newer than the latest one and was skipped
+        """
+        latest = self.latest_micros
+        if latest is not None and micros <= latest:
+            return False
+
+        window_start = micros - self._window_micros
+        while self._size and self._times[self._start] < window_start:
+            self._start = (self._start + 1) % self.capacity
+            self._size -= 1
+        if self._size == self.capacity:
+            self._grow()
+
+        end = (self._start + self._size) % self.capacity
+        self._times[end] = micros
+        self._volumes[end] = volume
+        self._size += 1
+        return True
+
+    def _grow(self) -> None:
+        times, volumes = self._ordered(0)
+        capacity = self.capacity * 2
+        self._times = times + array("q", [0]) * (capacity - len(times))
+        self._volumes = volumes + array("d", [0.0]) * (capacity - len(volumes))
+        self._start = 0
+
+    def _ordered(self, first: int) -> Tuple["array[int]", "array[float]"]:
+        # The samples from the first'th oldest on, oldest first, sliced out of at most two runs of the arrays
+        begin = (self._start + first) % self.capacity
+        count = self._size - first
+        end = begin + count
+        if end <= self.capacity:
+            return self._times[begin:end], self._volumes[begin:end]
+
+        wrapped = end - self.capacity
+        return (
+            self._times[begin:] + self._times[:wrapped],
+            self._volumes[begin:] + self._volumes[:wrapped],
+        )
+
+    def since(self, micros: int) -> Tuple["array[int]", "array[float]"]:
+        """
+        Times and volumes of the samples at or after the given time, oldest first
+        """
+        # Binary search over the logical order, the buffer is sorted from _start around to the newest sample
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            if self._time_at(middle) < micros:
+                low = middle + 1
+            else:
+                high = middle
+        return self._ordered(low)
+
+
+class InMemoryTradeVolumeStore(CurrencyTradeVolumeStore):
+    """
+    CurrencyTradeVolumeStore that keeps the last 24 hours of every currency pair in memory, see VolumeRingBuffer
+
+    Trade volumes are still written to the database, and histories, averages, statistics and ranks are computed from
+    memory, including the ranks written to the ranks table. get_trade_volumes_since stays in the database since it has
+    to include what other processes recorded. Trade volumes read through get_trade_volumes_since are added to memory too, so a web process
+    listening for ticks recorded by another process stays current. Has to be loaded on startup
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        registry: CurrencyPairRegistry,
+        insert_batch_size: int = DEFAULT_INSERT_BATCH_SIZE,
+        reads: Optional[ReadRouter] = None,
+        window: timedelta = HISTORY_WINDOW,
+    ):
+        super().__init__(db, registry, insert_batch_size, reads)
+        self._window = max(window, AVERAGE_WINDOW, RANK_WINDOW)
+        self._buffers: Dict[str, VolumeRingBuffer] = {}
+        # Of the newest sample in any buffer
+        self._latest_micros: Optional[int] = None
+
+    async def load(self) -> None:
+        query = """
+            SELECT currency_pair_id, fetch_time, volume
+            FROM currency_pair_volumes
+            WHERE fetch_time >= NOW() - CAST(:window AS interval)
+            ORDER BY fetch_time
+        """
+
+        rows = await self._db.fetch_all(query, {"window": self._window})
+        self._buffers = {}
+        self._latest_micros = None
+        for row in rows:
+            self._append(
+                self._registry.symbol(row["currency_pair_id"]),
+                row["fetch_time"],
+                row["volume"],
+            )
+        logger.info(
+            "Loaded %d trade volumes of %d currency pairs into %d bytes of memory",
+            self.sample_count(),
+            len(self._buffers),
+            self.memory_bytes(),
+        )
+
+    def _append(self, currency_pair: str, time: datetime, volume: float) -> None:
+        buffer = self._buffers.get(currency_pair)
+        if buffer is None:
+            buffer = self._buffers[currency_pair] = VolumeRingBuffer(self._window)
+        micros = _to_micros(time)
+        # Volumes come out of postgres as Decimal
+        buffer.append(micros, float(volume))
+        if self._latest_micros is None or micros > self._latest_micros:
+            self._latest_micros = micros
+
+    def _extend(self, records: List[CurrencyTradeVolumeRecord]) -> None:
+        for record in sorted(records, key=lambda record: record.time):
+            self._append(record.currency_pair, record.time, record.volume)
+
+    def sample_count(self) -> int:
+        return sum(len(buffer) for buffer in self._buffers.values())
+
+    def memory_bytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def _since(
+        self, currency_pair: str, window: timedelta
+    ) -> Tuple["array[int]", "array[float]"]:
+        buffer = self._buffers.get(currency_pair)
+        if buffer is None:
+            return array("q"), array("d")
+        return buffer.since(_to_micros(datetime.now(timezone.utc) - window))
+
+    async def is_behind(self) -> bool:
+        """
+        True while another process has recorded trade volumes that haven't been loaded through get_trade_volumes_since
+        yet. The snapshot cache is invalidated before the tick reaches listening web processes
+        """
+        since = (
+            _from_micros(self._latest_micros)
+            if self._latest_micros is not None
+            else datetime.now(timezone.utc) - self._window
+        )
+        query = """
+            SELECT EXISTS (SELECT 1 FROM currency_pair_volumes WHERE fetch_time > :since)
+        """
+
+        newer: bool = await self._db.fetch_val(query, {"since": since})
+        return newer
+
+    async def record_trade_volumes(
+        self, records: List[CurrencyTradeVolumeRecord]
+    ) -> RecordTradeVolumesResult:
+        result = await super().record_trade_volumes(records)
+        # Only once they're committed, so memory never has samples the database doesn't
+        self._extend(records)
+        return result
+
+    async def get_trade_volumes_since(
+        self, since: datetime,
+    ) -> List[CurrencyTradeVolumeRecord]:
+        records = await super().get_trade_volumes_since(since)
+        self._extend(records)
+        return records
+
+    async def get_currency_pair_averages(self) -> List[CurrencyPairAvg]:
+        averages: List[CurrencyPairAvg] = []
+        for currency_pair in self._buffers:
+            _, volumes = self._since(currency_pair, AVERAGE_WINDOW)
+            if volumes:
+                averages.append(
+                    CurrencyPairAvg(currency_pair, math.fsum(volumes) / len(volumes))
+                )
+        return averages
+
+    async def get_volume_statistics(self) -> Dict[str, VolumeStatistics]:
+        return compute_volume_statistics(
+            {
+                currency_pair: self._since(currency_pair, RANK_WINDOW)[1]
+                for currency_pair in self._buffers
+                if currency_pair in self._registry
+            }
+        )
+
+    async def get_currency_pair_ranks(
+        self,
+        metric: VolumeMetric = VolumeMetric.STD_DEV,
+        statistics: Optional[Mapping[str, VolumeStatistics]] = None,
+    ) -> List[CurrencyPairRank]:
+        if statistics is not None:
+            return rank_by_metric(statistics, metric)
+        if metric != VolumeMetric.STD_DEV or numpy_available():
+            return rank_by_metric(await self.get_volume_statistics(), metric)
+
+        std_devs: List[Tuple[str, Optional[float]]] = []
+        for currency_pair in self._buffers:
+            # Like the database store, disabled currency pairs aren't ranked
+            if currency_pair not in self._registry:
+                continue
+            _, volumes = self._since(currency_pair, RANK_WINDOW)
+            if not volumes:
+                continue
+            if len(volumes) < 2:
+                std_devs.append((currency_pair, None))
+                continue
+
+            # Two passes, so the result doesn't lose precision when volumes are large and close together
+            mean = math.fsum(volumes) / len(volumes)
+            variance = math.fsum((volume - mean) ** 2 for volume in volumes) / (
+                len(volumes) - 1
+            )
+            std_devs.append((currency_pair, math.sqrt(variance)))
+
+        return rank_by_std_dev(std_devs)
+
+    async def refresh_currency_pair_ranks(
+        self,
+        metric: VolumeMetric = VolumeMetric.STD_DEV,
+        statistics: Optional[Mapping[str, VolumeStatistics]] = None,
+    ) -> None:
+        # Postgres only stores the result
+        await self._replace_currency_pair_ranks(
+            await self.get_currency_pair_ranks(metric, statistics)
+        )
+
+    def _history(self, currency_pair: str) -> List[CurrencyTradeVolumeRecord]:
+        times, volumes = self._since(currency_pair, HISTORY_WINDOW)
+        return [
+            CurrencyTradeVolumeRecord(_from_micros(micros), currency_pair, volume)
+            for micros, volume in zip(times, volumes)
+        ]
+
+    async def get_currency_pair_history(
+        self, currency_pair: str,
+    ) -> List[CurrencyTradeVolumeRecord]:
+        # Raises for currency pairs that aren't tracked, like the database store
+        self._registry.id(currency_pair)
+        return self._history(currency_pair)
+
+    async def get_currency_pair_histories(
+        self, currency_pairs: Collection[str]
+    ) -> Dict[str, List[CurrencyTradeVolumeRecord]]:
+        return {
+            currency_pair: self._history(currency_pair)
+            for currency_pair in currency_pairs
+        }
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TickTiming:
+    tick: int
+    """
+    Number of intervals between the scheduler starting and when this run was scheduled
+    """
+    lag_seconds: float
+    """
+    How late the run started compared to when it was scheduled
+    """
+    duration_seconds: float
+    skipped_ticks: int
+    """
+    Ticks dropped since the previous run because it took longer than the interval
+    """
+    succeeded: bool
+
+
+class IngestScheduler:
+    """
+    Runs a job at a fixed interval for as long as the process lives
+
+    Ticks are scheduled relative to when the scheduler started instead of when the previous run finished, so run time
+    doesn't make the schedule drift. Runs never overlap: when a run overruns its interval the most recent missed tick
+    starts as soon as it finishes and any older missed ticks are skipped
+
+    With align_to_clock ticks fall on multiples of the interval since the clock's epoch, so processes on different
+    machines using time.time run the same tick at the same time
+    """
+
+    def __init__(
+        self,
+        job: Callable[[], Awaitable[None]],
+        interval_seconds: float,
+        on_tick: Optional[Callable[[TickTiming], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        align_to_clock: bool = False,
+    ):
+        if interval_seconds <= 0:
+            raise ValueError("interval_seconds must be positive")
+
+        self._job = job
+        self._interval_seconds = interval_seconds
+        self._on_tick = on_tick
+        self._clock = clock
+        self._align_to_clock = align_to_clock
+        self._stopped = asyncio.Event()
+        self.last_timing: Optional[TickTiming] = None
+        self.scheduled_at: Optional[float] = None
+        """
+        Clock time the current run was scheduled for
+        """
+
+    def stop(self) -> None:
+        """
+        Stop scheduling new runs, a run that's in progress is allowed to finish
+        """
+        self._stopped.set()
+
+    async def run(self) -> None:
+        start = self._clock()
+        if self._align_to_clock:
+            start = math.ceil(start / self._interval_seconds) * self._interval_seconds
+        tick = 0
+        last_tick = -1
+        while not self._stopped.is_set():
+            scheduled = start + tick * self._interval_seconds
+            delay = scheduled - self._clock()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=delay)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+
+            self.scheduled_at = scheduled
+            run_start = self._clock()
+            succeeded = True
+            try:
+                await self._job()
+            except Exception:
+                # One failed run shouldn't take the whole worker down, the next tick will try again
+                logger.exception("Ingest run failed")
+                succeeded = False
+            run_end = self._clock()
+
+            self.last_timing = TickTiming(
+                tick=tick,
+                lag_seconds=run_start - scheduled,
+                duration_seconds=run_end - run_start,
+                skipped_ticks=tick - last_tick - 1,
+                succeeded=succeeded,
+            )
+            logger.info("Ingest tick finished: %s", self.last_timing)
+            if self._on_tick is not None:
+                self._on_tick(self.last_timing)
+
+            last_tick = tick
+            tick = max(tick + 1, int((run_end - start) // self._interval_seconds))
@@ -0,0 +1,216 @@
+import logging
+import math
+import os
+import socket
+import uuid
+from datetime import timedelta
+from typing import List, Optional
+
+from databases import Database
+
+logger = logging.getLogger(__name__)
+
+# Ticks are only needed until they've been finalized, keep about a day's worth at one minute intervals
+_TICK_HISTORY = 1440
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class ShardCoordinator:
+    """
+    Splits ingest between worker processes, which can be on any number of machines sharing a database
+
+    Currency pairs are spread over a fixed number of shards, and every tick each worker leases an even share of them
+    from the ingest_shard_leases table. Shards are rebalanced as workers come and go: a worker that stops renewing its
+    leases loses its shards once they expire, and workers over their share hand shards back when a new one joins. They
+    still ingest those shards for the tick they notice the new worker in, since it may have already looked for free
+    shards, and hand them back once they're done so the new worker can claim them on the next tick
+
+    Each worker records the shards it finished in the tick's ingest_ticks row. Once every shard is in, exactly one
+    worker is told to finalize the tick and compute what needs all of the tick's trade volumes. Shards whose worker
+    stopped stay leased until their leases expire, so ticks that are still missing shards once finalize_deadline_ticks
+    later ticks have started are finalized with whatever shards are in
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        worker_id: str,
+        shard_count: int,
+        lease_duration: timedelta,
+        finalize_deadline_ticks: int = 1,
+    ):
+        """
+        :param lease_duration: How long a worker keeps its shards without renewing them, must be longer than the ingest
+        interval
+        :param finalize_deadline_ticks: How many ticks later an incomplete tick is finalized anyway
+        """
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1")
+        if finalize_deadline_ticks < 1:
+            raise ValueError("finalize_deadline_ticks must be at least 1")
+
+        self._db = db
+        self._worker_id = worker_id
+        self.shard_count = shard_count
+        self._lease_duration = lease_duration
+        self._finalize_deadline_ticks = finalize_deadline_ticks
+        # Shards over this worker's share, ingested once more and then handed back by complete_shards
+        self._handing_back: List[int] = []
+        self.live_workers = 1
+        """
+        Workers with a live heartbeat as of the last acquire_shards, this one included
+        """
+
+    async def acquire_shards(self) -> List[int]:
+        """
+        Renew this worker's leases and rebalance, returning the shards it should ingest this tick. Shards over its share
+        are included one last time, complete_shards hands them back
+        """
+        values = {"worker_id": self._worker_id, "lease": self._lease_duration}
+        async with self._db.transaction():
+            await self._db.execute(
+                """
+                INSERT INTO ingest_workers (worker_id, heartbeat_at) VALUES (:worker_id, now())
+                ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = now()
+                """,
+                {"worker_id": self._worker_id},
+            )
+            await self._db.execute(
+                "DELETE FROM ingest_workers WHERE heartbeat_at <= now() - CAST(:lease AS interval)",
+                {"lease": self._lease_duration},
+            )
+            self.live_workers = max(
+                int(await self._db.fetch_val("SELECT count(*) FROM ingest_workers")), 1
+            )
+            share = math.ceil(self.shard_count / self.live_workers)
+
+            rows = await self._db.fetch_all(
+                """
+                UPDATE ingest_shard_leases SET expires_at = now() + CAST(:lease AS interval)
+                WHERE worker_id = :worker_id
+                RETURNING shard
+                """,
+                values,
+            )
+            shards = sorted(
+                row["shard"] for row in rows if row["shard"] < self.shard_count
+            )
+
+            self._handing_back = shards[share:]
+            if len(shards) < share:
+                # Shards another worker is holding are skipped, a racing worker that claims the same free shard first
+                # wins because the lease it just wrote hasn't expired
+                rows = await self._db.fetch_all(
+                    """
+                    INSERT INTO ingest_shard_leases (shard, worker_id, expires_at)
+                    SELECT candidate.shard, :worker_id, now() + CAST(:lease AS interval)
+                    FROM generate_series(0, :shard_count - 1) AS candidate(shard)
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM ingest_shard_leases lease
+                        WHERE lease.shard = candidate.shard AND lease.expires_at > now()
+                    )
+                    ORDER BY candidate.shard
+                    LIMIT :wanted
+                    ON CONFLICT (shard) DO UPDATE SET
+                        worker_id = EXCLUDED.worker_id,
+                        expires_at = EXCLUDED.expires_at
+                    WHERE ingest_shard_leases.expires_at <= now()
+                    RETURNING shard
+                    """,
+                    {
+                        **values,
+                        "shard_count": self.shard_count,
+                        "wanted": share - len(shards),
+                    },
+                )
+                shards = sorted(shards + [row["shard"] for row in rows])
+
+        return shards
+
+    async def complete_shards(self, tick: int, shards: List[int]) -> Optional[int]:
+        """
+        Record that the given shards have been ingested for the tick, and hand back the shards over this worker's share
+
+        :return: The tick this worker has to finalize, if any. Either this tick once every shard is in, or the oldest
+        earlier tick that missed its deadline, finalizing it covers the trade volumes of every tick after it too. Only
+        one worker is ever told to finalize a tick
+        """
+        async with self._db.transaction():
+            await self._db.execute(
+                """
+                INSERT INTO ingest_ticks (tick, shard_count, completed_shards)
+                VALUES (:tick, :shard_count, :shards)
+                ON CONFLICT (tick) DO UPDATE SET completed_shards = ARRAY(
+                    SELECT DISTINCT unnest(
+                        ingest_ticks.completed_shards || EXCLUDED.completed_shards
+                    )
+                    ORDER BY 1
+                )
+                """,
+                {"tick": tick, "shard_count": self.shard_count, "shards": shards},
+            )
+            # The row lock taken above makes this check and claim atomic between workers
+            finalizing = await self._db.fetch_val(
+                """
+                UPDATE ingest_ticks SET finalized_at = now()
+                WHERE tick = :tick
+                AND finalized_at IS NULL
+                AND cardinality(completed_shards) >= shard_count
+                RETURNING tick
+                """,
+                {"tick": tick},
+            )
+            overdue = await self._db.fetch_all(
+                """
+                UPDATE ingest_ticks SET finalized_at = now()
+                WHERE tick <= :deadline AND finalized_at IS NULL
+                RETURNING tick, shard_count, cardinality(completed_shards) AS completed
+                """,
+                {"deadline": tick - self._finalize_deadline_ticks},
+            )
+            if self._handing_back:
+                await self._db.execute(
+                    """
+                    DELETE FROM ingest_shard_leases
+                    WHERE worker_id = :worker_id AND shard = ANY(:shards)
+                    """,
+                    {"worker_id": self._worker_id, "shards": self._handing_back},
+                )
+                self._handing_back = []
+
+        for row in overdue:
+            logger.warning(
+                "Finalizing tick %d with %d of %d shards",
+                row["tick"],
+                row["completed"],
+                row["shard_count"],
+            )
+
+        finalized: List[int] = [row["tick"] for row in overdue]
+        if finalizing is not None:
+            finalized.append(finalizing)
+        if not finalized:
+            return None
+
+        await self._db.execute(
+            "DELETE FROM ingest_ticks WHERE tick < :oldest",
+            {"oldest": tick - _TICK_HISTORY},
+        )
+        return min(finalized)
+
+    async def release(self) -> None:
+        """
+        Give up every shard this worker holds so others can take them over without waiting for the leases to expire
+        """
+        async with self._db.transaction():
+            await self._db.execute(
+                "DELETE FROM ingest_shard_leases WHERE worker_id = :worker_id",
+                {"worker_id": self._worker_id},
+            )
+            await self._db.execute(
+                "DELETE FROM ingest_workers WHERE worker_id = :worker_id",
+                {"worker_id": self._worker_id},
+            )
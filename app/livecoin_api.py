@@ -1,14 +1,20 @@
+import asyncio
+import json
+import logging
 from datetime import datetime, timezone
-from typing import List
+from enum import Enum
+from typing import AbstractSet, Any, AsyncIterator, Dict, List, Optional
 
 import httpx
 from pydantic import BaseModel
 
+from app.exchange_source import ApiUnavailableException, ExchangeSource
+from app.fetch_policy import RETRYABLE_STATUS_CODES, RetryPolicy, Sleep, TokenBucket
 from app.types import CurrencyTradeVolumeRecord
 
+logger = logging.getLogger(__name__)
 
-class ApiUnavailableException(Exception):
-    pass
+DEFAULT_BASE_URL = "https://api.livecoin.net"
 
 
 class TickerItem(BaseModel):
@@ -20,30 +26,192 @@ class TickerApiResponse(BaseModel):
     __root__: List[TickerItem]
 
 
-class LivecoinApi:
-    def __init__(self, client: httpx.AsyncClient):
+class FetchStrategy(str, Enum):
+    FULL_TICKER = "full_ticker"
+    """
+    One request for every currency pair on the exchange, filtered down to the tracked ones
+    """
+    PER_SYMBOL = "per_symbol"
+    """
+    One request per tracked currency pair, sent in parallel as fast as the rate limit allows
+    """
+    AUTO = "auto"
+    """
+    Per symbol requests when they can all be sent within max_per_symbol_seconds, otherwise the full ticker
+    """
+
+
+_WHITESPACE = " \t\n\r"
+
+
+async def iter_json_array(chunks: AsyncIterator[str]) -> AsyncIterator[Any]:
+    """
+    Decode the items of a top level JSON array as its text arrives, so only one item is held in memory at a time
+    instead of the whole document
+
+    :raises ValueError: If the text isn't a JSON array or ends early
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    expect_item = True
+    async for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos == len(buffer):
+                break
+
+            char = buffer[pos]
+            if not started:
+                if char != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+            elif char == "]":
+                return
+            elif not expect_item:
+                if char != ",":
+                    raise ValueError(f"Unexpected {char!r} between array items")
+                expect_item = True
+                pos += 1
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # The rest of the item hasn't arrived yet
+                    break
+                # An item running to the end of the buffer could be a number that continues in the next chunk
+                if end == len(buffer):
+                    break
+                yield item
+                expect_item = False
+                pos = end
+
+        buffer = buffer[pos:]
+
+    raise ValueError("JSON array ended early")
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+class LivecoinApi(ExchangeSource):
+    name = "livecoin"
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        streaming: bool = False,
+        base_url: str = DEFAULT_BASE_URL,
+        rate_limiter: Optional[TokenBucket] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        strategy: FetchStrategy = FetchStrategy.FULL_TICKER,
+        max_per_symbol_seconds: float = 0,
+        sleep: Sleep = asyncio.sleep,
+    ):
+        """
+        :param streaming: Parse the ticker as it's downloaded, skipping untracked currency pairs without building
+        models for them. Otherwise the whole response is loaded and validated before filtering
+        :param rate_limiter: Every request waits on this first, without it requests are sent immediately
+        :param retry_policy: How to retry rate limited, server error and connection failures, not retried without it
+        :param max_per_symbol_seconds: With the AUTO strategy, how long the rate limiter may spread per symbol requests
+        out before it's better to fetch the full ticker. Keeps the samples in one tick close together in time
+        """
         self._client = client
+        self._streaming = streaming
+        self._base_url = base_url.rstrip("/")
+        self._rate_limiter = rate_limiter
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._strategy = strategy
+        self._max_per_symbol_seconds = max_per_symbol_seconds
+        self._sleep = sleep
+
+    def pick_strategy(self, pair_count: int) -> FetchStrategy:
+        if self._strategy != FetchStrategy.AUTO:
+            return self._strategy
+
+        # Without a rate limit per symbol requests all go out at once, so they're the cheapest for a handful of pairs
+        if self._rate_limiter is None or (
+            self._rate_limiter.seconds_to_acquire(pair_count)
+            <= self._max_per_symbol_seconds
+        ):
+            return FetchStrategy.PER_SYMBOL
+        return FetchStrategy.FULL_TICKER
+
+    async def _send(
+        self, path: str, params: Optional[Dict[str, str]] = None
+    ) -> httpx.Response:
+        """
+        Send a GET request within the rate limit, retrying failures the retry policy allows. The caller has to close the
+        returned response, its body hasn't been read yet
+
+        :raises ApiUnavailableException: If the last attempt still failed
+        """
+        request = self._client.build_request(
+            "GET", self._base_url + path, params=params
+        )
+        for attempt in range(1, self._retry_policy.max_attempts + 1):
+            if self._rate_limiter is not None:
+                await self._rate_limiter.acquire()
+
+            retry_after: Optional[float] = None
+            try:
+                response = await self._client.send(request, stream=True)
+            except httpx.TransportError:
+                logger.warning("Request to %s failed", request.url, exc_info=True)
+            else:
+                if response.status_code == 200:
+                    return response
+
+                await response.aclose()
+                logger.warning(
+                    "Request to %s failed with status %d",
+                    request.url,
+                    response.status_code,
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    break
+                retry_after = _retry_after_seconds(response)
+
+            if attempt < self._retry_policy.max_attempts:
+                await self._sleep(
+                    self._retry_policy.backoff_seconds(attempt, retry_after)
+                )
+
+        raise ApiUnavailableException()
 
     async def fetch_trade_volumes(
-        self, currency_pairs: List[str],
+        self, currency_pairs: AbstractSet[str],
     ) -> List[CurrencyTradeVolumeRecord]:
-        # TODO: Log details about the request/response
-        # TODO: Handle rate-limit responses by backing-off instead of just failing
-        bare_resp = await self._client.get("https://api.livecoin.net/exchange/ticker")
+        if self.pick_strategy(len(currency_pairs)) == FetchStrategy.PER_SYMBOL:
+            return await self._fetch_per_symbol(currency_pairs)
 
-        if bare_resp.status_code != 200:
-            # TODO: log details about the error, maybe not needed if the
-            # request/response logging is good
-            raise ApiUnavailableException()
+        if self._streaming:
+            return [record async for record in self.iter_trade_volumes(currency_pairs)]
+
+        # TODO: Log details about the request/response
+        bare_resp = await self._send("/exchange/ticker")
+        try:
+            await bare_resp.aread()
+        finally:
+            await bare_resp.aclose()
 
         fetch_time = datetime.now(timezone.utc)
-        ticker_items = TickerApiResponse.parse_obj(bare_resp.json()).__root__
+        try:
+            ticker_items = TickerApiResponse.parse_obj(bare_resp.json()).__root__
+        except ValueError as error:
+            # Both invalid JSON and pydantic's ValidationError, like the streaming parser
+            raise ApiUnavailableException() from error
 
         trade_volume_records: List[CurrencyTradeVolumeRecord] = []
         for item in ticker_items:
-            # It's unfortunate that we request all metrics from livecoin and then filter after we receive them. The API
-            # does allow requesting a single currency pair so we could request ones we care about in parallel, but
-            # there's a 1 request/second API limit so instead we just load all of them
             if item.symbol in currency_pairs:
                 trade_volume_records.append(
                     CurrencyTradeVolumeRecord(
@@ -52,3 +220,79 @@ class LivecoinApi:
                 )
 
         return trade_volume_records
+
+    async def iter_trade_volumes(
+        self, currency_pairs: AbstractSet[str],
+    ) -> AsyncIterator[CurrencyTradeVolumeRecord]:
+        """
+        Stream the trade volumes of the given currency pairs out of the full ticker as it's downloaded
+        """
+        bare_resp = await self._send("/exchange/ticker")
+        try:
+            fetch_time = datetime.now(timezone.utc)
+            async for raw_item in iter_json_array(bare_resp.aiter_text()):
+                # Most of the exchange's currency pairs aren't tracked, so check the symbol before validating
+                if not isinstance(raw_item, dict) or (
+                    raw_item.get("symbol") not in currency_pairs
+                ):
+                    continue
+
+                item = TickerItem.parse_obj(raw_item)
+                yield CurrencyTradeVolumeRecord(
+                    time=fetch_time, currency_pair=item.symbol, volume=item.volume
+                )
+        except (ValueError, httpx.TransportError) as error:
+            raise ApiUnavailableException() from error
+        finally:
+            await bare_resp.aclose()
+
+    async def _fetch_symbol(self, currency_pair: str) -> CurrencyTradeVolumeRecord:
+        bare_resp = await self._send(
+            "/exchange/ticker", params={"currencyPair": currency_pair}
+        )
+        try:
+            await bare_resp.aread()
+        finally:
+            await bare_resp.aclose()
+
+        try:
+            item = TickerItem.parse_obj(bare_resp.json())
+        except ValueError as error:
+            # Only this currency pair is lost, _fetch_per_symbol skips it
+            logger.warning(
+                "Malformed ticker response for %s", currency_pair, exc_info=True
+            )
+            raise ApiUnavailableException() from error
+
+        return CurrencyTradeVolumeRecord(
+            time=datetime.now(timezone.utc),
+            currency_pair=item.symbol,
+            volume=item.volume,
+        )
+
+    async def _fetch_per_symbol(
+        self, currency_pairs: AbstractSet[str]
+    ) -> List[CurrencyTradeVolumeRecord]:
+        results = await asyncio.gather(
+            *(self._fetch_symbol(pair) for pair in sorted(currency_pairs)),
+            return_exceptions=True,
+        )
+
+        records: List[CurrencyTradeVolumeRecord] = []
+        for result in results:
+            if isinstance(result, CurrencyTradeVolumeRecord):
+                records.append(result)
+            elif not isinstance(result, ApiUnavailableException):
+                raise result
+
+        # One currency pair failing shouldn't lose the rest of the tick, but if they all did the API is down
+        if currency_pairs and not records:
+            raise ApiUnavailableException()
+        if len(records) < len(currency_pairs):
+            logger.warning(
+                "Only fetched %d of %d currency pairs",
+                len(records),
+                len(currency_pairs),
+            )
+
+        return records
@@ -1,10 +1,21 @@
 from abc import ABC, abstractmethod
 from logging import Logger
+from typing import List
 
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 
 
+class UnsentMailException(Exception):
+    """
+    Raised when a bulk mail fails partway through, emails are the recipients that didn't get it
+    """
+
+    def __init__(self, emails: List[str]):
+        super().__init__(f"Failed to send mail to {len(emails)} recipients")
+        self.emails = emails
+
+
 class Mailer(ABC):
     @abstractmethod
     def send_mail(self, email: str, subject: str, contents: str) -> None:
@@ -18,6 +29,20 @@ class Mailer(ABC):
         """
         ...
 
+    def send_bulk_mail(self, emails: List[str], subject: str, contents: str) -> None:
+        """
+        Send the same email to each of the specified recipients, none of them will see the others' addresses
+
+        Mailers that can send to many recipients in a single request should override this
+
+        :raises UnsentMailException: With the recipients that weren't sent to yet when sending fails
+        """
+        for index, email in enumerate(emails):
+            try:
+                self.send_mail(email, subject, contents)
+            except Exception as e:
+                raise UnsentMailException(emails[index:]) from e
+
 
 class LoggingMailer(Mailer):
     def __init__(self, logger: Logger):
@@ -30,20 +55,34 @@ class LoggingMailer(Mailer):
         )
 
 
+# SendGrid accepts at most 1000 personalizations in a single request
+_MAX_SENDGRID_PERSONALIZATIONS = 1000
+
+
 class SendGridMailer(Mailer):
     def __init__(self, sendgrid_api: SendGridAPIClient):
         self._sendgrid_api = sendgrid_api
 
     def send_mail(self, email: str, subject: str, contents: str) -> None:
-        message = Mail(
-            from_email="cryptotracker@samburba.com",
-            to_emails=email,
-            subject="Cryptotracker Alert",
-            html_content=contents,
-        )
+        self.send_bulk_mail([email], subject, contents)
 
-        # TODO: Log request/response details, handle exceptions
-        # TODO: This API sends network traffic synchronously
-        # This will block the event loop. We need to wrap it so
-        # it happens asynchronously
-        self._sendgrid_api.send(message)
+    def send_bulk_mail(self, emails: List[str], subject: str, contents: str) -> None:
+        # TODO: Log request/response details
+        # This API sends network traffic synchronously and will block the
+        # event loop, send alerts through AlertDispatcher which runs it in
+        # a thread instead
+        for offset in range(0, len(emails), _MAX_SENDGRID_PERSONALIZATIONS):
+            # is_multiple gives every recipient their own personalization, so
+            # they all get the message in one request without seeing each other
+            message = Mail(
+                from_email="cryptotracker@samburba.com",
+                to_emails=emails[offset : offset + _MAX_SENDGRID_PERSONALIZATIONS],
+                subject=subject,
+                html_content=contents,
+                is_multiple=True,
+            )
+            try:
+                self._sendgrid_api.send(message)
+            except Exception as e:
+                # Earlier chunks went out, retrying them would send those recipients the same mail again
+                raise UnsentMailException(emails[offset:]) from e
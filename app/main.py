@@ -1,14 +1,39 @@
 import logging
 import sys
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional
 
 import httpx
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
 from app import settings
-from app.currency_trade_volume_service import CurrencyPair
+from app.currency_pair_registry import UnknownCurrencyPairException
 from app.di import make_deps
-from app.response_types import HistoryApiResponse, RecordTradeVolumeResponse
+from app.history_encoding import (
+    BINARY_MEDIA_TYPE,
+    MIN_COMPRESS_BYTES,
+    HistoryFormat,
+    compress,
+    encode_binary_history,
+    encode_columnar_history,
+    negotiate_content_encoding,
+)
+from app.http_caching import (
+    cache_headers,
+    conditional_headers_present,
+    is_not_modified,
+)
+from app.response_types import (
+    DatabasePoolResponse,
+    HistoryApiResponse,
+    HistoryBatchApiResponse,
+    RecordTradeVolumeResponse,
+    VolumeUpdateApiResponse,
+)
+from app.types import HistoryResolution
+from app.volume_updates import Subscription
 
 app = FastAPI()
 
@@ -21,17 +46,214 @@ logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
 @app.on_event("startup")
 async def startup():
     await deps.database.connect()
+    await deps.read_router.connect()
+    deps.alert_dispatcher.start()
+    await deps.currency_trade_service.load()
+    if deps.update_listener is not None:
+        deps.update_listener.start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    if deps.update_listener is not None:
+        await deps.update_listener.stop()
+    # Ends the streams that are still open, for servers that don't wait on them before shutting down
+    deps.update_hub.close()
+    await deps.alert_dispatcher.stop()
+    await deps.read_router.disconnect()
     await deps.database.disconnect()
+    if deps.snapshot_cache is not None:
+        await deps.snapshot_cache.close()
     await client.aclose()
 
 
+def _encoded_response(
+    request: Request, body: bytes, media_type: str, headers: Dict[str, str]
+) -> Response:
+    headers = {**headers, "Vary": "Accept-Encoding"}
+    encoding = negotiate_content_encoding(request.headers.get("accept-encoding"))
+    if encoding is not None and len(body) >= MIN_COMPRESS_BYTES:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+
+    return Response(body, media_type=media_type, headers=headers)
+
+
 @app.get("/api/volume_history", response_model=HistoryApiResponse)
-async def volume_history(currency_pair: CurrencyPair):
-    return await deps.currency_trade_service.get_currency_pair_snapshot(currency_pair)
+async def volume_history(
+    request: Request,
+    currency_pair: str,
+    resolution: Optional[HistoryResolution] = None,
+    max_points: Optional[int] = Query(None, gt=0),
+    response_format: HistoryFormat = Query(HistoryFormat.JSON, alias="format"),
+    delta: bool = False,
+):
+    """
+    Without resolution or max_points every sample from the last 24 hours is returned, otherwise the history is
+    rolled up into buckets. max_points picks the finest resolution that returns at most that many points
+
+    format=columnar returns the history as one array per column with epoch millisecond times and format=binary packs
+    the same columns as little endian arrays (see app/history_encoding.py). With delta, every column after the first
+    value holds differences to the previous value. Responses are compressed with br or gzip when the client accepts it
+
+    Snapshots only change once per ingest tick, so responses carry an ETag and Last-Modified for the tick and can be
+    cached until the next one. Conditional requests get a 304 without loading the history
+    """
+    service = deps.currency_trade_service
+    headers: Dict[str, str]
+    try:
+        if conditional_headers_present(request.headers):
+            updated_at = await service.get_snapshot_updated_at(currency_pair)
+            if updated_at is not None and is_not_modified(request.headers, updated_at):
+                headers = cache_headers(
+                    updated_at,
+                    settings.INGEST_INTERVAL_SECONDS,
+                    datetime.now(timezone.utc),
+                )
+                return Response(
+                    status_code=304, headers={**headers, "Vary": "Accept-Encoding"}
+                )
+
+        snapshot = await service.get_currency_pair_snapshot(
+            currency_pair, resolution=resolution, max_points=max_points
+        )
+    except UnknownCurrencyPairException:
+        raise HTTPException(status_code=404, detail="Currency pair isn't tracked")
+
+    headers = {}
+    if snapshot.updated_at is not None:
+        headers = cache_headers(
+            snapshot.updated_at,
+            settings.INGEST_INTERVAL_SECONDS,
+            datetime.now(timezone.utc),
+        )
+
+    if response_format == HistoryFormat.COLUMNAR:
+        return _encoded_response(
+            request,
+            encode_columnar_history(snapshot, delta),
+            "application/json",
+            headers,
+        )
+    if response_format == HistoryFormat.BINARY:
+        return _encoded_response(
+            request, encode_binary_history(snapshot, delta), BINARY_MEDIA_TYPE, headers
+        )
+    return _encoded_response(
+        request,
+        HistoryApiResponse.from_orm(snapshot).json(exclude_none=True).encode(),
+        "application/json",
+        headers,
+    )
+
+
+@app.get("/api/volume_histories", response_model=HistoryBatchApiResponse)
+async def volume_histories(
+    request: Request,
+    currency_pairs: List[str] = Query(...),
+    resolution: Optional[HistoryResolution] = None,
+    max_points: Optional[int] = Query(None, gt=0),
+):
+    """
+    The volume_history of several currency pairs in one request, repeat currency_pairs for every pair. Snapshots are
+    returned in the order they were asked for, tracked pairs without any data yet are listed in missing_currency_pairs
+
+    The ETag and Last-Modified change whenever any of the pairs does
+    """
+    if len(set(currency_pairs)) > settings.MAX_SNAPSHOT_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.MAX_SNAPSHOT_BATCH_SIZE} currency pairs can be requested at once",
+        )
+
+    service = deps.currency_trade_service
+    headers: Dict[str, str]
+    try:
+        if conditional_headers_present(request.headers):
+            updated_at = await service.get_snapshots_updated_at(currency_pairs)
+            if updated_at is not None and is_not_modified(request.headers, updated_at):
+                headers = cache_headers(
+                    updated_at,
+                    settings.INGEST_INTERVAL_SECONDS,
+                    datetime.now(timezone.utc),
+                )
+                return Response(
+                    status_code=304, headers={**headers, "Vary": "Accept-Encoding"}
+                )
+
+        snapshots = await service.get_currency_pair_snapshots(
+            currency_pairs, resolution=resolution, max_points=max_points
+        )
+    except UnknownCurrencyPairException as e:
+        raise HTTPException(status_code=404, detail=f"{e} isn't tracked")
+
+    headers = {}
+    updated_at_values = [
+        snapshot.updated_at for snapshot in snapshots if snapshot.updated_at is not None
+    ]
+    if updated_at_values:
+        headers = cache_headers(
+            max(updated_at_values),
+            settings.INGEST_INTERVAL_SECONDS,
+            datetime.now(timezone.utc),
+        )
+
+    found = {snapshot.currency_pair for snapshot in snapshots}
+    response = HistoryBatchApiResponse(
+        snapshots=[HistoryApiResponse.from_orm(snapshot) for snapshot in snapshots],
+        missing_currency_pairs=[
+            pair for pair in dict.fromkeys(currency_pairs) if pair not in found
+        ],
+    )
+    return _encoded_response(
+        request, response.json(exclude_none=True).encode(), "application/json", headers
+    )
+
+
+async def _volume_update_events(subscription: Subscription) -> AsyncIterator[str]:
+    # Starlette cancels this when the client disconnects
+    try:
+        async for updates in subscription.stream(
+            settings.LIVE_UPDATES_KEEPALIVE_SECONDS,
+            settings.LIVE_UPDATES_MAX_STREAM_SECONDS,
+        ):
+            if not updates:
+                # Comments are ignored by clients but keep proxies from closing idle streams
+                yield ": keepalive\n\n"
+            for update in updates:
+                data = VolumeUpdateApiResponse.from_orm(update).json()
+                yield f"event: update\ndata: {data}\n\n"
+    finally:
+        deps.update_hub.unsubscribe(subscription)
+
+
+@app.get("/api/volume_updates")
+async def volume_updates(currency_pairs: List[str] = Query(...)):
+    """
+    Server-sent events with an update event for each of the currency pairs after every ingest tick, holding only the
+    samples recorded since the previous update and the pair's current rank (see VolumeUpdateApiResponse). Load the
+    history from volume_history once, then keep it current from here instead of polling
+
+    The stream is closed when the client falls too far behind, reconnect and reload the history to catch up. It's also
+    ended after LIVE_UPDATES_MAX_STREAM_SECONDS and when the server shuts down, EventSource clients reconnect on their
+    own
+    """
+    if len(set(currency_pairs)) > settings.MAX_SNAPSHOT_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.MAX_SNAPSHOT_BATCH_SIZE} currency pairs can be requested at once",
+        )
+    try:
+        await deps.currency_trade_service.check_tracked(currency_pairs)
+    except UnknownCurrencyPairException as e:
+        raise HTTPException(status_code=404, detail=f"{e} isn't tracked")
+
+    subscription = deps.update_hub.subscribe(currency_pairs)
+    return StreamingResponse(
+        _volume_update_events(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 
 @app.get("/webhook/record_trade_volume", response_model=RecordTradeVolumeResponse)
@@ -44,5 +266,17 @@ async def record_trade_volume() -> RecordTradeVolumeResponse:
     return RecordTradeVolumeResponse(success=True)
 
 
+@app.get("/api/database_pool", response_model=DatabasePoolResponse)
+async def database_pool():
+    """
+    How busy this worker's database connection pool is and how long queries have waited for a connection
+    """
+    metrics = deps.database.pool_metrics()
+    if metrics is None:
+        raise HTTPException(status_code=503, detail="Not connected to the database")
+
+    return DatabasePoolResponse.from_orm(metrics)
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=settings.PORT)
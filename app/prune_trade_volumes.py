@@ -0,0 +1,33 @@
+#!/usr/bin/python3
+import asyncio
+import logging
+import sys
+from datetime import timedelta
+
+from databases import Database
+
+from app import settings
+from app.retention import RetentionPolicy, TradeVolumeRetention
+from app.volume_partitions import VolumePartitionManager
+
+
+async def main():
+    logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
+    database = Database(settings.DATABASE_URL)
+    await database.connect()
+    retention = TradeVolumeRetention(
+        database,
+        VolumePartitionManager(database),
+        RetentionPolicy(
+            raw_retention=timedelta(hours=settings.RAW_RETENTION_HOURS),
+            rollup_retention=timedelta(days=settings.ROLLUP_RETENTION_DAYS),
+            archive_dir=settings.RETENTION_ARCHIVE_DIR,
+            batch_size=settings.RETENTION_BATCH_SIZE,
+        ),
+    )
+    await retention.run()
+    await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
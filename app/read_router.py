@@ -0,0 +1,216 @@
+import asyncio
+import itertools
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+import asyncpg
+from databases import Database
+
+logger = logging.getLogger(__name__)
+
+# Failures that mean the replica itself is unreachable rather than the query being wrong
+_CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.InterfaceError,
+    asyncpg.exceptions.InternalClientError,
+)
+
+# A replica that has replayed everything the primary had written when the check started is caught up, the last replay
+# time only says how stale it is when it hasn't. Otherwise an idle primary would make every replica look like it's
+# falling behind. Compared to the primary rather than to what the replica received, so a replica whose WAL receiver is
+# down falls behind instead of looking caught up forever. replay_lsn is NULL for a server that isn't a replica
+_LAG_QUERY = """
+    SELECT
+        pg_last_wal_replay_lsn() AS replay_lsn,
+        CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_replay_lsn() >= CAST(:primary_lsn AS pg_lsn) THEN 0
+            ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+        END AS lag_seconds
+"""
+
+# asyncpg reads and writes pg_lsn as the WAL position in bytes
+_PRIMARY_LSN_QUERY = "SELECT pg_current_wal_lsn()"
+
+
+def _describe(db: Database) -> str:
+    # Leaves the password out of logs
+    return f"{db.url.hostname}:{db.url.port}"
+
+
+class ReadRouter:
+    """
+    Sends read only queries to read replicas, round robin, so they don't compete with ingest writes on the primary
+
+    Replicas are health checked every health_check_seconds: a replica that can't be reached or is lagging more than
+    max_lag behind the primary is skipped until a later check finds it healthy again. Without any healthy replicas reads
+    go to the primary. Only use it for reads that tolerate max_lag of staleness, reads that have to see a write that was
+    just made belong on the primary or after a call to sync_with_primary
+    """
+
+    def __init__(
+        self,
+        primary: Database,
+        replicas: Sequence[Database],
+        max_lag: Optional[timedelta] = None,
+        health_check_seconds: float = 10,
+        catch_up_check_seconds: float = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param max_lag: How far behind the primary a replica may be and still serve reads, any lag is accepted when None
+        :param catch_up_check_seconds: How often replicas are checked after sync_with_primary until one of them has
+        caught up
+        """
+        self._primary = primary
+        self._replicas = list(replicas)
+        self._max_lag_seconds = max_lag.total_seconds() if max_lag else None
+        self._health_check_seconds = health_check_seconds
+        self._catch_up_check_seconds = catch_up_check_seconds
+        self._clock = clock
+        self._healthy: List[Database] = []
+        self._round_robin = itertools.cycle(self._healthy)
+        # WAL position each replica had replayed at the last check, None for servers that aren't replicas
+        self._replayed: Dict[Database, Optional[int]] = {}
+        # Set by sync_with_primary, replicas that haven't replayed up to here don't serve reads
+        self._required_lsn = 0
+        self._checked_at: Optional[float] = None
+        self._checking: Optional["asyncio.Task[None]"] = None
+
+    async def connect(self) -> None:
+        for replica in self._replicas:
+            await replica.connect()
+        await self.check_replicas()
+
+    async def disconnect(self) -> None:
+        for replica in self._replicas:
+            await replica.disconnect()
+
+    async def _is_healthy(self, replica: Database, primary_lsn: Optional[int]) -> bool:
+        if not replica.is_connected:
+            return False
+
+        try:
+            row = await asyncio.wait_for(
+                replica.fetch_one(_LAG_QUERY, {"primary_lsn": primary_lsn}),
+                timeout=self._health_check_seconds,
+            )
+        except Exception:
+            # Whatever went wrong, the replica shouldn't serve reads until a check passes
+            logger.warning(
+                "Read replica %s is unreachable", _describe(replica), exc_info=True
+            )
+            return False
+
+        assert row is not None
+        lag_seconds = row["lag_seconds"]
+        self._replayed[replica] = row["replay_lsn"]
+        if self._max_lag_seconds is None:
+            return True
+        # Nothing has been replayed yet, so there's no telling how far behind it is
+        if lag_seconds is None or float(lag_seconds) > self._max_lag_seconds:
+            logger.warning(
+                "Read replica %s is %ss behind", _describe(replica), lag_seconds
+            )
+            return False
+        return True
+
+    async def check_replicas(self) -> None:
+        if not self._replicas:
+            return
+
+        primary_lsn: Optional[int] = None
+        try:
+            primary_lsn = await asyncio.wait_for(
+                self._primary.fetch_val(_PRIMARY_LSN_QUERY),
+                timeout=self._health_check_seconds,
+            )
+        except Exception:
+            # Replicas can still serve reads while the primary is down, their lag is judged by replay time alone
+            logger.warning("Primary is unreachable", exc_info=True)
+
+        healthy = await asyncio.gather(
+            *(self._is_healthy(replica, primary_lsn) for replica in self._replicas)
+        )
+        self._set_healthy(
+            [replica for replica, ok in zip(self._replicas, healthy) if ok]
+        )
+        self._checked_at = self._clock()
+
+    def _set_healthy(self, replicas: List[Database]) -> None:
+        self._healthy = replicas
+        self._round_robin = itertools.cycle(replicas)
+
+    async def sync_with_primary(self) -> None:
+        """
+        Only read from replicas that have replayed everything written to the primary so far, the primary serves reads
+        until one of them has. For reads that get cached past the writes they have to include
+        """
+        if not self._replicas:
+            return
+
+        lsn: int = await self._primary.fetch_val(_PRIMARY_LSN_QUERY)
+        self._required_lsn = max(self._required_lsn, lsn)
+
+    def _caught_up(self, replica: Database) -> bool:
+        replayed = self._replayed.get(replica)
+        return replayed is None or replayed >= self._required_lsn
+
+    async def _check_if_due(self) -> None:
+        interval = self._health_check_seconds
+        if self._healthy and not any(map(self._caught_up, self._healthy)):
+            interval = min(interval, self._catch_up_check_seconds)
+        if self._checked_at is not None and (
+            self._clock() - self._checked_at < interval
+        ):
+            return
+
+        # Concurrent reads share one check instead of each querying every replica
+        if self._checking is None or self._checking.done():
+            self._checking = asyncio.ensure_future(self.check_replicas())
+        # A read that's cancelled mustn't cancel the check the others are waiting on
+        await asyncio.shield(self._checking)
+
+    async def _reader(self) -> Database:
+        if not self._replicas:
+            return self._primary
+
+        await self._check_if_due()
+        for _ in range(len(self._healthy)):
+            replica = next(self._round_robin)
+            if self._caught_up(replica):
+                return replica
+        return self._primary
+
+    async def _read(self, method: str, query: str, values: Optional[Dict]) -> Any:
+        reader = await self._reader()
+        try:
+            return await getattr(reader, method)(query, values)
+        except _CONNECTION_ERRORS:
+            if reader is self._primary:
+                raise
+            logger.warning(
+                "Read from replica %s failed, retrying on the primary",
+                _describe(reader),
+                exc_info=True,
+            )
+            self._set_healthy(
+                [replica for replica in self._healthy if replica is not reader]
+            )
+            return await getattr(self._primary, method)(query, values)
+
+    async def fetch_all(
+        self, query: str, values: Optional[Dict] = None
+    ) -> List[Mapping]:
+        rows: List[Mapping] = await self._read("fetch_all", query, values)
+        return rows
+
+    async def fetch_one(
+        self, query: str, values: Optional[Dict] = None
+    ) -> Optional[Mapping]:
+        row: Optional[Mapping] = await self._read("fetch_one", query, values)
+        return row
@@ -1,9 +1,9 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel
 
-from app.currency_trade_volume_service import CurrencyPair
+from app.types import HistoryResolution
 
 
 class HistoryItem(BaseModel):
@@ -16,11 +16,27 @@ class HistoryItem(BaseModel):
         orm_mode = True
 
 
+class RollupHistoryItem(HistoryItem):
+    """
+    volume is the average over the bucket starting at time for rolled up resolutions. The other volumes are only set
+    for those, serialize with exclude_none so raw samples keep just time and volume
+    """
+
+    min_volume: Optional[float]
+    max_volume: Optional[float]
+    last_volume: Optional[float]
+
+
 class HistoryApiResponse(BaseModel):
-    currency_pair: CurrencyPair
-    history: List[HistoryItem]
+    """
+    Serialize with exclude_none, see RollupHistoryItem
+    """
+
+    currency_pair: str
+    history: List[RollupHistoryItem]
     rank: int
     total_tracked_currency_pairs: int
+    resolution: HistoryResolution
 
     # orm_mode allows dataclasses to pass this validation, otherwise we would have to convert them to dicts first
     # See https://pydantic-docs.helpmanual.io/usage/model_config/
@@ -28,5 +44,44 @@ class HistoryApiResponse(BaseModel):
         orm_mode = True
 
 
+class HistoryBatchApiResponse(BaseModel):
+    snapshots: List[HistoryApiResponse]
+    missing_currency_pairs: List[str]
+    """
+    Tracked currency pairs that don't have any data yet
+    """
+
+    class Config:
+        orm_mode = True
+
+
+class VolumeUpdateApiResponse(BaseModel):
+    currency_pair: str
+    history: List[HistoryItem]
+    """
+    Only the samples recorded since the previous update
+    """
+    rank: Optional[int]
+    total_tracked_currency_pairs: int
+    updated_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
+
+
 class RecordTradeVolumeResponse(BaseModel):
     success: bool
+
+
+class DatabasePoolResponse(BaseModel):
+    in_use: int
+    max_size: int
+    acquisitions: int
+    timeouts: int
+    waiting: int
+    total_wait_seconds: float
+    max_wait_seconds: float
+    avg_wait_seconds: float
+
+    class Config:
+        orm_mode = True
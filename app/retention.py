@@ -0,0 +1,248 @@
+import csv
+import gzip
+import io
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Optional, Sequence
+
+from databases import Database
+
+from app.volume_partitions import VolumePartition, VolumePartitionManager
+
+logger = logging.getLogger(__name__)
+
+_RAW_COLUMNS = ["fetch_time", "currency_pair", "volume"]
+_ROLLUP_COLUMNS = [
+    "currency_pair",
+    "resolution_seconds",
+    "bucket_start",
+    "min_volume",
+    "max_volume",
+    "volume_sum",
+    "sample_count",
+    "last_volume",
+    "last_fetch_time",
+]
+
+
+@dataclass
+class RetentionPolicy:
+    raw_retention: timedelta
+    """
+    How long to keep every trade volume sample, volume_history needs at least 24 hours
+    """
+    rollup_retention: timedelta
+    archive_dir: Optional[str] = None
+    """
+    When set, pruned rows are written to gzipped CSV files in this directory before they're deleted
+    """
+    batch_size: int = 5000
+    """
+    Max rows deleted by a single statement, keeps each delete's locks short
+    """
+
+
+@dataclass
+class RetentionReport:
+    raw_rows_pruned: int = 0
+    rollup_rows_pruned: int = 0
+    partitions_dropped: List[str] = field(default_factory=list)
+    archive_files: List[str] = field(default_factory=list)
+    seconds: float = 0
+
+
+class _CsvArchive:
+    """
+    Appends rows to a gzipped CSV file, only creating it once there's something to write
+
+    Every write is appended as its own gzip member, which gzip reads back as one file, and synced to disk before it
+    returns. A write that fails is cut back off the file, so the file only ever holds whole batches
+    """
+
+    def __init__(self, path: str, columns: List[str]):
+        self.path = path
+        self._columns = columns
+        self.rows_written = 0
+
+    def write(self, rows: Sequence[Any]) -> None:
+        if not rows:
+            return
+
+        new_file = not os.path.exists(self.path)
+        text = io.StringIO(newline="")
+        writer = csv.writer(text)
+        if new_file:
+            writer.writerow(self._columns)
+        for row in rows:
+            writer.writerow([row[column] for column in self._columns])
+        data = gzip.compress(text.getvalue().encode())
+
+        with open(self.path, "ab") as archive_file:
+            size = archive_file.tell()
+            try:
+                archive_file.write(data)
+                archive_file.flush()
+                os.fsync(archive_file.fileno())
+            except BaseException:
+                archive_file.truncate(size)
+                if new_file:
+                    os.remove(self.path)
+                raise
+        self.rows_written += len(rows)
+
+    def discard(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.rows_written = 0
+
+
+class TradeVolumeRetention:
+    """
+    Prunes trade volumes and rollups that are older than the retention policy allows
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        partitions: VolumePartitionManager,
+        policy: RetentionPolicy,
+    ):
+        self._db = db
+        self._partitions = partitions
+        self._policy = policy
+
+    async def run(self) -> RetentionReport:
+        start = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        run_suffix = now.strftime("%Y%m%dT%H%M%S")
+        report = RetentionReport()
+
+        raw_cutoff = now - self._policy.raw_retention
+        # Whole days of raw samples can go by dropping their partition, which is far cheaper than deleting each row
+        for partition in await self._partitions.get_partitions_before(raw_cutoff):
+            report.raw_rows_pruned += await self._drop_partition(partition, report)
+
+        # Whatever's left is in the partition that straddles the cutoff, or in the default partition
+        raw_archive = self._archive(f"currency_pair_volumes-{run_suffix}", _RAW_COLUMNS)
+        report.raw_rows_pruned += await self._delete_in_batches(
+            """
+            WITH expired AS (
+                SELECT id, fetch_time FROM currency_pair_volumes
+                WHERE fetch_time < :cutoff
+                LIMIT :batch_size
+            )
+            DELETE FROM currency_pair_volumes volume
+            USING expired, tracked_currency_pairs pair
+            WHERE volume.id = expired.id AND volume.fetch_time = expired.fetch_time
+            AND pair.id = volume.currency_pair_id
+            RETURNING volume.fetch_time, pair.symbol AS currency_pair, volume.volume
+            """,
+            raw_cutoff,
+            raw_archive,
+        )
+
+        rollup_archive = self._archive(
+            f"currency_pair_volume_rollups-{run_suffix}", _ROLLUP_COLUMNS
+        )
+        report.rollup_rows_pruned = await self._delete_in_batches(
+            """
+            DELETE FROM currency_pair_volume_rollups rollup
+            USING tracked_currency_pairs pair
+            WHERE pair.id = rollup.currency_pair_id
+            AND rollup.ctid IN (
+                SELECT ctid FROM currency_pair_volume_rollups
+                WHERE bucket_start < :cutoff
+                LIMIT :batch_size
+            )
+            RETURNING pair.symbol AS currency_pair, rollup.*
+            """,
+            now - self._policy.rollup_retention,
+            rollup_archive,
+        )
+
+        for archive in (raw_archive, rollup_archive):
+            if archive is not None and archive.rows_written > 0:
+                report.archive_files.append(archive.path)
+
+        report.seconds = time.perf_counter() - start
+        logger.info(
+            "Pruned %d trade volumes (%d partitions) and %d rollups in %.3fs",
+            report.raw_rows_pruned,
+            len(report.partitions_dropped),
+            report.rollup_rows_pruned,
+            report.seconds,
+        )
+        return report
+
+    def _archive(self, name: str, columns: List[str]) -> Optional[_CsvArchive]:
+        if self._policy.archive_dir is None:
+            return None
+
+        return _CsvArchive(
+            os.path.join(self._policy.archive_dir, f"{name}.csv.gz"), columns
+        )
+
+    async def _drop_partition(
+        self, partition: VolumePartition, report: RetentionReport
+    ) -> int:
+        """
+        Drop a partition, archiving it first if needed, and return how many rows it held
+
+        The partition stays attached until it's archived, so if archiving fails nothing changes and the next run tries
+        again
+        """
+        archive = self._archive(partition.name, _RAW_COLUMNS)
+        if archive is None:
+            row_count = int(
+                await self._db.fetch_val(f'SELECT count(*) FROM "{partition.name}"')
+            )
+        else:
+            # Left over from an earlier run that archived the partition but failed to drop it
+            archive.discard()
+            try:
+                # Stream the partition out instead of loading a whole day of samples into memory
+                rows: List[Any] = []
+                async for row in self._db.iterate(
+                    f"""
+                    SELECT fetch_time, pair.symbol AS currency_pair, volume
+                    FROM "{partition.name}" volume
+                    JOIN tracked_currency_pairs pair ON pair.id = volume.currency_pair_id
+                    """
+                ):
+                    rows.append(row)
+                    if len(rows) >= self._policy.batch_size:
+                        archive.write(rows)
+                        rows = []
+                archive.write(rows)
+            except BaseException:
+                archive.discard()
+                raise
+            row_count = archive.rows_written
+
+        async with self._db.transaction():
+            await self._partitions.detach_partition(partition)
+            await self._partitions.drop_partition(partition)
+        if archive is not None and row_count > 0:
+            report.archive_files.append(archive.path)
+        report.partitions_dropped.append(partition.name)
+        return row_count
+
+    async def _delete_in_batches(
+        self, query: str, cutoff: datetime, archive: Optional[_CsvArchive]
+    ) -> int:
+        deleted = 0
+        while True:
+            # Each batch commits on its own, so locks are only held for one batch at a time. The archive is written
+            # before the commit, if that fails the batch is rolled back instead of lost
+            async with self._db.transaction():
+                rows = await self._db.fetch_all(
+                    query, {"cutoff": cutoff, "batch_size": self._policy.batch_size}
+                )
+                if archive is not None:
+                    archive.write(rows)
+            deleted += len(rows)
+            if len(rows) < self._policy.batch_size:
+                return deleted
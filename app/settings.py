@@ -6,3 +6,118 @@ SENDGRID_API_KEY = os.environ["SENDGRID_API_KEY"]
 USE_REAL_MAILER = strtobool(os.environ["USE_REAL_MAILER"])
 NOTIFY_EMAILS = os.environ["NOTIFY_EMAILS"].split(",")
 PORT = int(os.environ["PORT"])
+# Every process sizes its connection pool from one budget: DATABASE_MAX_CONNECTIONS, less the reserved connections,
+# split evenly between the web workers and ingest daemons. DATABASE_POOL_MAX_SIZE overrides the computed size
+DATABASE_MAX_CONNECTIONS = int(os.environ.get("DATABASE_MAX_CONNECTIONS", "20"))
+DATABASE_RESERVED_CONNECTIONS = int(os.environ.get("DATABASE_RESERVED_CONNECTIONS", "2"))
+# Read by gunicorn too, so the budget always matches the number of web workers
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+INGEST_PROCESSES = int(os.environ.get("INGEST_PROCESSES", "1"))
+DATABASE_POOL_MIN_SIZE = int(os.environ.get("DATABASE_POOL_MIN_SIZE", "1"))
+DATABASE_POOL_MAX_SIZE = (
+    int(os.environ["DATABASE_POOL_MAX_SIZE"])
+    if os.environ.get("DATABASE_POOL_MAX_SIZE")
+    else None
+)
+# Seconds a query waits for a free connection before failing, 0 waits forever
+DATABASE_ACQUIRE_TIMEOUT_SECONDS = float(
+    os.environ.get("DATABASE_ACQUIRE_TIMEOUT_SECONDS", "10")
+)
+# Set to 0 when connecting through pgbouncer in transaction mode
+DATABASE_STATEMENT_CACHE_SIZE = int(
+    os.environ.get("DATABASE_STATEMENT_CACHE_SIZE", "100")
+)
+# Comma separated read replicas that serve volume_history reads, round robin. Replicas lagging more than
+# REPLICA_MAX_LAG_SECONDS behind the primary are skipped until they catch up
+DATABASE_REPLICA_URLS = [
+    url for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url
+]
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "30"))
+REPLICA_HEALTH_CHECK_SECONDS = float(
+    os.environ.get("REPLICA_HEALTH_CHECK_SECONDS", "10")
+)
+# Compute hourly averages and daily ranks in memory instead of in postgres. Only safe when ingest runs in the same
+# process that serves those numbers
+USE_VOLUME_AGGREGATES = strtobool(os.environ.get("USE_VOLUME_AGGREGATES", "false"))
+# Keep the last 24 hours of trade volumes in memory and serve histories and averages from there. Needs
+# LIVE_UPDATES_NOTIFY to stay current when ingest runs in a separate process
+USE_IN_MEMORY_HISTORY = strtobool(os.environ.get("USE_IN_MEMORY_HISTORY", "false"))
+# Where to cache volume_history snapshots between ingest runs: "none", "memory" or "redis"
+SNAPSHOT_CACHE = os.environ.get("SNAPSHOT_CACHE", "none")
+SNAPSHOT_CACHE_TTL_SECONDS = float(os.environ.get("SNAPSHOT_CACHE_TTL_SECONDS", "60"))
+SNAPSHOT_CACHE_MAX_SIZE = int(os.environ.get("SNAPSHOT_CACHE_MAX_SIZE", "1024"))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
+# Cache lookups that take longer fall through to the database
+REDIS_TIMEOUT_SECONDS = float(os.environ.get("REDIS_TIMEOUT_SECONDS", "0.5"))
+# Send every ingest tick to the web processes through postgres LISTEN/NOTIFY, live updates need it when ingest runs in
+# a separate process
+LIVE_UPDATES_NOTIFY = strtobool(os.environ.get("LIVE_UPDATES_NOTIFY", "false"))
+LIVE_UPDATES_MAX_QUEUED = int(os.environ.get("LIVE_UPDATES_MAX_QUEUED", "100"))
+LIVE_UPDATES_KEEPALIVE_SECONDS = float(
+    os.environ.get("LIVE_UPDATES_KEEPALIVE_SECONDS", "15")
+)
+# Streams end after this long so servers don't wait on them forever when shutting down, clients reconnect
+LIVE_UPDATES_MAX_STREAM_SECONDS = float(
+    os.environ.get("LIVE_UPDATES_MAX_STREAM_SECONDS", "300")
+)
+# Most currency pairs one volume_histories or volume_updates request may ask for
+MAX_SNAPSHOT_BATCH_SIZE = int(os.environ.get("MAX_SNAPSHOT_BATCH_SIZE", "50"))
+# Trade volume records written per INSERT statement
+INSERT_BATCH_SIZE = int(os.environ.get("INSERT_BATCH_SIZE", "1000"))
+# Retention policy applied by app.prune_trade_volumes. Raw samples have to cover the 24 hour history window
+RAW_RETENTION_HOURS = float(os.environ.get("RAW_RETENTION_HOURS", "25"))
+ROLLUP_RETENTION_DAYS = float(os.environ.get("ROLLUP_RETENTION_DAYS", "30"))
+RETENTION_ARCHIVE_DIR = os.environ.get("RETENTION_ARCHIVE_DIR") or None
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", "5000"))
+# Seconds between runs of the ingest daemon (python -m app.update_trade_volumes --daemon)
+INGEST_INTERVAL_SECONDS = float(os.environ.get("INGEST_INTERVAL_SECONDS", "60"))
+# Shards the tracked currency pairs are split into so several ingest daemons can share the work, 1 disables sharding.
+# Daemons that stop renewing their shards for INGEST_LEASE_SECONDS lose them to the others
+INGEST_SHARDS = int(os.environ.get("INGEST_SHARDS", "1"))
+INGEST_LEASE_SECONDS = float(
+    os.environ.get("INGEST_LEASE_SECONDS", str(INGEST_INTERVAL_SECONDS * 3))
+)
+# Alert emails sent at once by the background dispatcher, and how many times each one is tried
+MAIL_CONCURRENCY = int(os.environ.get("MAIL_CONCURRENCY", "4"))
+MAIL_MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", "5"))
+# A recipient hears about a currency pair at most once per cooldown, and only again after its volume has dropped below
+# ALERT_REARM_RATIO times the currency pair's alert threshold
+ALERT_COOLDOWN_MINUTES = float(os.environ.get("ALERT_COOLDOWN_MINUTES", "60"))
+ALERT_REARM_RATIO = float(os.environ.get("ALERT_REARM_RATIO", "0.67"))
+# A trade volume is notable when it's at least this many times its currency pair's hourly average.
+# ALERT_THRESHOLD_MULTIPLIERS overrides it per currency pair, e.g. "XEM/BTC=5,DGB/BTC=2.5"
+ALERT_THRESHOLD_MULTIPLIER = float(os.environ.get("ALERT_THRESHOLD_MULTIPLIER", "3"))
+ALERT_THRESHOLD_MULTIPLIERS = os.environ.get("ALERT_THRESHOLD_MULTIPLIERS", "")
+# What the multipliers apply to: "average", "ewma" or "percentile" volume, or "z_score" to alert at that many standard
+# deviations above the mean. Everything but "average" needs numpy with USE_IN_MEMORY_HISTORY
+ALERT_METRIC = os.environ.get("ALERT_METRIC", "average")
+# What currency pairs are ranked by: "std_dev", "coefficient_of_variation", "z_score", "ewma_ratio" or
+# "percentile_ratio". Everything but "std_dev" needs numpy with USE_IN_MEMORY_HISTORY
+RANK_METRIC = os.environ.get("RANK_METRIC", "std_dev")
+# How often the list of tracked currency pairs is reloaded from the database
+CURRENCY_PAIR_REFRESH_SECONDS = float(
+    os.environ.get("CURRENCY_PAIR_REFRESH_SECONDS", "60")
+)
+# Parse the livecoin ticker as it downloads, skipping untracked currency pairs, instead of loading all of it first
+STREAM_TICKER_RESPONSE = bool(
+    strtobool(os.environ.get("STREAM_TICKER_RESPONSE", "true"))
+)
+LIVECOIN_BASE_URL = os.environ.get("LIVECOIN_BASE_URL", "https://api.livecoin.net")
+# Livecoin allows 1 request per second. Every livecoin request in a process shares this limit, and sharded ingest
+# daemons split it evenly between however many of them are running
+LIVECOIN_RATE_LIMIT_PER_SECOND = float(
+    os.environ.get("LIVECOIN_RATE_LIMIT_PER_SECOND", "1")
+)
+LIVECOIN_RATE_LIMIT_BURST = int(os.environ.get("LIVECOIN_RATE_LIMIT_BURST", "1"))
+# Attempts per request, rate limited (429) and server error responses are retried with exponential backoff
+LIVECOIN_MAX_ATTEMPTS = int(os.environ.get("LIVECOIN_MAX_ATTEMPTS", "4"))
+# "full_ticker", "per_symbol" or "auto", which requests each currency pair separately as long as the rate limit lets
+# them all go out within LIVECOIN_MAX_PER_SYMBOL_SECONDS
+LIVECOIN_FETCH_STRATEGY = os.environ.get("LIVECOIN_FETCH_STRATEGY", "auto")
+LIVECOIN_MAX_PER_SYMBOL_SECONDS = float(
+    os.environ.get("LIVECOIN_MAX_PER_SYMBOL_SECONDS", "5")
+)
+# Exchanges to fetch trade volumes from, in priority order when more than one has the same currency pair
+EXCHANGE_SOURCES = os.environ.get("EXCHANGE_SOURCES", "livecoin").split(",")
+# How long a tick waits for livecoin before recording whatever the other sources returned
+LIVECOIN_TIMEOUT_SECONDS = float(os.environ.get("LIVECOIN_TIMEOUT_SECONDS", "30"))
@@ -0,0 +1,345 @@
+import asyncio
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+from app.types import (
+    CurrencyPairSnapshot,
+    CurrencyTradeVolumeRecord,
+    HistoryResolution,
+    VolumeRollupRecord,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RedisProtocolError(Exception):
+    pass
+
+
+# Cache outages should slow the API down, not take it down with them
+_CACHE_ERRORS = (
+    OSError,
+    asyncio.IncompleteReadError,
+    asyncio.TimeoutError,
+    RedisProtocolError,
+)
+
+
+@dataclass
+class CachedSnapshot:
+    snapshot: Optional[CurrencyPairSnapshot]
+    """
+    None if there was no snapshot cached or it has been invalidated since it was cached
+    """
+    generation: int
+    """
+    The cache generation at lookup time, pass it back to SnapshotCache.set when storing a freshly built snapshot
+    """
+
+
+class SnapshotCache(ABC):
+    """
+    Cache of currency pair snapshots that is invalidated whenever new trade volumes are recorded. Keys are chosen by
+    the caller since there can be several snapshots of the same currency pair at different resolutions
+
+    Every invalidation starts a new generation instead of deleting entries, so marking all snapshots stale is O(1)
+    no matter how many currency pairs are cached
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> CachedSnapshot:
+        """
+        Look up a snapshot, the result's snapshot is None on a miss
+        """
+        ...
+
+    @abstractmethod
+    async def set(
+        self, key: str, snapshot: CurrencyPairSnapshot, generation: int
+    ) -> None:
+        """
+        Cache the given snapshot
+
+        :param generation: The generation returned by the lookup that missed. If the cache has been invalidated since,
+        the snapshot may have been built from old data and will be treated as stale
+        """
+        ...
+
+    @abstractmethod
+    async def invalidate(self) -> None:
+        """
+        Mark every cached snapshot as stale
+        """
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class InMemorySnapshotCache(SnapshotCache):
+    """
+    LRU cache local to this process
+
+    Invalidation only reaches this process, so if ingest runs elsewhere keep the ttl at or below the ingest interval
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._generation = 0
+        self._entries: "OrderedDict[str, Tuple[float, int, CurrencyPairSnapshot]]" = (
+            OrderedDict()
+        )
+
+    async def get(self, key: str) -> CachedSnapshot:
+        entry = self._entries.get(key)
+        if entry is None:
+            return CachedSnapshot(None, self._generation)
+
+        expires_at, generation, snapshot = entry
+        if generation != self._generation or expires_at <= self._clock():
+            del self._entries[key]
+            return CachedSnapshot(None, self._generation)
+
+        self._entries.move_to_end(key)
+        return CachedSnapshot(snapshot, self._generation)
+
+    async def set(
+        self, key: str, snapshot: CurrencyPairSnapshot, generation: int
+    ) -> None:
+        if generation != self._generation:
+            return
+
+        self._entries[key] = (
+            self._clock() + self._ttl_seconds,
+            generation,
+            snapshot,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+
+RespValue = Union[None, int, bytes, List[Any]]
+
+
+class RespConnection:
+    """
+    Minimal client for the redis serialization protocol, just enough to run the handful of commands the snapshot cache
+    needs against redis or anything that speaks its protocol
+    """
+
+    def __init__(self, url: str, timeout_seconds: float = 0.5):
+        """
+        :param timeout_seconds: How long a command may take, including waiting for the commands ahead of it and
+        connecting. A server that stops replying without closing the connection would hold up every command otherwise
+        """
+        self._url = urlparse(url)
+        self._timeout_seconds = timeout_seconds
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        # Replies come back in order on a single connection, so only let one command be in flight at a time
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(
+            self._url.hostname or "localhost", self._url.port or 6379
+        )
+        self._reader, self._writer = reader, writer
+        if self._url.password:
+            await self._send(("AUTH", self._url.password))
+        database = self._url.path.lstrip("/")
+        if database:
+            await self._send(("SELECT", database))
+
+        return reader, writer
+
+    async def execute(self, *args: Union[str, bytes, int]) -> RespValue:
+        """
+        :raises asyncio.TimeoutError: If there's no reply within the timeout, the connection is reset
+        """
+        return await asyncio.wait_for(self._execute(args), self._timeout_seconds)
+
+    async def _execute(self, args: Tuple[Union[str, bytes, int], ...]) -> RespValue:
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                return await self._send(args)
+            except BaseException:
+                # Whether the connection broke, the caller was cancelled or the reply made no sense, part of a reply may
+                # still be on its way and the next command would read it as its own. Reconnect for the next command
+                await self.close()
+                raise
+
+    async def _send(self, args: Tuple[Union[str, bytes, int], ...]) -> RespValue:
+        assert self._reader is not None and self._writer is not None
+        encoded = [arg if isinstance(arg, bytes) else str(arg).encode() for arg in args]
+        command = b"*%d\r\n" % len(encoded) + b"".join(
+            b"$%d\r\n%s\r\n" % (len(arg), arg) for arg in encoded
+        )
+        self._writer.write(command)
+        await self._writer.drain()
+        return await self._read_reply(self._reader)
+
+    async def _read_reply(self, reader: asyncio.StreamReader) -> RespValue:
+        line = (await reader.readuntil(b"\r\n"))[:-2]
+        prefix, rest = line[:1], line[1:]
+        if prefix == b"+":
+            return rest
+        if prefix == b"-":
+            raise RedisProtocolError(rest.decode())
+        if prefix == b":":
+            return int(rest)
+        if prefix == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            return (await reader.readexactly(length + 2))[:-2]
+        if prefix == b"*":
+            length = int(rest)
+            if length == -1:
+                return None
+            return [await self._read_reply(reader) for _ in range(length)]
+
+        raise RedisProtocolError(f"Unexpected reply: {line!r}")
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader, self._writer = None, None
+
+
+def _record_to_json(record: CurrencyTradeVolumeRecord) -> List[Any]:
+    item = [record.time.isoformat(), float(record.volume)]
+    if isinstance(record, VolumeRollupRecord):
+        item += [
+            float(record.min_volume),
+            float(record.max_volume),
+            float(record.last_volume),
+        ]
+
+    return item
+
+
+def _record_from_json(currency_pair: str, item: List[Any]) -> CurrencyTradeVolumeRecord:
+    time = datetime.fromisoformat(item[0])
+    if len(item) == 2:
+        return CurrencyTradeVolumeRecord(time, currency_pair, item[1])
+
+    return VolumeRollupRecord(time, currency_pair, *item[1:])
+
+
+def _snapshot_to_json(snapshot: CurrencyPairSnapshot, generation: int) -> str:
+    return json.dumps(
+        {
+            "generation": generation,
+            "currency_pair": snapshot.currency_pair,
+            "rank": snapshot.rank,
+            "total_tracked_currency_pairs": snapshot.total_tracked_currency_pairs,
+            "resolution": snapshot.resolution.value,
+            "history": [_record_to_json(record) for record in snapshot.history],
+            "updated_at": (
+                snapshot.updated_at.isoformat()
+                if snapshot.updated_at is not None
+                else None
+            ),
+        }
+    )
+
+
+def _snapshot_from_json(data: Dict[str, Any]) -> CurrencyPairSnapshot:
+    currency_pair = data["currency_pair"]
+    return CurrencyPairSnapshot(
+        currency_pair=currency_pair,
+        history=[_record_from_json(currency_pair, item) for item in data["history"]],
+        rank=data["rank"],
+        total_tracked_currency_pairs=data["total_tracked_currency_pairs"],
+        resolution=HistoryResolution(data["resolution"]),
+        updated_at=(
+            datetime.fromisoformat(data["updated_at"])
+            if data.get("updated_at")
+            else None
+        ),
+    )
+
+
+class RedisSnapshotCache(SnapshotCache):
+    """
+    Cache shared by every process that points at the same redis, so ingest invalidations reach all of them
+    """
+
+    def __init__(
+        self, connection: RespConnection, ttl_seconds: float, prefix="cryptotracker"
+    ):
+        self._connection = connection
+        self._ttl_ms = int(ttl_seconds * 1000)
+        self._generation_key = f"{prefix}:snapshot_generation"
+        self._prefix = f"{prefix}:snapshot:"
+
+    async def get(self, key: str) -> CachedSnapshot:
+        # Fetch the generation alongside the snapshot so a lookup is still a single round-trip
+        try:
+            reply = await self._connection.execute(
+                "MGET", self._generation_key, self._prefix + key
+            )
+        except _CACHE_ERRORS:
+            logger.exception("Failed to read snapshot from cache")
+            # Generation -1 never matches a real one, so the caller's set is skipped as well
+            return CachedSnapshot(None, -1)
+
+        assert isinstance(reply, list)
+        raw_generation, raw_snapshot = reply
+        generation = int(raw_generation) if raw_generation is not None else 0
+        if raw_snapshot is None:
+            return CachedSnapshot(None, generation)
+
+        data = json.loads(raw_snapshot)
+        if data["generation"] != generation:
+            return CachedSnapshot(None, generation)
+
+        return CachedSnapshot(_snapshot_from_json(data), generation)
+
+    async def set(
+        self, key: str, snapshot: CurrencyPairSnapshot, generation: int
+    ) -> None:
+        if generation < 0:
+            return
+
+        try:
+            await self._connection.execute(
+                "SET",
+                self._prefix + key,
+                _snapshot_to_json(snapshot, generation),
+                "PX",
+                self._ttl_ms,
+            )
+        except _CACHE_ERRORS:
+            logger.exception("Failed to write snapshot to cache")
+
+    async def invalidate(self) -> None:
+        try:
+            await self._connection.execute("INCR", self._generation_key)
+        except _CACHE_ERRORS:
+            # Readers will see the old snapshots until they expire
+            logger.exception("Failed to invalidate snapshot cache")
+
+    async def close(self) -> None:
+        await self._connection.close()
@@ -0,0 +1,132 @@
+import threading
+import time
+from typing import List
+from mock import MagicMock
+from sendgrid import SendGridAPIClient
+
+import pytest
+
+from app.alert_dispatcher import Alert, AlertDispatcher
+from app.mailer import Mailer, SendGridMailer
+
+EMAILS = ["one@local", "two@local"]
+
+
+class SlowMailer(Mailer):
+    def __init__(self):
+        self.sent: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def send_mail(self, email: str, subject: str, contents: str) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self._lock:
+            self.in_flight -= 1
+            self.sent.append(contents)
+
+
+class FlakyMailer(Mailer):
+    def __init__(self, fail_once: str):
+        self.sent: List[str] = []
+        self._fail_once = fail_once
+
+    def send_mail(self, email: str, subject: str, contents: str) -> None:
+        if email == self._fail_once:
+            self._fail_once = ""
+            raise Exception()
+        self.sent.append(email)
+
+
+@pytest.mark.asyncio
+async def test_sends_one_request_for_all_recipients():
+    mailer = MagicMock(Mailer)
+    dispatcher = AlertDispatcher(mailer)
+    dispatcher.start()
+
+    dispatcher.enqueue(Alert(EMAILS, "Subject", "Contents"))
+    await dispatcher.stop()
+
+    mailer.send_bulk_mail.assert_called_once_with(EMAILS, "Subject", "Contents")
+
+
+@pytest.mark.asyncio
+async def test_retries_failed_sends():
+    mailer = MagicMock(Mailer)
+    mailer.send_bulk_mail.side_effect = [Exception(), Exception(), None]
+    dispatcher = AlertDispatcher(mailer, max_attempts=3, base_backoff_seconds=0.001)
+    dispatcher.start()
+
+    dispatcher.enqueue(Alert(EMAILS, "Subject", "Contents"))
+    await dispatcher.stop()
+
+    assert mailer.send_bulk_mail.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_retries_only_the_chunks_that_failed():
+    sendgrid_api = MagicMock(SendGridAPIClient)
+    sendgrid_api.send.side_effect = [None, Exception(), None, None]
+    dispatcher = AlertDispatcher(
+        SendGridMailer(sendgrid_api), max_attempts=3, base_backoff_seconds=0.001
+    )
+    dispatcher.start()
+
+    emails = [f"{i}@local" for i in range(2500)]
+    dispatcher.enqueue(Alert(emails, "Subject", "Contents"))
+    await dispatcher.stop()
+
+    # The first chunk went out before the second one failed, so only the last two are sent again. Mail doesn't keep
+    # the personalizations in order
+    recipients = [
+        {p.tos[0]["email"] for p in call.args[0].personalizations}
+        for call in sendgrid_api.send.call_args_list
+    ]
+    assert recipients == [
+        set(emails[:1000]),
+        set(emails[1000:2000]),
+        set(emails[1000:2000]),
+        set(emails[2000:]),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_retries_only_the_recipients_that_failed():
+    mailer = FlakyMailer(fail_once="two@local")
+    dispatcher = AlertDispatcher(mailer, max_attempts=2, base_backoff_seconds=0.001)
+    dispatcher.start()
+
+    dispatcher.enqueue(Alert(EMAILS, "Subject", "Contents"))
+    await dispatcher.stop()
+
+    assert mailer.sent == EMAILS
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_attempts():
+    mailer = MagicMock(Mailer)
+    mailer.send_bulk_mail.side_effect = Exception()
+    dispatcher = AlertDispatcher(mailer, max_attempts=2, base_backoff_seconds=0.001)
+    dispatcher.start()
+
+    dispatcher.enqueue(Alert(EMAILS, "Subject", "Contents"))
+    await dispatcher.stop()
+
+    assert mailer.send_bulk_mail.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_bounds_concurrent_sends():
+    mailer = SlowMailer()
+    dispatcher = AlertDispatcher(mailer, concurrency=2)
+    dispatcher.start()
+
+    for i in range(6):
+        dispatcher.enqueue(Alert(["one@local"], "Subject", str(i)))
+    await dispatcher.stop()
+
+    assert sorted(mailer.sent) == [str(i) for i in range(6)]
+    assert mailer.max_in_flight == 2
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+from mock import MagicMock
+
+from app.alert_state import AlertState, AlertStateStore, AlertStateTracker
+
+NOON = datetime(year=2020, month=1, day=1, hour=12)
+EMAIL = "example@local"
+
+
+def make_tracker(store=None) -> AlertStateTracker:
+    return AlertStateTracker(
+        cooldown=timedelta(hours=1), rearm_ratio=0.5, store=store
+    )
+
+
+def test_disarmed_after_alert_until_volume_drops():
+    tracker = make_tracker()
+
+    assert tracker.should_alert("pair", EMAIL, NOON)
+    # Still above half the threshold, so no repeat alert even once the cooldown has passed
+    tracker.observe("pair", 160, 300, [EMAIL])
+    assert not tracker.should_alert("pair", EMAIL, NOON + timedelta(hours=2))
+    # No threshold to compare against
+    tracker.observe("pair", 100, None, [EMAIL])
+    assert not tracker.should_alert("pair", EMAIL, NOON + timedelta(hours=2))
+
+    tracker.observe("pair", 140, 300, [EMAIL])
+    assert tracker.should_alert("pair", EMAIL, NOON + timedelta(hours=2))
+
+
+def test_cooldown_applies_even_when_rearmed():
+    tracker = make_tracker()
+
+    assert tracker.should_alert("pair", EMAIL, NOON)
+    tracker.observe("pair", 100, 300, [EMAIL])
+
+    assert not tracker.should_alert("pair", EMAIL, NOON + timedelta(minutes=30))
+    assert tracker.should_alert("pair", EMAIL, NOON + timedelta(minutes=61))
+
+
+@pytest.mark.parametrize("rearm_ratio", [0, 1, 1.5])
+def test_rejects_rearming_at_or_above_the_threshold(rearm_ratio: float):
+    with pytest.raises(ValueError):
+        AlertStateTracker(cooldown=timedelta(hours=1), rearm_ratio=rearm_ratio)
+
+
+def test_recipients_are_tracked_separately():
+    tracker = make_tracker()
+
+    assert tracker.should_alert("pair", EMAIL, NOON)
+    assert tracker.should_alert("pair", "other@local", NOON)
+    assert tracker.should_alert("other_pair", EMAIL, NOON)
+
+
+@pytest.mark.asyncio
+async def test_loads_and_saves_changed_states():
+    store = MagicMock(AlertStateStore)
+    store.get_alert_states.return_value = [
+        AlertState("pair", EMAIL, last_alert_time=NOON, armed=False)
+    ]
+    tracker = make_tracker(store)
+    await tracker.load()
+
+    assert not tracker.should_alert("pair", EMAIL, NOON + timedelta(hours=2))
+    assert tracker.should_alert("other_pair", EMAIL, NOON)
+    await tracker.save()
+    await tracker.save()
+
+    store.save_alert_states.assert_called_once_with(
+        [AlertState("other_pair", EMAIL, last_alert_time=NOON, armed=False)]
+    )
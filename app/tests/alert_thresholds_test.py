@@ -0,0 +1,88 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from app.alert_thresholds import (
+    AlertMetric,
+    AlertThresholds,
+    find_volume_changes,
+    parse_threshold_multipliers,
+)
+from app.currency_trade_volume_store import CurrencyPairAvg
+from app.types import CurrencyTradeVolumeRecord
+from app.volume_statistics import VolumeStatistics
+
+JAN_1ST = datetime(year=1970, day=1, month=1)
+
+
+def test_parse_threshold_multipliers():
+    assert parse_threshold_multipliers("") == {}
+    assert parse_threshold_multipliers("XEM/BTC=5, DGB/BTC=2.5") == {
+        "XEM/BTC": 5,
+        "DGB/BTC": 2.5,
+    }
+    with pytest.raises(ValueError):
+        parse_threshold_multipliers("XEM/BTC")
+
+
+def test_find_volume_changes_uses_per_pair_thresholds():
+    thresholds = AlertThresholds(default_multiplier=3, multipliers={"B": 1.5})
+    trade_volumes = [
+        CurrencyTradeVolumeRecord(time=JAN_1ST, currency_pair=pair, volume=200)
+        for pair in ["A", "B", "C"]
+    ]
+    avg_trade_volumes = [
+        CurrencyPairAvg("B", avg_volume=Decimal(100)),
+        CurrencyPairAvg("A", avg_volume=Decimal(100)),
+    ]
+
+    changes = find_volume_changes(trade_volumes, avg_trade_volumes, thresholds)
+
+    # C has no average yet so there's nothing to compare it to
+    assert [
+        (change.trade_volume.currency_pair, change.threshold, change.notable)
+        for change in changes
+    ] == [
+        ("A", 300, False),
+        ("B", 150, True),
+    ]
+
+
+def test_alert_metrics_compare_against_the_statistics():
+    pair_statistics = VolumeStatistics(
+        count=10,
+        mean=100,
+        std_dev=20,
+        coefficient_of_variation=0.2,
+        latest=150,
+        z_score=2.5,
+        ewma=60,
+        percentile=140,
+    )
+
+    def notable(metric: AlertMetric, volume: float) -> bool:
+        return AlertThresholds(default_multiplier=2, metric=metric).is_notable(
+            "A", volume, 100, pair_statistics
+        )
+
+    assert notable(AlertMetric.AVERAGE, 200) and not notable(AlertMetric.AVERAGE, 199)
+    assert notable(AlertMetric.EWMA, 120) and not notable(AlertMetric.EWMA, 119)
+    assert notable(AlertMetric.PERCENTILE, 280)
+    assert not notable(AlertMetric.PERCENTILE, 279)
+    # Two standard deviations above the mean
+    assert notable(AlertMetric.Z_SCORE, 140) and not notable(AlertMetric.Z_SCORE, 139)
+
+
+def test_alert_metrics_without_statistics_are_never_notable():
+    thresholds = AlertThresholds(metric=AlertMetric.Z_SCORE)
+    trade_volumes = [
+        CurrencyTradeVolumeRecord(time=JAN_1ST, currency_pair="A", volume=1000)
+    ]
+    avg_trade_volumes = [CurrencyPairAvg("A", avg_volume=1)]
+
+    changes = find_volume_changes(trade_volumes, avg_trade_volumes, thresholds, {})
+
+    assert [(change.threshold, change.notable) for change in changes] == [
+        (None, False)
+    ]
@@ -0,0 +1,62 @@
+from mock import MagicMock
+
+import pytest
+from databases import Database
+
+from app.currency_pair_registry import (
+    CurrencyPairRegistry,
+    UnknownCurrencyPairException,
+)
+
+
+def test_from_pairs():
+    registry = CurrencyPairRegistry.from_pairs(["XEM/BTC", "DGB/BTC"])
+
+    assert "DGB/BTC" in registry
+    assert "OTON/BTC" not in registry
+    assert len(registry) == 2
+    assert registry.id("DGB/BTC") == 2
+    assert registry.symbol(1) == "XEM/BTC"
+    with pytest.raises(UnknownCurrencyPairException):
+        registry.id("OTON/BTC")
+
+
+
+def test_shard_symbols_split_pairs_by_id():
+    registry = CurrencyPairRegistry.from_pairs(["XEM/BTC", "OTON/BTC", "DGB/BTC"])
+
+    assert registry.shard_symbols({1}, 2) == {"XEM/BTC", "DGB/BTC"}
+    assert registry.shard_symbols({0}, 2) == {"OTON/BTC"}
+    assert registry.shard_symbols({0, 1}, 2) == registry.symbols
+
+@pytest.mark.asyncio
+async def test_refresh_keeps_ids_of_disabled_pairs():
+    db = MagicMock(Database)
+    db.fetch_all.return_value = [
+        {"id": 1, "symbol": "XEM/BTC", "enabled": True},
+        {"id": 7, "symbol": "OLD/BTC", "enabled": False},
+    ]
+    registry = CurrencyPairRegistry(db)
+
+    await registry.refresh()
+
+    assert registry.symbols == {"XEM/BTC"}
+    assert "OLD/BTC" not in registry
+    assert registry.id("OLD/BTC") == 7
+
+
+@pytest.mark.asyncio
+async def test_refresh_if_stale():
+    now = 0.0
+    db = MagicMock(Database)
+    db.fetch_all.return_value = []
+    registry = CurrencyPairRegistry(db, refresh_seconds=60, clock=lambda: now)
+
+    await registry.refresh_if_stale()
+    now = 30
+    await registry.refresh_if_stale()
+    assert db.fetch_all.call_count == 1
+
+    now = 60
+    await registry.refresh_if_stale()
+    assert db.fetch_all.call_count == 2
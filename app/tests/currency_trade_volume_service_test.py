@@ -2,6 +2,13 @@ import asyncio
 from mock import MagicMock
 
 import pytest
+from app.alert_dispatcher import Alert, AlertDispatcher
+from app.alert_state import AlertStateTracker
+from app.alert_thresholds import AlertMetric, AlertThresholds
+from app.currency_pair_registry import (
+    CurrencyPairRegistry,
+    UnknownCurrencyPairException,
+)
 from app.currency_trade_volume_service import (
     CurrencyTradeVolumeService,
     PairNotFoundException,
@@ -15,12 +22,22 @@ from app.currency_trade_volume_store import (
 )
 from app.livecoin_api import LivecoinApi
 from app.mailer import Mailer
-from app.types import CurrencyTradeVolumeRecord
-from datetime import datetime
+from app.read_router import ReadRouter
+from app.snapshot_cache import InMemorySnapshotCache
+from app.types import (
+    CurrencyTradeVolumeRecord,
+    HistoryResolution,
+    VolumeRollupRecord,
+)
+from app.volume_rollup_store import VolumeRollupStore
+from app.volume_statistics import VolumeMetric
+from app.volume_updates import VolumeTick, VolumeUpdatePublisher
+from datetime import datetime, timedelta
 
 JAN_1ST = datetime(year=1970, day=1, month=1)
 
 mock_store = MagicMock(CurrencyTradeVolumeStore)
+mock_store.is_behind.return_value = False
 mock_api = MagicMock(LivecoinApi)
 mock_mailer = MagicMock(Mailer)
 
@@ -43,6 +60,27 @@ async def service():
     mock_mailer.reset_mock()
 
 
+@pytest.fixture
+async def make_service():
+    """
+    For tests that need to pass extra dependencies to the service
+    """
+
+    def make(**kwargs) -> CurrencyTradeVolumeService:
+        return CurrencyTradeVolumeService(
+            store=mock_store,
+            api=mock_api,
+            mailer=mock_mailer,
+            notify_emails=NOTIFY_EMAILS,
+            **kwargs,
+        )
+
+    yield make
+    mock_store.reset_mock()
+    mock_api.reset_mock()
+    mock_mailer.reset_mock()
+
+
 @pytest.mark.asyncio
 async def test_alert_on_trade_volume_spike(service: CurrencyTradeVolumeService):
     """
@@ -63,6 +101,75 @@ async def test_alert_on_trade_volume_spike(service: CurrencyTradeVolumeService):
     mock_mailer.send_mail.assert_called_once_with(
         NOTIFY_EMAILS[0], "CryptoTracker Alert", "currency_pair is trading at 300"
     )
+    mock_store.refresh_currency_pair_ranks.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_volume_statistics_are_computed_once_per_tick(make_service):
+    service = make_service(
+        alert_thresholds=AlertThresholds(metric=AlertMetric.Z_SCORE),
+        rank_metric=VolumeMetric.Z_SCORE,
+    )
+    mock_api.fetch_trade_volumes.return_value = []
+    mock_store.get_currency_pair_averages.return_value = []
+    mock_store.get_volume_statistics.return_value = {}
+
+    await service.update_trade_volumes()
+
+    mock_store.get_volume_statistics.assert_awaited_once()
+    # The ranks reuse the alerts' statistics instead of scanning the window again
+    mock_store.refresh_currency_pair_ranks.assert_awaited_once_with(
+        VolumeMetric.Z_SCORE, {}
+    )
+
+
+@pytest.mark.asyncio
+async def test_alert_queued_when_dispatcher_is_given(make_service):
+    mock_dispatcher = MagicMock(AlertDispatcher)
+    service = make_service(alert_dispatcher=mock_dispatcher)
+    mock_api.fetch_trade_volumes.return_value = [
+        CurrencyTradeVolumeRecord(
+            time=JAN_1ST, currency_pair="currency_pair", volume=300
+        )
+    ]
+    mock_store.get_currency_pair_averages.return_value = [
+        CurrencyPairAvg("currency_pair", avg_volume=100)
+    ]
+
+    await service.update_trade_volumes()
+
+    mock_dispatcher.enqueue.assert_called_once_with(
+        Alert(NOTIFY_EMAILS, "CryptoTracker Alert", "currency_pair is trading at 300")
+    )
+    mock_mailer.send_mail.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_sustained_spike_alerts_once_as_a_digest(make_service):
+    mock_dispatcher = MagicMock(AlertDispatcher)
+    service = make_service(
+        alert_dispatcher=mock_dispatcher,
+        alert_tracker=AlertStateTracker(cooldown=timedelta(hours=1), rearm_ratio=0.67),
+    )
+    mock_api.fetch_trade_volumes.return_value = [
+        CurrencyTradeVolumeRecord(time=JAN_1ST, currency_pair="first", volume=300),
+        CurrencyTradeVolumeRecord(time=JAN_1ST, currency_pair="second", volume=500),
+    ]
+    mock_store.get_currency_pair_averages.return_value = [
+        CurrencyPairAvg("first", avg_volume=100),
+        CurrencyPairAvg("second", avg_volume=100),
+    ]
+
+    await service.update_trade_volumes()
+    await service.update_trade_volumes()
+
+    mock_dispatcher.enqueue.assert_called_once_with(
+        Alert(
+            NOTIFY_EMAILS,
+            "CryptoTracker Alert",
+            "first is trading at 300<br>second is trading at 500",
+        )
+    )
 
 
 @pytest.mark.asyncio
@@ -99,23 +206,26 @@ async def test_no_alert_on_zero_trade_volume(service: CurrencyTradeVolumeService
 
 @pytest.mark.asyncio
 async def test_snapshot_missing_rank(service: CurrencyTradeVolumeService):
-    mock_store.get_currency_pair_ranks.return_value = []
+    mock_store.get_currency_pair_rank.return_value = None
     mock_store.get_currency_pair_history.return_value = []
 
     with pytest.raises(PairNotFoundException):
         await service.get_currency_pair_snapshot(CurrencyPair.DGB_TO_BTC)
 
 
+@pytest.mark.asyncio
+async def test_snapshot_untracked_pair(service: CurrencyTradeVolumeService):
+    with pytest.raises(UnknownCurrencyPairException):
+        await service.get_currency_pair_snapshot("NOT/TRACKED")
+
+    mock_store.get_currency_pair_history.assert_not_called()
+
+
 @pytest.mark.asyncio
 async def test_get_snapshot_valid_rank(service: CurrencyTradeVolumeService):
-    mock_store.get_currency_pair_ranks.return_value = [
-        CurrencyPairRank(
-            rank=1, currency_pair=CurrencyPair.DGB_TO_BTC, volume_std_dev=300
-        ),
-        CurrencyPairRank(
-            rank=2, currency_pair=CurrencyPair.OTON_TO_BTC, volume_std_dev=100
-        ),
-    ]
+    mock_store.get_currency_pair_rank.return_value = CurrencyPairRank(
+        rank=1, currency_pair=CurrencyPair.DGB_TO_BTC, volume_std_dev=300
+    )
 
     history = [
         CurrencyTradeVolumeRecord(
@@ -126,3 +236,233 @@ async def test_get_snapshot_valid_rank(service: CurrencyTradeVolumeService):
     snapshot = await service.get_currency_pair_snapshot(CurrencyPair.DGB_TO_BTC)
 
     assert snapshot == CurrencyPairSnapshot(CurrencyPair.DGB_TO_BTC, history, 1, 3)
+    # Ranks are computed at ingest, reads only look up the requested pair
+    mock_store.get_currency_pair_rank.assert_called_once_with(CurrencyPair.DGB_TO_BTC)
+    mock_store.get_currency_pair_ranks.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_snapshots_for_a_new_generation_are_read_past_the_tick(make_service):
+    reads = MagicMock(ReadRouter)
+    cache = InMemorySnapshotCache(max_size=10, ttl_seconds=60)
+    service = make_service(snapshot_cache=cache, reads=reads)
+    mock_store.get_currency_pair_rank.return_value = CurrencyPairRank(
+        rank=1, currency_pair=CurrencyPair.DGB_TO_BTC, volume_std_dev=300
+    )
+    mock_store.get_currency_pair_history.return_value = []
+
+    await service.get_currency_pair_snapshot(CurrencyPair.DGB_TO_BTC)
+    await service.get_currency_pair_snapshot(CurrencyPair.XEM_TO_BTC)
+    await service.get_currency_pair_snapshot(CurrencyPair.DGB_TO_BTC)
+    # Only once per generation, and not for cache hits
+    assert reads.sync_with_primary.await_count == 1
+
+    await cache.invalidate()
+    await service.get_currency_pair_snapshot(CurrencyPair.DGB_TO_BTC)
+    assert reads.sync_with_primary.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_snapshots_are_not_cached_while_the_store_is_behind(make_service):
+    cache = InMemorySnapshotCache(max_size=10, ttl_seconds=60)
+    service = make_service(snapshot_cache=cache)
+    mock_store.get_currency_pair_rank.return_value = CurrencyPairRank(
+        rank=1, currency_pair=CurrencyPair.DGB_TO_BTC, volume_std_dev=300
+    )
+    mock_store.get_currency_pair_history.return_value = []
+    mock_store.get_currency_pair_ranks_by_pair.return_value = {
+        CurrencyPair.XEM_TO_BTC: CurrencyPairRank(
+            rank=2, currency_pair=CurrencyPair.XEM_TO_BTC, volume_std_dev=100
+        )
+    }
+    mock_store.get_currency_pair_histories.return_value = {CurrencyPair.XEM_TO_BTC: []}
+    mock_store.is_behind.return_value = True
+
+    try:
+        await service.get_currency_pair_snapshot(CurrencyPair.DGB_TO_BTC)
+        await service.get_currency_pair_snapshots([CurrencyPair.XEM_TO_BTC])
+    finally:
+        mock_store.is_behind.return_value = False
+
+    # Built from history that predates the tick, caching them would keep it under the new generation
+    assert (await cache.get(CurrencyPair.DGB_TO_BTC + "@raw")).snapshot is None
+    assert (await cache.get(CurrencyPair.XEM_TO_BTC + "@raw")).snapshot is None
+
+
+@pytest.mark.asyncio
+async def test_get_snapshot_picks_rollup_resolution_for_max_points(make_service):
+    mock_rollup_store = MagicMock(VolumeRollupStore)
+    service = make_service(rollup_store=mock_rollup_store)
+    mock_store.get_currency_pair_rank.return_value = CurrencyPairRank(
+        rank=1, currency_pair=CurrencyPair.DGB_TO_BTC, volume_std_dev=300
+    )
+    history = [
+        VolumeRollupRecord(
+            time=JAN_1ST,
+            currency_pair=CurrencyPair.DGB_TO_BTC,
+            volume=200,
+            min_volume=100,
+            max_volume=300,
+            last_volume=150,
+        )
+    ]
+    mock_rollup_store.get_rollup_history.return_value = history
+
+    # 24 hours of 5 minute buckets is 288 points, 1 minute buckets would be too many
+    snapshot = await service.get_currency_pair_snapshot(
+        CurrencyPair.DGB_TO_BTC, max_points=300
+    )
+
+    mock_rollup_store.get_rollup_history.assert_called_once_with(
+        CurrencyPair.DGB_TO_BTC, HistoryResolution.FIVE_MINUTES
+    )
+    mock_store.get_currency_pair_history.assert_not_called()
+    assert snapshot == CurrencyPairSnapshot(
+        CurrencyPair.DGB_TO_BTC, history, 1, 3, HistoryResolution.FIVE_MINUTES
+    )
+
+
+@pytest.mark.asyncio
+async def test_shard_update_only_records_its_pairs(make_service):
+    service = make_service(
+        registry=CurrencyPairRegistry.from_pairs(["XEM/BTC", "OTON/BTC", "DGB/BTC"])
+    )
+    mock_api.fetch_trade_volumes.return_value = [
+        CurrencyTradeVolumeRecord(time=JAN_1ST, currency_pair="OTON/BTC", volume=300)
+    ]
+
+    await service.update_trade_volume_shards({0}, 2)
+
+    mock_api.fetch_trade_volumes.assert_called_once_with({"OTON/BTC"})
+    mock_store.record_trade_volumes.assert_called_once()
+    # Alerts wait until every shard of the tick is in
+    mock_store.get_currency_pair_averages.assert_not_called()
+    mock_mailer.send_mail.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_finalize_tick_alerts_on_latest_volumes_of_every_shard(make_service):
+    service = make_service()
+    mock_store.get_trade_volumes_since.return_value = [
+        CurrencyTradeVolumeRecord(time=JAN_1ST, currency_pair="XEM/BTC", volume=300),
+        CurrencyTradeVolumeRecord(
+            time=JAN_1ST + timedelta(seconds=1), currency_pair="XEM/BTC", volume=100
+        ),
+        CurrencyTradeVolumeRecord(time=JAN_1ST, currency_pair="DGB/BTC", volume=500),
+    ]
+    mock_store.get_currency_pair_averages.return_value = [
+        CurrencyPairAvg("XEM/BTC", avg_volume=100),
+        CurrencyPairAvg("DGB/BTC", avg_volume=100),
+    ]
+
+    await service.finalize_tick(JAN_1ST)
+
+    mock_store.get_trade_volumes_since.assert_called_once_with(JAN_1ST)
+    mock_api.fetch_trade_volumes.assert_not_called()
+    mock_mailer.send_mail.assert_called_once_with(
+        NOTIFY_EMAILS[0], "CryptoTracker Alert", "DGB/BTC is trading at 500"
+    )
+
+
+@pytest.mark.asyncio
+async def test_snapshot_updated_at_comes_from_the_rank(
+    service: CurrencyTradeVolumeService,
+):
+    mock_store.get_currency_pair_rank.return_value = CurrencyPairRank(
+        rank=1,
+        currency_pair=CurrencyPair.DGB_TO_BTC,
+        volume_std_dev=300,
+        computed_at=JAN_1ST,
+    )
+
+    assert await service.get_snapshot_updated_at(CurrencyPair.DGB_TO_BTC) == JAN_1ST
+    mock_store.get_currency_pair_history.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_snapshots_loads_every_pair_with_one_query(
+    service: CurrencyTradeVolumeService,
+):
+    mock_store.get_currency_pair_ranks_by_pair.return_value = {
+        CurrencyPair.DGB_TO_BTC: CurrencyPairRank(
+            rank=1, currency_pair=CurrencyPair.DGB_TO_BTC, volume_std_dev=300
+        ),
+        CurrencyPair.XEM_TO_BTC: CurrencyPairRank(
+            rank=2, currency_pair=CurrencyPair.XEM_TO_BTC, volume_std_dev=100
+        ),
+    }
+    dgb_history = [
+        CurrencyTradeVolumeRecord(
+            currency_pair=CurrencyPair.DGB_TO_BTC, time=JAN_1ST, volume=200
+        )
+    ]
+    xem_history = [
+        CurrencyTradeVolumeRecord(
+            currency_pair=CurrencyPair.XEM_TO_BTC, time=JAN_1ST, volume=100
+        )
+    ]
+    mock_store.get_currency_pair_histories.return_value = {
+        CurrencyPair.DGB_TO_BTC: dgb_history,
+        CurrencyPair.XEM_TO_BTC: xem_history,
+    }
+
+    snapshots = await service.get_currency_pair_snapshots(
+        [
+            CurrencyPair.XEM_TO_BTC,
+            CurrencyPair.OTON_TO_BTC,
+            CurrencyPair.DGB_TO_BTC,
+            CurrencyPair.XEM_TO_BTC,
+        ]
+    )
+
+    # In the order they were asked for, without duplicates or the pair that has no rank yet
+    assert snapshots == [
+        CurrencyPairSnapshot(CurrencyPair.XEM_TO_BTC, xem_history, 2, 3),
+        CurrencyPairSnapshot(CurrencyPair.DGB_TO_BTC, dgb_history, 1, 3),
+    ]
+    mock_store.get_currency_pair_ranks_by_pair.assert_called_once_with(
+        [CurrencyPair.XEM_TO_BTC, CurrencyPair.OTON_TO_BTC, CurrencyPair.DGB_TO_BTC]
+    )
+    mock_store.get_currency_pair_histories.assert_called_once_with(
+        [CurrencyPair.XEM_TO_BTC, CurrencyPair.DGB_TO_BTC]
+    )
+    mock_store.get_currency_pair_history.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_snapshots_untracked_pair(service: CurrencyTradeVolumeService):
+    with pytest.raises(UnknownCurrencyPairException):
+        await service.get_currency_pair_snapshots(
+            [CurrencyPair.DGB_TO_BTC, "NOT/TRACKED"]
+        )
+
+    mock_store.get_currency_pair_ranks_by_pair.assert_not_called()
+    mock_store.get_currency_pair_histories.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_tick_is_published_with_the_refreshed_ranks(make_service):
+    mock_publisher = MagicMock(VolumeUpdatePublisher)
+    service = make_service(update_publisher=mock_publisher)
+    trade_volumes = [
+        CurrencyTradeVolumeRecord(
+            time=JAN_1ST, currency_pair=CurrencyPair.DGB_TO_BTC, volume=200
+        )
+    ]
+    ranks = [
+        CurrencyPairRank(
+            rank=1,
+            currency_pair=CurrencyPair.DGB_TO_BTC,
+            volume_std_dev=300,
+            computed_at=JAN_1ST,
+        )
+    ]
+    mock_api.fetch_trade_volumes.return_value = trade_volumes
+    mock_store.get_currency_pair_averages.return_value = []
+    mock_store.get_latest_currency_pair_ranks.return_value = ranks
+
+    await service.update_trade_volumes()
+
+    mock_publisher.publish.assert_called_once_with(
+        VolumeTick(trade_volumes, ranks, 3, JAN_1ST)
+    )
@@ -0,0 +1,76 @@
+from datetime import datetime
+from mock import AsyncMock, MagicMock
+
+import pytest
+from databases import Database
+
+from app.currency_pair_registry import CurrencyPairRegistry
+from app.currency_trade_volume_store import CurrencyTradeVolumeStore
+from app.types import CurrencyTradeVolumeRecord
+
+JAN_1ST = datetime(year=1970, day=1, month=1)
+
+
+@pytest.fixture
+def db():
+    db = MagicMock(Database)
+    db.execute = AsyncMock()
+    return db
+
+
+@pytest.mark.asyncio
+async def test_record_trade_volumes_batches_inserts(db: MagicMock):
+    pairs = [f"pair_{i}" for i in range(5)]
+    store = CurrencyTradeVolumeStore(
+        db, CurrencyPairRegistry.from_pairs(pairs), insert_batch_size=2
+    )
+    records = [
+        CurrencyTradeVolumeRecord(JAN_1ST, pair, volume=i)
+        for i, pair in enumerate(pairs)
+    ]
+
+    result = await store.record_trade_volumes(records)
+
+    assert result.rows == 5
+    batch_sizes = [len(call.args[1]) // 3 for call in db.execute.call_args_list]
+    assert batch_sizes == [2, 2, 1]
+    last_query, last_values = db.execute.call_args_list[-1].args
+    assert last_query.count("(:fetch_time_") == 1
+    assert last_values == {
+        "fetch_time_0": JAN_1ST,
+        "volume_0": 4,
+        "currency_pair_id_0": 5,
+    }
+    db.transaction.assert_called_once()
+
+
+def test_rejects_batches_over_parameter_limit(db: MagicMock):
+    with pytest.raises(ValueError):
+        CurrencyTradeVolumeStore(
+            db, CurrencyPairRegistry.from_pairs([]), insert_batch_size=20000
+        )
+
+
+@pytest.mark.asyncio
+async def test_volume_statistics_are_aggregated_by_postgres(db: MagicMock):
+    store = CurrencyTradeVolumeStore(db, CurrencyPairRegistry.from_pairs(["XEM/BTC"]))
+    db.fetch_all = AsyncMock(
+        return_value=[
+            {
+                "currency_pair": "XEM/BTC",
+                "count": 3,
+                "mean": 200.0,
+                "std_dev": 100.0,
+                "latest": 300.0,
+                "ewma": 210.0,
+                "percentile": 290.0,
+            }
+        ]
+    )
+
+    statistics = await store.get_volume_statistics()
+
+    # A row per currency pair rather than every sample in the window
+    assert statistics["XEM/BTC"].z_score == 1
+    assert statistics["XEM/BTC"].coefficient_of_variation == 0.5
+    assert db.fetch_all.call_args.args[1] == {"decay": 0.9, "fraction": 0.95}
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from app.db_pool import ConnectionBudget, _InstrumentedPool
+
+
+def test_budget_splits_connections_between_processes():
+    budget = ConnectionBudget(
+        max_connections=20, web_workers=4, ingest_processes=2, reserved=2
+    )
+
+    assert budget.pool_max_size() == 3
+
+
+def test_budget_rejects_more_processes_than_connections():
+    with pytest.raises(ValueError):
+        ConnectionBudget(max_connections=4, web_workers=4, reserved=1).pool_max_size()
+
+
+class FakePool:
+    def __init__(self, size: int):
+        self._free = asyncio.Semaphore(size)
+
+    async def acquire(self, timeout=None):
+        await asyncio.wait_for(self._free.acquire(), timeout)
+        return object()
+
+    async def release(self, connection):
+        self._free.release()
+
+
+@pytest.mark.asyncio
+async def test_instrumented_pool_counts_waits_and_timeouts():
+    pool = _InstrumentedPool(FakePool(1), acquire_timeout_seconds=0.01)
+
+    connection = await pool.acquire()
+    with pytest.raises(asyncio.TimeoutError):
+        await pool.acquire()
+    assert pool.in_use == 1
+    await pool.release(connection)
+
+    await pool.acquire()
+    assert pool.acquisitions == 2
+    assert pool.timeouts == 1
+    assert pool.waiting == 0
+    assert pool.in_use == 1
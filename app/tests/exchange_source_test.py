@@ -0,0 +1,84 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import AbstractSet, List
+
+import pytest
+
+from app.exchange_source import (
+    ApiUnavailableException,
+    CompositeExchangeSource,
+    ExchangeSource,
+    RegisteredSource,
+)
+from app.types import CurrencyTradeVolumeRecord
+
+JAN_1ST = datetime(year=1970, day=1, month=1)
+PAIRS = {"XEM/BTC", "DGB/BTC"}
+
+
+class FakeSource(ExchangeSource):
+    def __init__(self, name: str, volume: float, delay: float = 0, fail=False):
+        self.name = name
+        self._volume = volume
+        self._delay = delay
+        self._fail = fail
+
+    async def fetch_trade_volumes(
+        self, currency_pairs: AbstractSet[str]
+    ) -> List[CurrencyTradeVolumeRecord]:
+        await asyncio.sleep(self._delay)
+        if self._fail:
+            raise ApiUnavailableException()
+        return [
+            CurrencyTradeVolumeRecord(JAN_1ST, pair, self._volume)
+            for pair in sorted(currency_pairs)
+        ]
+
+
+def volumes(records: List[CurrencyTradeVolumeRecord]):
+    return sorted((record.currency_pair, record.volume) for record in records)
+
+
+@pytest.mark.asyncio
+async def test_fetches_concurrently_and_prefers_earlier_sources():
+    source = CompositeExchangeSource(
+        [
+            RegisteredSource(FakeSource("first", 1, delay=0.1), timeout_seconds=1),
+            RegisteredSource(FakeSource("second", 2, delay=0.1), timeout_seconds=1),
+        ]
+    )
+
+    start = time.perf_counter()
+    records = await source.fetch_trade_volumes(PAIRS)
+
+    assert time.perf_counter() - start < 0.19
+    assert volumes(records) == [("DGB/BTC", 1), ("XEM/BTC", 1)]
+
+
+@pytest.mark.asyncio
+async def test_failed_and_slow_sources_are_skipped():
+    source = CompositeExchangeSource(
+        [
+            RegisteredSource(FakeSource("down", 1, fail=True), timeout_seconds=1),
+            RegisteredSource(FakeSource("slow", 2, delay=10), timeout_seconds=0.05),
+            RegisteredSource(FakeSource("up", 3), timeout_seconds=1),
+        ]
+    )
+
+    records = await source.fetch_trade_volumes(PAIRS)
+
+    assert volumes(records) == [("DGB/BTC", 3), ("XEM/BTC", 3)]
+
+
+@pytest.mark.asyncio
+async def test_unavailable_when_every_source_fails():
+    source = CompositeExchangeSource(
+        [
+            RegisteredSource(FakeSource("down", 1, fail=True), timeout_seconds=1),
+            RegisteredSource(FakeSource("slow", 2, delay=10), timeout_seconds=0.05),
+        ]
+    )
+
+    with pytest.raises(ApiUnavailableException):
+        await source.fetch_trade_volumes(PAIRS)
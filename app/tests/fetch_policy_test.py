@@ -0,0 +1,68 @@
+import pytest
+
+from app.fetch_policy import RetryPolicy, TokenBucket
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_allows_bursts_then_paces_calls():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_second=2, capacity=3, clock=clock, sleep=clock.sleep)
+
+    call_times = []
+    for _ in range(5):
+        await bucket.acquire()
+        call_times.append(clock.now)
+
+    assert call_times == [0, 0, 0, 0.5, 1.0]
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_refills_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_second=1, capacity=2, clock=clock, sleep=clock.sleep)
+    await bucket.acquire()
+    await bucket.acquire()
+
+    clock.now = 100
+    await bucket.acquire()
+    await bucket.acquire()
+    await bucket.acquire()
+
+    assert clock.now == 101
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_shared_between_processes():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_second=2, capacity=4, clock=clock, sleep=clock.sleep)
+
+    bucket.share(2)
+    call_times = []
+    for _ in range(4):
+        await bucket.acquire()
+        call_times.append(clock.now)
+    assert call_times == [0, 0, 1, 2]
+
+    # Back to the whole limit once the other process is gone
+    bucket.share(1)
+    assert bucket.rate_per_second == 2
+    assert bucket.capacity == 4
+
+
+def test_retry_backoff_is_capped():
+    policy = RetryPolicy(max_attempts=10, base_backoff_seconds=1, max_backoff_seconds=4)
+
+    for attempt in range(1, 10):
+        assert 0 <= policy.backoff_seconds(attempt) <= 4
+    assert policy.backoff_seconds(1, retry_after_seconds=60) == 4
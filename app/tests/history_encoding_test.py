@@ -0,0 +1,96 @@
+import gzip
+import json
+import struct
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from app.history_encoding import (
+    BINARY_MAGIC,
+    columnar_history,
+    compress,
+    delta_decode,
+    encode_binary_history,
+    negotiate_content_encoding,
+)
+from app.types import (
+    CurrencyPairSnapshot,
+    CurrencyTradeVolumeRecord,
+    HistoryResolution,
+    VolumeRollupRecord,
+)
+
+START = datetime(2020, 5, 1, tzinfo=timezone.utc)
+START_MS = int(START.timestamp() * 1000)
+
+
+def make_snapshot() -> CurrencyPairSnapshot:
+    history = [
+        CurrencyTradeVolumeRecord(START + timedelta(minutes=i), "XEM/BTC", 1000 + i * 5)
+        for i in range(3)
+    ]
+    return CurrencyPairSnapshot(
+        "XEM/BTC", history, rank=2, total_tracked_currency_pairs=3
+    )
+
+
+def test_columnar_history():
+    columnar = columnar_history(make_snapshot())
+
+    assert columnar["rank"] == 2
+    assert columnar["resolution"] == "raw"
+    assert columnar["columns"] == {
+        "time": [START_MS, START_MS + 60_000, START_MS + 120_000],
+        "volume": [1000, 1005, 1010],
+    }
+
+
+def test_delta_encoded_columns_decode_to_the_original():
+    columns = columnar_history(make_snapshot(), delta=True)["columns"]
+
+    assert columns["time"] == [START_MS, 60_000, 60_000]
+    assert columns["volume"] == [1000, 5, 5]
+    assert delta_decode(columns["volume"]) == [1000, 1005, 1010]
+
+
+def test_rollup_columns():
+    snapshot = CurrencyPairSnapshot(
+        "XEM/BTC",
+        [VolumeRollupRecord(START, "XEM/BTC", 1.5, 1, 2, 2)],
+        rank=1,
+        total_tracked_currency_pairs=1,
+        resolution=HistoryResolution.ONE_HOUR,
+    )
+
+    columns = columnar_history(snapshot)["columns"]
+
+    assert columns["volume"] == [1.5]
+    assert columns["last_volume"] == [2]
+
+
+def test_binary_history_layout():
+    body = encode_binary_history(make_snapshot(), delta=True)
+
+    assert body[:4] == BINARY_MAGIC
+    version, metadata_length = struct.unpack_from("<BI", body, 4)
+    metadata = json.loads(body[9 : 9 + metadata_length])
+    assert version == 1
+    assert metadata["columns"] == ["time", "volume"]
+    assert metadata["points"] == 3
+
+    offset = 9 + metadata_length
+    times = array("q", body[offset : offset + 24])
+    volumes = array("d", body[offset + 24 :])
+    assert list(times) == [START_MS, 60_000, 60_000]
+    assert list(volumes) == [1000.0, 5.0, 5.0]
+
+
+def test_negotiate_content_encoding():
+    assert negotiate_content_encoding(None) is None
+    assert negotiate_content_encoding("identity") is None
+    assert negotiate_content_encoding("gzip, deflate") == "gzip"
+    assert negotiate_content_encoding("gzip;q=0") is None
+    assert negotiate_content_encoding("*") in ("br", "gzip")
+
+
+def test_gzip_round_trip():
+    assert gzip.decompress(compress(b"volume" * 100, "gzip")) == b"volume" * 100
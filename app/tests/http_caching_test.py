@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+
+from app.http_caching import cache_headers, is_not_modified, make_etag
+
+UPDATED_AT = datetime(2020, 5, 1, 12, 0, 30, 250000, tzinfo=timezone.utc)
+
+
+def test_cache_headers_expire_at_next_tick():
+    headers = cache_headers(UPDATED_AT, 60, now=UPDATED_AT + timedelta(seconds=15))
+
+    assert headers["ETag"] == make_etag(UPDATED_AT)
+    assert headers["Last-Modified"] == "Fri, 01 May 2020 12:00:30 GMT"
+    assert headers["Cache-Control"] == "public, max-age=45"
+
+
+def test_overdue_tick_is_revalidated():
+    headers = cache_headers(UPDATED_AT, 60, now=UPDATED_AT + timedelta(minutes=5))
+
+    assert headers["Cache-Control"] == "public, max-age=0"
+
+
+def test_if_none_match():
+    etag = make_etag(UPDATED_AT)
+
+    assert is_not_modified({"if-none-match": etag}, UPDATED_AT)
+    assert is_not_modified({"if-none-match": f'"other", {etag[2:]}'}, UPDATED_AT)
+    assert not is_not_modified(
+        {"if-none-match": etag}, UPDATED_AT + timedelta(minutes=1)
+    )
+    # If-None-Match wins over If-Modified-Since
+    assert not is_not_modified(
+        {
+            "if-none-match": '"other"',
+            "if-modified-since": "Fri, 01 May 2020 12:00:30 GMT",
+        },
+        UPDATED_AT,
+    )
+
+
+def test_if_modified_since():
+    assert is_not_modified(
+        {"if-modified-since": "Fri, 01 May 2020 12:00:30 GMT"}, UPDATED_AT
+    )
+    assert not is_not_modified(
+        {"if-modified-since": "Fri, 01 May 2020 12:00:29 GMT"}, UPDATED_AT
+    )
+    assert not is_not_modified({"if-modified-since": "yesterday"}, UPDATED_AT)
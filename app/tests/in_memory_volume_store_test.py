@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from databases import Database
+from mock import AsyncMock, MagicMock
+
+from app.currency_pair_registry import (
+    CurrencyPairRegistry,
+    UnknownCurrencyPairException,
+)
+from app.currency_trade_volume_store import CurrencyPairAvg, CurrencyPairRank
+from app.in_memory_volume_store import InMemoryTradeVolumeStore, VolumeRingBuffer
+from app.types import CurrencyTradeVolumeRecord
+from app.volume_statistics import VolumeMetric
+
+MINUTE = 60 * 1_000_000
+
+
+@pytest.fixture
+def db():
+    db = MagicMock(Database)
+    db.execute = AsyncMock()
+    db.fetch_all = AsyncMock(return_value=[])
+    return db
+
+
+def test_ring_buffer_overwrites_samples_outside_the_window():
+    buffer = VolumeRingBuffer(timedelta(minutes=3), capacity=4)
+    for minute in range(10):
+        buffer.append(minute * MINUTE, minute)
+
+    # Minutes 6 to 9 are within 3 minutes of the newest, so the buffer never had to grow
+    assert buffer.capacity == 4
+    times, volumes = buffer.since(0)
+    assert list(times) == [minute * MINUTE for minute in range(6, 10)]
+    assert list(volumes) == [6.0, 7.0, 8.0, 9.0]
+
+
+def test_ring_buffer_grows_when_every_sample_is_in_the_window():
+    buffer = VolumeRingBuffer(timedelta(hours=1), capacity=2)
+    for minute in range(5):
+        buffer.append(minute * MINUTE, minute)
+
+    assert buffer.capacity == 8
+    assert list(buffer.since(2 * MINUTE)[1]) == [2.0, 3.0, 4.0]
+
+
+def test_ring_buffer_since_across_the_wrap_around():
+    buffer = VolumeRingBuffer(timedelta(minutes=3), capacity=4)
+    for minute in range(6):
+        buffer.append(minute * MINUTE, minute)
+
+    assert list(buffer.since(4 * MINUTE)[1]) == [4.0, 5.0]
+    assert list(buffer.since(3 * MINUTE + 1)[1]) == [4.0, 5.0]
+    assert list(buffer.since(6 * MINUTE)[1]) == []
+
+
+def test_ring_buffer_skips_samples_that_are_not_newer():
+    buffer = VolumeRingBuffer(timedelta(hours=1))
+    assert buffer.append(MINUTE, 1)
+    assert not buffer.append(MINUTE, 2)
+    assert not buffer.append(0, 3)
+    assert len(buffer) == 1
+
+
+@pytest.mark.asyncio
+async def test_history_averages_and_ranks_come_from_memory(db: MagicMock):
+    store = InMemoryTradeVolumeStore(
+        db, CurrencyPairRegistry.from_pairs(["XEM/BTC", "DGB/BTC", "OTON/BTC"])
+    )
+    now = datetime.now(timezone.utc)
+    records = [
+        CurrencyTradeVolumeRecord(now - timedelta(hours=25), "XEM/BTC", 1000),
+        CurrencyTradeVolumeRecord(now - timedelta(hours=2), "XEM/BTC", 100),
+        CurrencyTradeVolumeRecord(now - timedelta(minutes=30), "XEM/BTC", 200),
+        CurrencyTradeVolumeRecord(now, "XEM/BTC", 300),
+        CurrencyTradeVolumeRecord(now, "DGB/BTC", 50),
+    ]
+
+    await store.record_trade_volumes(records)
+
+    assert db.execute.call_count == 1
+    assert await store.get_currency_pair_history("XEM/BTC") == records[1:4]
+    assert await store.get_currency_pair_histories(["DGB/BTC", "OTON/BTC"]) == {
+        "DGB/BTC": [records[4]],
+        "OTON/BTC": [],
+    }
+    assert await store.get_currency_pair_averages() == [
+        CurrencyPairAvg("XEM/BTC", 250),
+        CurrencyPairAvg("DGB/BTC", 50),
+    ]
+    assert await store.get_currency_pair_ranks() == [
+        CurrencyPairRank(rank=1, currency_pair="DGB/BTC", volume_std_dev=None),
+        CurrencyPairRank(rank=2, currency_pair="XEM/BTC", volume_std_dev=100),
+    ]
+    db.fetch_all.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_load_and_catch_up_from_the_database(db: MagicMock):
+    registry = CurrencyPairRegistry.from_pairs(["XEM/BTC"])
+    store = InMemoryTradeVolumeStore(db, registry)
+    now = datetime.now(timezone.utc)
+    db.fetch_all.return_value = [
+        {"currency_pair_id": 1, "fetch_time": now - timedelta(minutes=1), "volume": 1}
+    ]
+
+    await store.load()
+    db.fetch_all.return_value = [
+        {"currency_pair": "XEM/BTC", "fetch_time": now, "volume": 2}
+    ]
+    await store.get_trade_volumes_since(now)
+
+    assert await store.get_currency_pair_history("XEM/BTC") == [
+        CurrencyTradeVolumeRecord(now - timedelta(minutes=1), "XEM/BTC", 1),
+        CurrencyTradeVolumeRecord(now, "XEM/BTC", 2),
+    ]
+    with pytest.raises(UnknownCurrencyPairException):
+        await store.get_currency_pair_history("NOT/TRACKED")
+
+
+@pytest.mark.asyncio
+async def test_behind_checks_for_samples_newer_than_memory(db: MagicMock):
+    registry = CurrencyPairRegistry.from_pairs(["XEM/BTC"])
+    store = InMemoryTradeVolumeStore(db, registry)
+    now = datetime.now(timezone.utc)
+    db.fetch_all.return_value = [
+        {"currency_pair": "XEM/BTC", "fetch_time": now, "volume": 1}
+    ]
+    await store.get_trade_volumes_since(now - timedelta(minutes=1))
+    db.fetch_val = AsyncMock(return_value=True)
+
+    assert await store.is_behind()
+    # Compared to the newest sample in memory, not to the time of the check
+    assert db.fetch_val.call_args.args[1] == {"since": now}
+
+
+@pytest.mark.asyncio
+async def test_refresh_ranks_by_metric_from_memory(db: MagicMock):
+    pytest.importorskip("numpy")
+    store = InMemoryTradeVolumeStore(
+        db, CurrencyPairRegistry.from_pairs(["XEM/BTC", "DGB/BTC"])
+    )
+    now = datetime.now(timezone.utc)
+    await store.record_trade_volumes(
+        [
+            CurrencyTradeVolumeRecord(now - timedelta(minutes=minutes), pair, volume)
+            for pair, volumes in [
+                ("XEM/BTC", [100, 900, 100]),
+                ("DGB/BTC", [10, 20, 90]),
+            ]
+            for minutes, volume in zip([2, 1, 0], volumes)
+        ]
+    )
+    db.execute.reset_mock()
+
+    await store.refresh_currency_pair_ranks(VolumeMetric.Z_SCORE)
+
+    # XEM/BTC varies more, but DGB/BTC's latest volume is the bigger outlier
+    delete, insert = db.execute.call_args_list
+    assert delete.args == ("DELETE FROM currency_pair_ranks",)
+    assert insert.args[1]["currency_pair_ids"] == [2, 1]
+    assert insert.args[1]["ranks"] == [1, 2]
+    db.fetch_all.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_disabled_currency_pairs_are_not_ranked(db: MagicMock):
+    registry = CurrencyPairRegistry(db)
+    db.fetch_all.return_value = [
+        {"id": 1, "symbol": "XEM/BTC", "enabled": True},
+        {"id": 2, "symbol": "DGB/BTC", "enabled": False},
+    ]
+    await registry.refresh()
+    store = InMemoryTradeVolumeStore(db, registry)
+    now = datetime.now(timezone.utc)
+
+    await store.record_trade_volumes(
+        [
+            CurrencyTradeVolumeRecord(now, "XEM/BTC", 100),
+            CurrencyTradeVolumeRecord(now, "DGB/BTC", 50),
+        ]
+    )
+
+    # Their history can still be read, but their rank would count against a total that leaves them out
+    assert await store.get_currency_pair_history("DGB/BTC") != []
+    assert await store.get_currency_pair_ranks() == [
+        CurrencyPairRank(rank=1, currency_pair="XEM/BTC", volume_std_dev=None)
+    ]
@@ -0,0 +1,85 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from app.ingest_scheduler import IngestScheduler, TickTiming
+
+INTERVAL = 0.05
+
+
+async def run_until(scheduler: IngestScheduler, timings: List[TickTiming], runs: int):
+    task = asyncio.ensure_future(scheduler.run())
+    while len(timings) < runs:
+        await asyncio.sleep(INTERVAL / 10)
+    scheduler.stop()
+    await task
+
+
+@pytest.mark.asyncio
+async def test_runs_on_schedule():
+    timings: List[TickTiming] = []
+
+    async def job():
+        await asyncio.sleep(INTERVAL / 2)
+
+    scheduler = IngestScheduler(job, INTERVAL, on_tick=timings.append)
+    await run_until(scheduler, timings, 3)
+
+    assert [timing.tick for timing in timings[:3]] == [0, 1, 2]
+    assert all(timing.skipped_ticks == 0 for timing in timings)
+    # Runs are scheduled from the start time, so time spent running isn't added to the next wait
+    assert all(timing.lag_seconds < INTERVAL / 2 for timing in timings)
+
+
+@pytest.mark.asyncio
+async def test_overrunning_job_skips_ticks_without_overlapping():
+    timings: List[TickTiming] = []
+    running = 0
+    max_running = 0
+
+    async def job():
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(INTERVAL * 2.5)
+        running -= 1
+
+    scheduler = IngestScheduler(job, INTERVAL, on_tick=timings.append)
+    await run_until(scheduler, timings, 2)
+
+    assert max_running == 1
+    assert timings[1].tick == 2
+    assert timings[1].skipped_ticks == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_run_does_not_stop_scheduler():
+    timings: List[TickTiming] = []
+
+    async def job():
+        raise RuntimeError()
+
+    scheduler = IngestScheduler(job, INTERVAL, on_tick=timings.append)
+    await run_until(scheduler, timings, 2)
+
+    assert not timings[0].succeeded
+    assert timings[1].tick == 1
+
+
+@pytest.mark.asyncio
+async def test_aligned_ticks_fall_on_interval_multiples():
+    timings: List[TickTiming] = []
+    scheduled: List[float] = []
+    loop = asyncio.get_running_loop()
+
+    async def job():
+        assert scheduler.scheduled_at is not None
+        scheduled.append(scheduler.scheduled_at)
+
+    scheduler = IngestScheduler(
+        job, INTERVAL, on_tick=timings.append, clock=loop.time, align_to_clock=True
+    )
+    await run_until(scheduler, timings, 2)
+
+    assert [round(at / INTERVAL, 6) % 1 for at in scheduled] == [0, 0]
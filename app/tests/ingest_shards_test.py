@@ -0,0 +1,92 @@
+from datetime import timedelta
+from mock import AsyncMock, MagicMock
+
+import pytest
+from databases import Database
+
+from app.ingest_shards import ShardCoordinator
+
+LEASE = timedelta(minutes=3)
+
+
+@pytest.fixture
+def db():
+    db = MagicMock(Database)
+    db.execute = AsyncMock()
+    db.fetch_val = AsyncMock()
+    db.fetch_all = AsyncMock()
+    return db
+
+
+@pytest.mark.asyncio
+async def test_hands_back_shards_over_its_share_after_ingesting_them(db: MagicMock):
+    coordinator = ShardCoordinator(db, "worker", 4, LEASE)
+    # A second worker joined, and may have already found no free shards this tick
+    db.fetch_val.return_value = 2
+    db.fetch_all.return_value = [{"shard": shard} for shard in (3, 0, 1, 2)]
+
+    shards = await coordinator.acquire_shards()
+
+    assert shards == [0, 1, 2, 3]
+    assert not any(
+        "DELETE FROM ingest_shard_leases" in call.args[0]
+        for call in db.execute.call_args_list
+    )
+
+    db.fetch_val.return_value = None
+    db.fetch_all.return_value = []
+    await coordinator.complete_shards(10, shards)
+
+    query, values = db.execute.call_args_list[-1].args
+    assert "DELETE FROM ingest_shard_leases" in query
+    assert values["shards"] == [2, 3]
+    # Only handed back once
+    db.execute.reset_mock()
+    await coordinator.complete_shards(11, [0, 1])
+    assert not any(
+        "DELETE FROM ingest_shard_leases" in call.args[0]
+        for call in db.execute.call_args_list
+    )
+
+
+@pytest.mark.asyncio
+async def test_claims_free_shards_up_to_its_share(db: MagicMock):
+    coordinator = ShardCoordinator(db, "worker", 4, LEASE)
+    db.fetch_val.return_value = 2
+    db.fetch_all.side_effect = [[{"shard": 3}], [{"shard": 1}]]
+
+    shards = await coordinator.acquire_shards()
+
+    assert shards == [1, 3]
+    assert db.fetch_all.call_args_list[-1].args[1]["wanted"] == 1
+    assert coordinator.live_workers == 2
+
+
+@pytest.mark.asyncio
+async def test_only_the_worker_completing_the_last_shard_finalizes(db: MagicMock):
+    coordinator = ShardCoordinator(db, "worker", 2, LEASE)
+    db.fetch_all.return_value = []
+
+    db.fetch_val.return_value = None
+    assert await coordinator.complete_shards(10, [0]) is None
+
+    db.fetch_val.return_value = 10
+    assert await coordinator.complete_shards(10, [1]) == 10
+
+
+@pytest.mark.asyncio
+async def test_ticks_missing_shards_are_finalized_after_the_deadline(db: MagicMock):
+    coordinator = ShardCoordinator(db, "worker", 2, LEASE, finalize_deadline_ticks=1)
+    # The worker holding shard 1 stopped, its lease hasn't expired yet
+    db.fetch_val.return_value = None
+    db.fetch_all.return_value = [{"tick": 9, "shard_count": 2, "completed": 1}]
+
+    assert await coordinator.complete_shards(10, [0]) == 9
+    sweep_query, sweep_values = db.fetch_all.call_args.args
+    assert "finalized_at IS NULL" in sweep_query
+    assert sweep_values == {"deadline": 9}
+
+    # Finalizing the overdue tick covers a complete one after it
+    db.fetch_val.return_value = 11
+    db.fetch_all.return_value = [{"tick": 10, "shard_count": 2, "completed": 1}]
+    assert await coordinator.complete_shards(11, [0, 1]) == 10
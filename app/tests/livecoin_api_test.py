@@ -0,0 +1,263 @@
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+
+from app.fetch_policy import RetryPolicy, TokenBucket
+from app.livecoin_api import (
+    ApiUnavailableException,
+    FetchStrategy,
+    LivecoinApi,
+    iter_json_array,
+)
+
+TICKER = [
+    {"cur": "XEM", "symbol": "XEM/BTC", "last": 0.0000042, "volume": 1250.5},
+    {"cur": "ETH", "symbol": "ETH/BTC", "last": 0.021, "volume": 88},
+    {"cur": "DGB", "symbol": "DGB/BTC", "last": 0.0000001, "volume": 99999},
+]
+TRACKED = {"XEM/BTC", "DGB/BTC"}
+
+
+async def chunked(text: str, size: int) -> AsyncIterator[str]:
+    for offset in range(0, len(text), size):
+        yield text[offset : offset + size]
+
+
+async def collect(chunks: AsyncIterator[str]) -> List:
+    return [item async for item in iter_json_array(chunks)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 2, 7, 1000])
+async def test_iter_json_array_across_chunk_boundaries(size: int):
+    text = json.dumps(TICKER + [12345, "a, ] string"], indent=2)
+
+    assert await collect(chunked(text, size)) == TICKER + [12345, "a, ] string"]
+
+
+@pytest.mark.asyncio
+async def test_iter_json_array_empty():
+    assert await collect(chunked(" [ ] ", 1)) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("text", ['{"symbol": "XEM/BTC"}', "[1, 2", "[1 2]"])
+async def test_iter_json_array_rejects_invalid(text: str):
+    with pytest.raises(ValueError):
+        await collect(chunked(text, 3))
+
+
+def make_client(status_code: int, body: str) -> httpx.AsyncClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            status_code, content=chunked_bytes(body.encode(), size=16)
+        )
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def chunked_bytes(body: bytes, size: int) -> AsyncIterator[bytes]:
+    for offset in range(0, len(body), size):
+        yield body[offset : offset + size]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("streaming", [False, True])
+async def test_fetch_trade_volumes_filters_tracked_pairs(streaming: bool):
+    api = LivecoinApi(make_client(200, json.dumps(TICKER)), streaming=streaming)
+
+    records = await api.fetch_trade_volumes(TRACKED)
+
+    assert [(record.currency_pair, record.volume) for record in records] == [
+        ("XEM/BTC", 1250),
+        ("DGB/BTC", 99999),
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("streaming", [False, True])
+async def test_fetch_trade_volumes_unavailable(streaming: bool):
+    api = LivecoinApi(make_client(503, "Service Unavailable"), streaming=streaming)
+
+    with pytest.raises(ApiUnavailableException):
+        await api.fetch_trade_volumes(TRACKED)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("streaming", [False, True])
+async def test_fetch_trade_volumes_malformed(streaming: bool):
+    api = LivecoinApi(make_client(200, "<html>Bad gateway</html>"), streaming=streaming)
+
+    with pytest.raises(ApiUnavailableException):
+        await api.fetch_trade_volumes(TRACKED)
+
+
+@pytest.mark.asyncio
+async def test_streaming_truncated_response():
+    api = LivecoinApi(make_client(200, json.dumps(TICKER)[:-20]), streaming=True)
+
+    with pytest.raises(ApiUnavailableException):
+        await api.fetch_trade_volumes(TRACKED)
+
+
+class TickerServer:
+    """
+    Just enough of an HTTP server to stand in for livecoin. Queued failures are returned before any real responses
+    """
+
+    def __init__(self):
+        self.failures: List[Tuple[int, Dict[str, str]]] = []
+        self.requests: List[str] = []
+        self.missing_symbols = {"ETH/BTC"}
+        self.malformed_bodies: Dict[str, bytes] = {}
+        self.base_url = ""
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        request_line = (await reader.readuntil(b"\r\n")).decode()
+        while await reader.readuntil(b"\r\n") != b"\r\n":
+            pass
+        target = request_line.split(" ")[1]
+        self.requests.append(target)
+
+        status, headers, body = self.respond(target)
+        head = f"HTTP/1.1 {status} X\r\nContent-Length: {len(body)}\r\nConnection: close\r\n"
+        for name, value in headers.items():
+            head += f"{name}: {value}\r\n"
+        writer.write(head.encode() + b"\r\n" + body)
+        await writer.drain()
+        writer.close()
+
+    def respond(self, target: str) -> Tuple[int, Dict[str, str], bytes]:
+        if self.failures:
+            status, headers = self.failures.pop(0)
+            return status, headers, b"{}"
+
+        url = urlparse(target)
+        symbol: Optional[str] = parse_qs(url.query).get("currencyPair", [None])[0]
+        if symbol is None:
+            return 200, {}, json.dumps(TICKER).encode()
+        if symbol in self.missing_symbols:
+            return 404, {}, b"{}"
+        if symbol in self.malformed_bodies:
+            return 200, {}, self.malformed_bodies[symbol]
+        item = next(item for item in TICKER if item["symbol"] == symbol)
+        return 200, {}, json.dumps(item).encode()
+
+
+class RecordingSleep:
+    def __init__(self):
+        self.delays: List[float] = []
+
+    async def __call__(self, seconds: float) -> None:
+        self.delays.append(seconds)
+
+
+@pytest.fixture
+async def ticker_server():
+    ticker_server = TickerServer()
+    server = await asyncio.start_server(ticker_server.handle, "127.0.0.1", 0)
+    ticker_server.base_url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    yield ticker_server
+    server.close()
+
+
+@pytest.mark.asyncio
+async def test_retries_rate_limited_requests(ticker_server: TickerServer):
+    ticker_server.failures = [(429, {"Retry-After": "2"}), (503, {})]
+    sleep = RecordingSleep()
+    api = LivecoinApi(
+        httpx.AsyncClient(),
+        base_url=ticker_server.base_url,
+        retry_policy=RetryPolicy(max_attempts=3, base_backoff_seconds=0.5),
+        sleep=sleep,
+    )
+
+    records = await api.fetch_trade_volumes(TRACKED)
+
+    assert len(records) == 2
+    assert len(ticker_server.requests) == 3
+    # Retry-After sets the minimum wait, after that it's jittered backoff
+    assert sleep.delays[0] == 2
+    assert 0 <= sleep.delays[1] <= 1
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_attempts(ticker_server: TickerServer):
+    ticker_server.failures = [(500, {})] * 3
+    api = LivecoinApi(
+        httpx.AsyncClient(),
+        base_url=ticker_server.base_url,
+        retry_policy=RetryPolicy(max_attempts=2),
+        sleep=RecordingSleep(),
+    )
+
+    with pytest.raises(ApiUnavailableException):
+        await api.fetch_trade_volumes(TRACKED)
+    assert len(ticker_server.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried(ticker_server: TickerServer):
+    ticker_server.failures = [(400, {})]
+    api = LivecoinApi(
+        httpx.AsyncClient(),
+        base_url=ticker_server.base_url,
+        retry_policy=RetryPolicy(max_attempts=5),
+        sleep=RecordingSleep(),
+    )
+
+    with pytest.raises(ApiUnavailableException):
+        await api.fetch_trade_volumes(TRACKED)
+    assert len(ticker_server.requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_per_symbol_skips_failed_pairs(ticker_server: TickerServer):
+    api = LivecoinApi(
+        httpx.AsyncClient(),
+        base_url=ticker_server.base_url,
+        strategy=FetchStrategy.PER_SYMBOL,
+    )
+
+    records = await api.fetch_trade_volumes({"XEM/BTC", "ETH/BTC", "DGB/BTC"})
+
+    assert sorted(record.currency_pair for record in records) == ["DGB/BTC", "XEM/BTC"]
+    assert sorted(ticker_server.requests) == [
+        "/exchange/ticker?currencyPair=DGB%2FBTC",
+        "/exchange/ticker?currencyPair=ETH%2FBTC",
+        "/exchange/ticker?currencyPair=XEM%2FBTC",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_per_symbol_skips_malformed_responses(ticker_server: TickerServer):
+    ticker_server.missing_symbols = set()
+    ticker_server.malformed_bodies = {
+        "ETH/BTC": b"<html>Bad gateway</html>",
+        "DGB/BTC": b'{"symbol": "DGB/BTC"}',
+    }
+    api = LivecoinApi(
+        httpx.AsyncClient(),
+        base_url=ticker_server.base_url,
+        strategy=FetchStrategy.PER_SYMBOL,
+    )
+
+    records = await api.fetch_trade_volumes({"XEM/BTC", "ETH/BTC", "DGB/BTC"})
+
+    assert [record.currency_pair for record in records] == ["XEM/BTC"]
+
+
+def test_auto_strategy_uses_per_symbol_while_it_fits_in_the_rate_limit():
+    api = LivecoinApi(
+        httpx.AsyncClient(),
+        rate_limiter=TokenBucket(rate_per_second=1, capacity=2),
+        strategy=FetchStrategy.AUTO,
+        max_per_symbol_seconds=5,
+    )
+
+    assert api.pick_strategy(7) == FetchStrategy.PER_SYMBOL
+    assert api.pick_strategy(8) == FetchStrategy.FULL_TICKER
@@ -0,0 +1,135 @@
+import asyncio
+from datetime import timedelta
+from mock import AsyncMock, MagicMock
+
+import pytest
+from databases import Database, DatabaseURL
+
+from app.read_router import ReadRouter
+
+
+def make_db(lag_seconds: float = 0, lsn: int = 100) -> MagicMock:
+    """
+    Stands in for the primary, whose WAL is at lsn, or a replica that has replayed up to lsn
+    """
+    db = MagicMock(Database)
+    db.url = DatabaseURL("postgresql://localhost/cryptotracker")
+    db.is_connected = True
+    db.fetch_val = AsyncMock(return_value=lsn)
+    db.fetch_one = AsyncMock(
+        return_value={"replay_lsn": lsn, "lag_seconds": lag_seconds}
+    )
+    db.fetch_all = AsyncMock(return_value=[])
+    return db
+
+
+@pytest.mark.asyncio
+async def test_reads_round_robin_over_replicas():
+    primary, first, second = make_db(), make_db(), make_db()
+    router = ReadRouter(primary, [first, second])
+
+    for _ in range(4):
+        await router.fetch_all("SELECT 1")
+
+    assert first.fetch_all.call_count == 2
+    assert second.fetch_all.call_count == 2
+    primary.fetch_all.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_lagging_replica_skipped_until_it_catches_up():
+    now = 0.0
+    primary, replica = make_db(), make_db(lag_seconds=60)
+    router = ReadRouter(
+        primary,
+        [replica],
+        max_lag=timedelta(seconds=30),
+        health_check_seconds=10,
+        clock=lambda: now,
+    )
+
+    await router.fetch_all("SELECT 1")
+    assert primary.fetch_all.call_count == 1
+
+    replica.fetch_one.return_value = {"replay_lsn": 100, "lag_seconds": 1}
+    await router.fetch_all("SELECT 1")
+    # Not checked again until health_check_seconds have passed
+    assert primary.fetch_all.call_count == 2
+
+    now = 10
+    await router.fetch_all("SELECT 1")
+    assert replica.fetch_all.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_unreachable_replica_falls_back_to_primary():
+    primary, replica = make_db(), make_db()
+    replica.fetch_all.side_effect = ConnectionRefusedError()
+    router = ReadRouter(primary, [replica])
+
+    assert await router.fetch_all("SELECT 1") == []
+    await router.fetch_all("SELECT 1")
+
+    assert replica.fetch_all.call_count == 1
+    assert primary.fetch_all.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_replicas_are_compared_to_the_primary():
+    primary, replica = make_db(lsn=200), make_db(lsn=100)
+    router = ReadRouter(primary, [replica], max_lag=timedelta(seconds=30))
+
+    await router.check_replicas()
+
+    # Not what the replica received, which stops moving when its WAL receiver is down
+    query, values = replica.fetch_one.call_args.args
+    assert "pg_current_wal_lsn" not in query
+    assert "pg_last_wal_receive_lsn" not in query
+    assert values == {"primary_lsn": 200}
+
+
+@pytest.mark.asyncio
+async def test_reads_after_sync_wait_for_a_replica_to_replay_the_primary():
+    now = 0.0
+    primary, replica = make_db(lsn=200), make_db(lsn=100)
+    router = ReadRouter(
+        primary,
+        [replica],
+        health_check_seconds=10,
+        catch_up_check_seconds=1,
+        clock=lambda: now,
+    )
+    await router.check_replicas()
+
+    await router.sync_with_primary()
+    await router.fetch_all("SELECT 1")
+    assert primary.fetch_all.call_count == 1
+
+    # Checked again sooner than health_check_seconds while it's behind
+    replica.fetch_one.return_value = {"replay_lsn": 200, "lag_seconds": 0}
+    now = 1
+    await router.fetch_all("SELECT 1")
+    assert replica.fetch_all.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_read_does_not_cancel_the_shared_check():
+    primary, replica = make_db(), make_db()
+    checked = asyncio.Event()
+
+    async def slow_check(query, values):
+        await checked.wait()
+        return {"replay_lsn": 100, "lag_seconds": 0}
+
+    replica.fetch_one.side_effect = slow_check
+    router = ReadRouter(primary, [replica])
+
+    first = asyncio.ensure_future(router.fetch_all("SELECT 1"))
+    second = asyncio.ensure_future(router.fetch_all("SELECT 1"))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    checked.set()
+
+    assert await second == []
+    assert replica.fetch_all.call_count == 1
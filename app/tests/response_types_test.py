@@ -0,0 +1,48 @@
+import json
+from datetime import datetime, timezone
+
+from app.response_types import HistoryApiResponse
+from app.types import (
+    CurrencyPairSnapshot,
+    CurrencyTradeVolumeRecord,
+    HistoryResolution,
+    VolumeRollupRecord,
+)
+
+JAN_1ST = datetime(year=1970, day=1, month=1, tzinfo=timezone.utc)
+
+
+def history_json(snapshot: CurrencyPairSnapshot):
+    return json.loads(HistoryApiResponse.from_orm(snapshot).json(exclude_none=True))[
+        "history"
+    ]
+
+
+def test_raw_samples_only_have_time_and_volume():
+    snapshot = CurrencyPairSnapshot(
+        "XEM/BTC", [CurrencyTradeVolumeRecord(JAN_1ST, "XEM/BTC", 200.5)], 1, 1
+    )
+
+    assert history_json(snapshot) == [
+        {"time": "1970-01-01T00:00:00+00:00", "volume": 200.5}
+    ]
+
+
+def test_rollups_have_every_volume():
+    snapshot = CurrencyPairSnapshot(
+        "XEM/BTC",
+        [VolumeRollupRecord(JAN_1ST, "XEM/BTC", 2, 1, 3, 3)],
+        1,
+        1,
+        HistoryResolution.ONE_HOUR,
+    )
+
+    assert history_json(snapshot) == [
+        {
+            "time": "1970-01-01T00:00:00+00:00",
+            "volume": 2,
+            "min_volume": 1,
+            "max_volume": 3,
+            "last_volume": 3,
+        }
+    ]
@@ -0,0 +1,164 @@
+import csv
+import gzip
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List
+
+import pytest
+from databases import Database
+from mock import AsyncMock, MagicMock, patch
+
+from app.retention import RetentionPolicy, TradeVolumeRetention
+from app.volume_partitions import VolumePartition, VolumePartitionManager
+
+JAN_1ST = datetime(year=1970, day=1, month=1, tzinfo=timezone.utc)
+PARTITION = VolumePartition("currency_pair_volumes_p19700101", date(1970, 1, 1))
+
+
+def raw_row(minutes: int, volume: float) -> Dict[str, Any]:
+    return {
+        "fetch_time": JAN_1ST + timedelta(minutes=minutes),
+        "currency_pair": "XEM/BTC",
+        "volume": volume,
+    }
+
+
+def rows_from(iterate_rows: List[Dict[str, Any]]):
+    async def iterate(query: str) -> AsyncIterator[Dict[str, Any]]:
+        for row in iterate_rows:
+            yield row
+
+    return iterate
+
+
+def read_archive(path: str) -> List[List[str]]:
+    with gzip.open(path, "rt", newline="") as archive_file:
+        return list(csv.reader(archive_file))
+
+
+@pytest.fixture
+def db():
+    db = MagicMock(Database)
+    db.execute = AsyncMock()
+    db.fetch_all = AsyncMock(return_value=[])
+    db.fetch_val = AsyncMock(return_value=0)
+    db.iterate = rows_from([])
+    return db
+
+
+@pytest.fixture
+def partitions():
+    partitions = MagicMock(VolumePartitionManager)
+    partitions.get_partitions_before = AsyncMock(return_value=[])
+    partitions.detach_partition = AsyncMock()
+    partitions.drop_partition = AsyncMock()
+    return partitions
+
+
+def make_retention(db, partitions, archive_dir=None) -> TradeVolumeRetention:
+    return TradeVolumeRetention(
+        db,
+        partitions,
+        RetentionPolicy(
+            raw_retention=timedelta(hours=25),
+            rollup_retention=timedelta(days=30),
+            archive_dir=archive_dir,
+            batch_size=2,
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_deletes_in_batches_until_a_short_batch(
+    db: MagicMock, partitions: MagicMock
+):
+    db.fetch_all.side_effect = [
+        [raw_row(0, 1), raw_row(1, 2)],
+        [raw_row(2, 3)],
+        [],
+    ]
+
+    report = await make_retention(db, partitions).run()
+
+    # Two batches of trade volumes, the second one short, and one empty batch of rollups
+    assert db.fetch_all.call_count == 3
+    assert db.transaction.call_count == 3
+    assert report.raw_rows_pruned == 3
+    assert report.rollup_rows_pruned == 0
+
+
+@pytest.mark.asyncio
+async def test_expired_partitions_are_dropped_rather_than_deleted(
+    db: MagicMock, partitions: MagicMock
+):
+    partitions.get_partitions_before.return_value = [PARTITION]
+    db.fetch_val.return_value = 1440
+
+    report = await make_retention(db, partitions).run()
+
+    partitions.detach_partition.assert_awaited_once_with(PARTITION)
+    partitions.drop_partition.assert_awaited_once_with(PARTITION)
+    assert report.partitions_dropped == [PARTITION.name]
+    assert report.raw_rows_pruned == 1440
+    # Only the batched deletes of what's left over outside the partition
+    assert db.fetch_all.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_archive_holds_exactly_the_pruned_rows(
+    db: MagicMock, partitions: MagicMock, tmp_path
+):
+    partitions.get_partitions_before.return_value = [PARTITION]
+    db.iterate = rows_from([raw_row(minutes, minutes) for minutes in range(3)])
+    db.fetch_all.side_effect = [[raw_row(1500, 4), raw_row(1501, 5)], [], []]
+
+    report = await make_retention(db, partitions, str(tmp_path)).run()
+
+    assert report.raw_rows_pruned == 5
+    partition_file, batch_file = report.archive_files
+    assert partition_file == os.path.join(tmp_path, f"{PARTITION.name}.csv.gz")
+    # One gzip member per batch, read back as a single file with a single header
+    assert read_archive(partition_file) == [
+        ["fetch_time", "currency_pair", "volume"],
+        *[[str(JAN_1ST + timedelta(minutes=m)), "XEM/BTC", str(m)] for m in range(3)],
+    ]
+    assert read_archive(batch_file)[1:] == [
+        [str(JAN_1ST + timedelta(minutes=1500)), "XEM/BTC", "4"],
+        [str(JAN_1ST + timedelta(minutes=1501)), "XEM/BTC", "5"],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_failed_archive_write_rolls_back_its_batch(
+    db: MagicMock, partitions: MagicMock, tmp_path
+):
+    db.fetch_all.side_effect = [
+        [raw_row(0, 1), raw_row(1, 2)],
+        [raw_row(2, 3), raw_row(3, 4)],
+    ]
+
+    with patch("app.retention.os.fsync", side_effect=[None, OSError("Disk full")]):
+        with pytest.raises(OSError):
+            await make_retention(db, partitions, str(tmp_path)).run()
+
+    # The second batch's delete was still inside its transaction when the write failed
+    exit_args = db.transaction.return_value.__aexit__.call_args_list
+    assert [args.args[0] for args in exit_args] == [None, OSError]
+    (archive_file,) = os.listdir(tmp_path)
+    assert len(read_archive(os.path.join(tmp_path, archive_file))) == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_partition_archive_keeps_the_partition(
+    db: MagicMock, partitions: MagicMock, tmp_path
+):
+    partitions.get_partitions_before.return_value = [PARTITION]
+    db.iterate = rows_from([raw_row(minutes, minutes) for minutes in range(3)])
+
+    with patch("app.retention.os.fsync", side_effect=OSError("Disk full")):
+        with pytest.raises(OSError):
+            await make_retention(db, partitions, str(tmp_path)).run()
+
+    partitions.detach_partition.assert_not_called()
+    partitions.drop_partition.assert_not_called()
+    assert os.listdir(tmp_path) == []
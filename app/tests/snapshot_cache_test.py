@@ -0,0 +1,229 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+import pytest
+
+from app.snapshot_cache import (
+    CachedSnapshot,
+    InMemorySnapshotCache,
+    RedisProtocolError,
+    RedisSnapshotCache,
+    RespConnection,
+)
+from app.types import (
+    CurrencyPairSnapshot,
+    CurrencyTradeVolumeRecord,
+    HistoryResolution,
+    VolumeRollupRecord,
+)
+
+JAN_1ST = datetime(year=1970, day=1, month=1, tzinfo=timezone.utc)
+
+SNAPSHOT = CurrencyPairSnapshot(
+    currency_pair="XEM/BTC",
+    history=[CurrencyTradeVolumeRecord(JAN_1ST, "XEM/BTC", 200.5)],
+    rank=2,
+    total_tracked_currency_pairs=3,
+    updated_at=JAN_1ST,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RedisStandIn:
+    """
+    Just enough of a redis server to run the snapshot cache against
+    """
+
+    def __init__(self):
+        self.values: Dict[bytes, bytes] = {}
+        self.reply_delay_seconds = 0.0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            try:
+                header = await reader.readuntil(b"\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            args: List[bytes] = []
+            for _ in range(int(header[1:-2])):
+                length = int((await reader.readuntil(b"\r\n"))[1:-2])
+                args.append((await reader.readexactly(length + 2))[:-2])
+            if self.reply_delay_seconds:
+                await asyncio.sleep(self.reply_delay_seconds)
+            writer.write(self.execute(args))
+            await writer.drain()
+        writer.close()
+
+    def execute(self, args: List[bytes]) -> bytes:
+        command = args[0].upper()
+        if command == b"SET":
+            self.values[args[1]] = args[2]
+            return b"+OK\r\n"
+        if command == b"INCR":
+            count = int(self.values.get(args[1], b"0")) + 1
+            self.values[args[1]] = str(count).encode()
+            return b":%d\r\n" % count
+        if command == b"MGET":
+            reply = b"*%d\r\n" % (len(args) - 1)
+            for key in args[1:]:
+                value = self.values.get(key)
+                reply += (
+                    b"$-1\r\n"
+                    if value is None
+                    else b"$%d\r\n%s\r\n" % (len(value), value)
+                )
+            return reply
+        return b"-ERR unknown command\r\n"
+
+
+@pytest.fixture
+async def redis_server():
+    stand_in = RedisStandIn()
+    server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+    yield stand_in, server.sockets[0].getsockname()[1]
+    server.close()
+
+
+@pytest.fixture
+async def redis_cache(redis_server: Tuple[RedisStandIn, int]):
+    _, port = redis_server
+    cache = RedisSnapshotCache(
+        RespConnection(f"redis://127.0.0.1:{port}"), ttl_seconds=60
+    )
+    yield cache
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_round_trip():
+    cache = InMemorySnapshotCache(max_size=10, ttl_seconds=60)
+    miss = await cache.get("XEM/BTC")
+    await cache.set("XEM/BTC", SNAPSHOT, miss.generation)
+
+    assert miss.snapshot is None
+    assert (await cache.get("XEM/BTC")).snapshot == SNAPSHOT
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_expires():
+    clock = FakeClock()
+    cache = InMemorySnapshotCache(max_size=10, ttl_seconds=60, clock=clock)
+    await cache.set("XEM/BTC", SNAPSHOT, (await cache.get("XEM/BTC")).generation)
+    clock.now = 61
+
+    assert (await cache.get("XEM/BTC")).snapshot is None
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_evicts_least_recently_used():
+    cache = InMemorySnapshotCache(max_size=1, ttl_seconds=60)
+    other = CurrencyPairSnapshot("DGB/BTC", [], 1, 3)
+    await cache.set("XEM/BTC", SNAPSHOT, 0)
+    await cache.set("DGB/BTC", other, 0)
+
+    assert (await cache.get("XEM/BTC")).snapshot is None
+    assert (await cache.get("DGB/BTC")).snapshot == other
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_ignores_snapshot_built_before_invalidation():
+    cache = InMemorySnapshotCache(max_size=10, ttl_seconds=60)
+    miss = await cache.get("XEM/BTC")
+    await cache.invalidate()
+    await cache.set("XEM/BTC", SNAPSHOT, miss.generation)
+
+    assert (await cache.get("XEM/BTC")).snapshot is None
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_round_trip(redis_cache: RedisSnapshotCache):
+    miss = await redis_cache.get("XEM/BTC")
+    await redis_cache.set("XEM/BTC", SNAPSHOT, miss.generation)
+
+    assert miss.snapshot is None
+    assert (await redis_cache.get("XEM/BTC")).snapshot == SNAPSHOT
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_invalidate(redis_cache: RedisSnapshotCache):
+    await redis_cache.set(
+        "XEM/BTC", SNAPSHOT, (await redis_cache.get("XEM/BTC")).generation
+    )
+    await redis_cache.invalidate()
+
+    assert (await redis_cache.get("XEM/BTC")).snapshot is None
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_round_trips_rollups(redis_cache: RedisSnapshotCache):
+    snapshot = CurrencyPairSnapshot(
+        currency_pair="XEM/BTC",
+        history=[VolumeRollupRecord(JAN_1ST, "XEM/BTC", 150, 100, 200, 120)],
+        rank=1,
+        total_tracked_currency_pairs=3,
+        resolution=HistoryResolution.ONE_HOUR,
+    )
+    await redis_cache.set("XEM/BTC@1h", snapshot, 0)
+
+    assert (await redis_cache.get("XEM/BTC@1h")).snapshot == snapshot
+
+
+@pytest.mark.asyncio
+async def test_cancelled_command_does_not_leave_its_reply_for_the_next(
+    redis_server: Tuple[RedisStandIn, int],
+):
+    stand_in, port = redis_server
+    connection = RespConnection(f"redis://127.0.0.1:{port}")
+    await connection.execute("SET", "a", "1")
+    await connection.execute("SET", "b", "2")
+
+    stand_in.reply_delay_seconds = 0.05
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(connection.execute("MGET", "a"), 0.01)
+
+    assert await connection.execute("MGET", "b") == [b"2"]
+    await connection.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_auth_is_retried_on_the_next_command(
+    redis_server: Tuple[RedisStandIn, int],
+):
+    _, port = redis_server
+    connection = RespConnection(f"redis://:secret@127.0.0.1:{port}")
+
+    # The stand in doesn't know AUTH, so every attempt fails instead of the second running unauthenticated
+    for _ in range(2):
+        with pytest.raises(RedisProtocolError):
+            await connection.execute("SET", "a", "1")
+    await connection.close()
+
+
+@pytest.mark.asyncio
+async def test_unresponsive_server_falls_through_to_a_miss(
+    redis_server: Tuple[RedisStandIn, int],
+):
+    stand_in, port = redis_server
+    cache = RedisSnapshotCache(
+        RespConnection(f"redis://127.0.0.1:{port}", timeout_seconds=0.05),
+        ttl_seconds=60,
+    )
+    generation = (await cache.get("XEM/BTC")).generation
+    await cache.set("XEM/BTC", SNAPSHOT, generation)
+
+    # Never replies, but keeps the connection open
+    stand_in.reply_delay_seconds = 3600
+    assert await cache.get("XEM/BTC") == CachedSnapshot(None, -1)
+
+    # The connection stuck waiting on the old reply was dropped
+    stand_in.reply_delay_seconds = 0
+    assert (await cache.get("XEM/BTC")).snapshot == SNAPSHOT
+    await cache.close()
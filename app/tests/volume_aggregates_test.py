@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+from statistics import stdev
+
+from app.currency_trade_volume_store import CurrencyPairAvg, CurrencyPairRank
+from app.types import CurrencyTradeVolumeRecord
+from app.volume_aggregates import VolumeAggregates
+
+NOW = datetime(year=2020, month=5, day=1, tzinfo=timezone.utc)
+
+
+def record(minutes_ago: float, currency_pair: str, volume: float):
+    return CurrencyTradeVolumeRecord(
+        time=NOW - timedelta(minutes=minutes_ago),
+        currency_pair=currency_pair,
+        volume=volume,
+    )
+
+
+def test_average_only_includes_last_hour():
+    aggregates = VolumeAggregates()
+    aggregates.record(
+        [record(90, "A", 1000), record(30, "A", 100), record(10, "A", 200)]
+    )
+
+    assert aggregates.get_currency_pair_averages(NOW) == [CurrencyPairAvg("A", 150)]
+
+
+def test_expired_pairs_are_dropped():
+    aggregates = VolumeAggregates()
+    aggregates.record([record(90, "A", 100), record(10, "B", 200)])
+
+    assert aggregates.get_currency_pair_averages(NOW) == [CurrencyPairAvg("B", 200)]
+
+
+def test_ranks_match_sample_std_dev():
+    aggregates = VolumeAggregates()
+    a_volumes = [10, 20, 60]
+    b_volumes = [10, 11, 12]
+    aggregates.record(
+        [record(100 - i, "A", volume) for i, volume in enumerate(a_volumes)]
+        + [record(100 - i, "B", volume) for i, volume in enumerate(b_volumes)]
+        + [record(50, "C", 500)]
+    )
+
+    ranks = aggregates.get_currency_pair_ranks(NOW)
+
+    # Like postgres, a single sample has no standard deviation and is sorted first
+    assert ranks[0] == CurrencyPairRank(1, "C", None)
+    assert [rank.currency_pair for rank in ranks[1:]] == ["A", "B"]
+    assert abs(ranks[1].volume_std_dev - stdev(a_volumes)) < 1e-9
+    assert abs(ranks[2].volume_std_dev - stdev(b_volumes)) < 1e-9
+
+
+def test_load_replaces_existing_samples():
+    aggregates = VolumeAggregates()
+    aggregates.record([record(10, "A", 100)])
+    aggregates.load([record(5, "B", 300)])
+
+    assert aggregates.get_currency_pair_averages(NOW) == [CurrencyPairAvg("B", 300)]
+
+
+def test_std_dev_keeps_its_precision_for_large_close_volumes():
+    aggregates = VolumeAggregates()
+    volumes = [1e9 + offset for offset in [4, 7, 13, 16, 2, 9]]
+    # The first sample expires out of the 24 hour window
+    aggregates.record(
+        [record(25 * 60, "A", 5e12)]
+        + [record(100 - i, "A", volume) for i, volume in enumerate(volumes)]
+    )
+
+    ranks = aggregates.get_currency_pair_ranks(NOW)
+
+    assert abs(ranks[0].volume_std_dev - stdev(volumes)) < 1e-6
+
+
+def test_ranks_only_the_given_currency_pairs():
+    aggregates = VolumeAggregates()
+    aggregates.record([record(10, "A", 100), record(5, "A", 300), record(10, "B", 1)])
+
+    assert aggregates.get_currency_pair_ranks(NOW, {"B"}) == [
+        CurrencyPairRank(1, "B", None)
+    ]
@@ -0,0 +1,100 @@
+import statistics
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.volume_statistics import (  # noqa: E402
+    VolumeMetric,
+    compute_volume_statistics,
+    order_by_metric,
+    statistics_from_aggregates,
+)
+
+VOLUMES = {
+    "XEM/BTC": [100, 200, 300, 400, 1000],
+    "DGB/BTC": [50],
+    "OTON/BTC": [20, 20, 20],
+    "ETH/BTC": [10, 12, 11, 13],
+}
+
+
+def test_statistics_match_computing_each_currency_pair_on_its_own():
+    result = compute_volume_statistics({**VOLUMES, "EMPTY/BTC": []})
+
+    assert set(result) == set(VOLUMES)
+    for currency_pair, volumes in VOLUMES.items():
+        pair_statistics = result[currency_pair]
+        mean = statistics.mean(volumes)
+        assert pair_statistics.count == len(volumes)
+        assert pair_statistics.mean == pytest.approx(mean)
+        assert pair_statistics.latest == volumes[-1]
+        if len(volumes) > 1:
+            std_dev = statistics.stdev(volumes)
+            assert pair_statistics.std_dev == pytest.approx(std_dev)
+            assert pair_statistics.coefficient_of_variation == pytest.approx(
+                std_dev / mean
+            )
+
+    assert result["DGB/BTC"].std_dev is None
+    assert result["DGB/BTC"].z_score is None
+    # Always the same volume, so there's no spread to measure the latest volume against
+    assert result["OTON/BTC"].z_score is None
+    assert result["XEM/BTC"].z_score == pytest.approx(
+        (1000 - 400) / statistics.stdev(VOLUMES["XEM/BTC"])
+    )
+
+
+def test_ewma_weights_by_age_whatever_the_number_of_samples():
+    result = compute_volume_statistics(VOLUMES, ewma_alpha=0.5)
+
+    # Weights 1/8, 1/4, 1/2 and 1 from the oldest to the newest sample
+    assert result["ETH/BTC"].ewma == pytest.approx(
+        (10 / 8 + 12 / 4 + 11 / 2 + 13) / (1 / 8 + 1 / 4 + 1 / 2 + 1)
+    )
+    assert result["DGB/BTC"].ewma == 50
+
+
+def test_percentile():
+    result = compute_volume_statistics(VOLUMES, percentile=50)
+
+    assert result["XEM/BTC"].percentile == 300
+    assert result["XEM/BTC"].percentile_ratio == pytest.approx(1000 / 300)
+
+
+def test_statistics_from_aggregates_derive_the_rest_the_same_way():
+    for pair_statistics in compute_volume_statistics(VOLUMES).values():
+        assert (
+            statistics_from_aggregates(
+                count=pair_statistics.count,
+                mean=pair_statistics.mean,
+                std_dev=pair_statistics.std_dev,
+                latest=pair_statistics.latest,
+                ewma=pair_statistics.ewma,
+                percentile=pair_statistics.percentile,
+            )
+            == pair_statistics
+        )
+
+
+def test_order_by_metric():
+    result = compute_volume_statistics(VOLUMES)
+
+    # Same as the database: a single sample ranks first and ties go to the later currency pair
+    assert order_by_metric(result, VolumeMetric.STD_DEV) == [
+        "DGB/BTC",
+        "XEM/BTC",
+        "ETH/BTC",
+        "OTON/BTC",
+    ]
+    # Nothing unusual about a currency pair without a z score
+    assert order_by_metric(result, VolumeMetric.Z_SCORE)[-2:] == [
+        "OTON/BTC",
+        "DGB/BTC",
+    ]
+    assert order_by_metric(result, VolumeMetric.COEFFICIENT_OF_VARIATION) == [
+        "XEM/BTC",
+        "ETH/BTC",
+        "OTON/BTC",
+        "DGB/BTC",
+    ]
@@ -0,0 +1,147 @@
+import itertools
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.currency_trade_volume_store import CurrencyPairRank
+from app.types import CurrencyTradeVolumeRecord
+from app.volume_updates import CurrencyPairUpdate, VolumeTick, VolumeUpdateHub
+
+JAN_1ST = datetime(1970, 1, 1, tzinfo=timezone.utc)
+RANKS = [
+    CurrencyPairRank(rank=1, currency_pair="XEM/BTC", volume_std_dev=2),
+    CurrencyPairRank(rank=2, currency_pair="DGB/BTC", volume_std_dev=1),
+]
+
+
+def record(currency_pair: str, minutes: int, volume: float):
+    return CurrencyTradeVolumeRecord(
+        JAN_1ST + timedelta(minutes=minutes), currency_pair, volume
+    )
+
+
+@pytest.mark.asyncio
+async def test_subscribers_only_get_their_currency_pairs():
+    hub = VolumeUpdateHub()
+    subscription = hub.subscribe(["XEM/BTC"])
+
+    await hub.publish(
+        VolumeTick([record("XEM/BTC", 0, 100), record("DGB/BTC", 0, 200)], RANKS, 3)
+    )
+
+    assert await subscription.get(timeout=0) == [
+        CurrencyPairUpdate("XEM/BTC", [record("XEM/BTC", 0, 100)], 1, 3)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_repeated_samples_and_unchanged_ranks_are_not_sent_again():
+    hub = VolumeUpdateHub()
+    subscription = hub.subscribe(["XEM/BTC", "DGB/BTC"])
+    await hub.publish(VolumeTick([record("XEM/BTC", 0, 100)], RANKS, 3))
+    await subscription.get(timeout=0)
+
+    # The same tick again, like one that came back through postgres, and then one overlapping it
+    await hub.publish(VolumeTick([record("XEM/BTC", 0, 100)], RANKS, 3))
+    assert await subscription.get(timeout=0) == []
+
+    await hub.publish(
+        VolumeTick([record("XEM/BTC", 0, 100), record("XEM/BTC", 1, 150)], RANKS, 3)
+    )
+    assert await subscription.get(timeout=0) == [
+        CurrencyPairUpdate("XEM/BTC", [record("XEM/BTC", 1, 150)], 1, 3)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rank_changes_are_sent_without_new_samples():
+    hub = VolumeUpdateHub()
+    await hub.publish(VolumeTick([], RANKS, 3))
+    subscription = hub.subscribe(["DGB/BTC"])
+
+    await hub.publish(
+        VolumeTick(
+            [],
+            [
+                CurrencyPairRank(rank=1, currency_pair="DGB/BTC", volume_std_dev=3),
+                CurrencyPairRank(rank=2, currency_pair="XEM/BTC", volume_std_dev=2),
+            ],
+            3,
+        )
+    )
+
+    assert await subscription.get(timeout=0) == [
+        CurrencyPairUpdate("DGB/BTC", [], 1, 3)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_subscribers_that_fall_behind_are_dropped():
+    hub = VolumeUpdateHub(max_queued=2)
+    subscription = hub.subscribe(["XEM/BTC"])
+
+    for minutes in range(3):
+        await hub.publish(VolumeTick([record("XEM/BTC", minutes, 100)], RANKS, 3))
+
+    assert hub.subscriber_count == 0
+    # What was queued before it fell behind is still delivered, then the subscription ends
+    assert len(await subscription.get(timeout=0)) == 2
+    assert await subscription.get(timeout=0) is None
+
+
+@pytest.mark.asyncio
+async def test_unsubscribe_ends_a_waiting_subscriber():
+    hub = VolumeUpdateHub()
+    subscription = hub.subscribe(["XEM/BTC"])
+
+    hub.unsubscribe(subscription)
+
+    assert await subscription.get() is None
+    await hub.publish(VolumeTick([record("XEM/BTC", 0, 100)], RANKS, 3))
+    assert hub.subscriber_count == 0
+
+
+@pytest.mark.asyncio
+async def test_close_ends_current_and_later_subscriptions():
+    hub = VolumeUpdateHub()
+    subscription = hub.subscribe(["XEM/BTC"])
+
+    hub.close()
+
+    assert await subscription.get() is None
+    assert await hub.subscribe(["XEM/BTC"]).get() is None
+    assert hub.subscriber_count == 0
+
+
+@pytest.mark.asyncio
+async def test_streams_end_after_max_seconds():
+    hub = VolumeUpdateHub()
+    subscription = hub.subscribe(["XEM/BTC"])
+    # The deadline is taken at 10, then every check moves the clock on by 10
+    clock = itertools.count(10, 10).__next__
+
+    batches = [
+        updates
+        async for updates in subscription.stream(
+            keepalive_seconds=0.001, max_seconds=15, clock=clock
+        )
+    ]
+
+    assert batches == [[]]
+
+
+@pytest.mark.asyncio
+async def test_streams_end_when_the_hub_closes():
+    hub = VolumeUpdateHub()
+    subscription = hub.subscribe(["XEM/BTC"])
+    await hub.publish(VolumeTick([record("XEM/BTC", 0, 100)], RANKS, 3))
+    hub.close()
+
+    batches = [
+        updates
+        async for updates in subscription.stream(keepalive_seconds=1, max_seconds=60)
+    ]
+
+    assert [[update.currency_pair for update in batch] for batch in batches] == [
+        ["XEM/BTC"]
+    ]
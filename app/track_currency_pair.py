@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+import argparse
+import asyncio
+
+from databases import Database
+
+from app import settings
+from app.currency_pair_registry import CurrencyPairRegistry
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Start or stop tracking a currency pair, running processes pick the change up within "
+        "CURRENCY_PAIR_REFRESH_SECONDS"
+    )
+    parser.add_argument(
+        "symbol", help="Currency pair as livecoin names it, e.g. XEM/BTC"
+    )
+    parser.add_argument(
+        "--disable",
+        action="store_true",
+        help="Stop fetching the currency pair instead, its history is kept",
+    )
+    args = parser.parse_args()
+
+    database = Database(settings.DATABASE_URL)
+    await database.connect()
+    registry = CurrencyPairRegistry(database)
+    if args.disable:
+        await registry.disable(args.symbol)
+    else:
+        await registry.add(args.symbol)
+    print(
+        f"Tracking {len(registry)} currency pairs: {', '.join(sorted(registry.symbols))}"
+    )
+    await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,7 @@
 from dataclasses import dataclass
 from datetime import datetime
+from enum import Enum
+from typing import List, Optional
 
 
 @dataclass
@@ -7,3 +9,40 @@ class CurrencyTradeVolumeRecord:
     time: datetime
     currency_pair: str
     volume: float
+
+
+@dataclass
+class VolumeRollupRecord(CurrencyTradeVolumeRecord):
+    """
+    Summary of all the trade volumes of a currency pair in a bucket of time. time is the start of the bucket and volume
+    is the average volume in the bucket
+    """
+
+    min_volume: float
+    max_volume: float
+    last_volume: float
+
+
+class HistoryResolution(str, Enum):
+    RAW = "raw"
+    ONE_MINUTE = "1m"
+    FIVE_MINUTES = "5m"
+    ONE_HOUR = "1h"
+
+
+@dataclass
+class CurrencyPairSnapshot:
+    currency_pair: str
+    history: List[CurrencyTradeVolumeRecord]
+    rank: int
+    """
+    The currency pair's position in the list of all tracked currency pairs
+    sorted by the standard deviation of their trade volume over the last 24
+    hours
+    """
+    total_tracked_currency_pairs: int
+    resolution: HistoryResolution = HistoryResolution.RAW
+    updated_at: Optional[datetime] = None
+    """
+    When the ingest tick the snapshot was built from finished, None if unknown
+    """
@@ -1,21 +1,137 @@
 #!/usr/bin/python3
+import argparse
 import asyncio
 import logging
+import signal
 import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
 
 import httpx
 
-from app.di import make_deps
+from app import settings
+from app.di import Deps, make_deps
+from app.ingest_scheduler import IngestScheduler, TickTiming
+from app.ingest_shards import ShardCoordinator, make_worker_id
+from app.volume_partitions import VolumePartitionManager
 
+logger = logging.getLogger(__name__)
 
-async def main():
+
+async def run_daemon(deps: Deps, interval_seconds: float, shard_count: int = 1):
+    """
+    Keep updating trade volumes every interval until the process is told to stop, reusing the same http client and
+    database pool for every run
+
+    :param shard_count: Above 1, only ingest the shards this daemon holds and share the rest with other daemons
+    """
+    partitions = VolumePartitionManager(deps.database)
+    partitions_day: Optional[date] = None
+
+    async def ensure_partitions():
+        nonlocal partitions_day
+        # Partitions are created days ahead, so checking once per day is plenty
+        today = datetime.now(timezone.utc).date()
+        if today != partitions_day:
+            await partitions.ensure_partitions()
+            partitions_day = today
+
+    async def update():
+        await ensure_partitions()
+        await deps.currency_trade_service.update_trade_volumes()
+
+    coordinator: Optional[ShardCoordinator] = None
+    job: Callable[[], Awaitable[None]] = update
+    if shard_count > 1:
+        if settings.USE_VOLUME_AGGREGATES:
+            raise ValueError("USE_VOLUME_AGGREGATES can't be used with INGEST_SHARDS")
+        # Each daemon only sees its own shards' trade volumes, so ranks and averages computed from memory would be wrong
+        if settings.USE_IN_MEMORY_HISTORY:
+            raise ValueError("USE_IN_MEMORY_HISTORY can't be used with INGEST_SHARDS")
+
+        coordinator = ShardCoordinator(
+            deps.database,
+            make_worker_id(),
+            shard_count,
+            timedelta(seconds=settings.INGEST_LEASE_SECONDS),
+        )
+
+        async def update_shards():
+            assert coordinator is not None and scheduler.scheduled_at is not None
+            # Every daemon derives the same tick id from the wall clock
+            tick = round(scheduler.scheduled_at / interval_seconds)
+
+            await ensure_partitions()
+            shards = await coordinator.acquire_shards()
+            # Every daemon has its own buckets, so each takes its share of the exchanges' rate limits
+            for rate_limiter in deps.rate_limiters:
+                rate_limiter.share(coordinator.live_workers)
+            await deps.currency_trade_service.update_trade_volume_shards(
+                set(shards), shard_count
+            )
+            finalizing = await coordinator.complete_shards(tick, shards)
+            if finalizing is not None:
+                await deps.currency_trade_service.finalize_tick(
+                    datetime.fromtimestamp(
+                        finalizing * interval_seconds, tz=timezone.utc
+                    )
+                )
+
+        job = update_shards
+
+    def log_pool_metrics(timing: TickTiming):
+        logger.info("Database pool after tick: %s", deps.database.pool_metrics())
+
+    scheduler = IngestScheduler(
+        job,
+        interval_seconds,
+        on_tick=log_pool_metrics,
+        clock=time.time if coordinator is not None else time.monotonic,
+        align_to_clock=coordinator is not None,
+    )
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stop_signal, scheduler.stop)
+
+    try:
+        await scheduler.run()
+    finally:
+        if coordinator is not None:
+            await coordinator.release()
+
+
+async def main(daemon: bool, interval_seconds: float):
     async with httpx.AsyncClient() as client:
         logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
         deps = make_deps(client)
         await deps.database.connect()
-        await deps.currency_trade_service.update_trade_volumes()
+        deps.alert_dispatcher.start()
+        await deps.currency_trade_service.load()
+        if daemon:
+            await run_daemon(deps, interval_seconds, settings.INGEST_SHARDS)
+        else:
+            await VolumePartitionManager(deps.database).ensure_partitions()
+            await deps.currency_trade_service.update_trade_volumes()
+        # Finish sending any alerts before exiting
+        await deps.alert_dispatcher.stop()
         await deps.database.disconnect()
+        if deps.snapshot_cache is not None:
+            await deps.snapshot_cache.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Record the latest trade volumes")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and update trade volumes every interval instead of just once",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=settings.INGEST_INTERVAL_SECONDS,
+        help="Seconds between updates in daemon mode",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.daemon, args.interval))
@@ -0,0 +1,216 @@
+import math
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import (
+    AbstractSet,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from app.currency_trade_volume_store import CurrencyPairAvg, CurrencyPairRank
+from app.types import CurrencyTradeVolumeRecord
+
+AVERAGE_WINDOW = timedelta(hours=1)
+RANK_WINDOW = timedelta(hours=24)
+
+
+def rank_by_std_dev(
+    std_devs: Sequence[Tuple[str, Optional[float]]],
+) -> List[CurrencyPairRank]:
+    """
+    Rank currency pairs by their volume standard deviations the way CurrencyTradeVolumeStore.get_currency_pair_ranks
+    does, including its tie-breaking
+    """
+    # Postgres sorts NULLs first when sorting descending, so pairs with a single sample come first there too
+    ordered = sorted(
+        std_devs,
+        key=lambda item: (item[1] is None, item[1] or 0.0, item[0]),
+        reverse=True,
+    )
+
+    return [
+        CurrencyPairRank(
+            rank=index + 1, currency_pair=currency_pair, volume_std_dev=std_dev
+        )
+        for index, (currency_pair, std_dev) in enumerate(ordered)
+    ]
+
+
+# When removing a sample cancels all but this fraction of the squared deviations, too few significant digits are left
+# and they're recomputed from the samples instead
+_RECOMPUTE_FRACTION = 1e-6
+
+
+@dataclass
+class _WindowTotals:
+    volumes: Deque[float] = field(default_factory=deque)
+    volume_sum: float = 0.0
+    mean: float = 0.0
+    squared_deviations: float = 0.0
+    """
+    Sum of squared differences from the mean, updated with Welford's method so large volumes that are close together
+    don't lose their variance to cancellation like a sum of squares would
+    """
+
+    @property
+    def count(self) -> int:
+        return len(self.volumes)
+
+    def add(self, volume: float) -> None:
+        self.volumes.append(volume)
+        self.volume_sum += volume
+        delta = volume - self.mean
+        self.mean += delta / self.count
+        self.squared_deviations += delta * (volume - self.mean)
+
+    def remove_oldest(self) -> None:
+        volume = self.volumes.popleft()
+        self.volume_sum -= volume
+        delta = volume - self.mean
+        self.mean -= delta / self.count
+        removed = delta * (volume - self.mean)
+        self.squared_deviations -= removed
+        # An outlier leaving the window, the rest is mostly rounding error. Rare enough that going over the samples
+        # again doesn't matter
+        if self.squared_deviations <= removed * _RECOMPUTE_FRACTION:
+            self._recompute()
+
+    def _recompute(self) -> None:
+        self.volume_sum = math.fsum(self.volumes)
+        self.mean = self.volume_sum / self.count
+        self.squared_deviations = math.fsum(
+            (volume - self.mean) ** 2 for volume in self.volumes
+        )
+
+
+class RollingVolumeWindow:
+    """
+    Running count, sum and variance of the trade volumes of each currency pair over a sliding window of time
+
+    Samples are expired lazily as the window moves forward, so every statistic is O(1) per currency pair instead of a
+    scan over every sample in the window
+    """
+
+    def __init__(self, window: timedelta):
+        self.window = window
+        self._samples: Deque[Tuple[datetime, str]] = deque()
+        self._totals: Dict[str, _WindowTotals] = {}
+
+    def add(self, record: CurrencyTradeVolumeRecord) -> None:
+        # Volumes loaded from the database are Decimals, so normalize them before mixing them with floats
+        volume = float(record.volume)
+        # Samples are expected to arrive in time order, anything older than the newest sample would break expiry
+        if self._samples and record.time < self._samples[-1][0]:
+            raise ValueError("Trade volume records must be added in time order")
+
+        self._samples.append((record.time, record.currency_pair))
+        totals = self._totals.setdefault(record.currency_pair, _WindowTotals())
+        totals.add(volume)
+
+    def expire(self, now: datetime) -> None:
+        """
+        Drop all of the samples that are no longer inside the window ending at the given time
+        """
+        window_start = now - self.window
+        while self._samples and self._samples[0][0] < window_start:
+            _, currency_pair = self._samples.popleft()
+            totals = self._totals[currency_pair]
+            if totals.count == 1:
+                # Start over from exactly zero so floating point error can't accumulate across quiet periods
+                del self._totals[currency_pair]
+            else:
+                totals.remove_oldest()
+
+    def average(self, currency_pair: str) -> Optional[float]:
+        totals = self._totals.get(currency_pair)
+        if totals is None:
+            return None
+
+        return totals.volume_sum / totals.count
+
+    def std_dev(self, currency_pair: str) -> Optional[float]:
+        """
+        Sample standard deviation, matching postgres' stddev(). None when there are fewer than two samples
+        """
+        totals = self._totals.get(currency_pair)
+        if totals is None or totals.count < 2:
+            return None
+
+        # Two passes in postgres and the in-memory store, Welford's method here comes out the same to rounding
+        return math.sqrt(max(totals.squared_deviations, 0.0) / (totals.count - 1))
+
+    def currency_pairs(self) -> Iterable[str]:
+        return self._totals.keys()
+
+
+class VolumeAggregates:
+    """
+    In-memory replacement for the hourly average and daily standard deviation queries in CurrencyTradeVolumeStore
+
+    Has to be loaded from the database on startup and then kept up to date with every recorded trade volume
+    """
+
+    def __init__(
+        self,
+        average_window: timedelta = AVERAGE_WINDOW,
+        rank_window: timedelta = RANK_WINDOW,
+    ):
+        self._average_window = RollingVolumeWindow(average_window)
+        self._rank_window = RollingVolumeWindow(rank_window)
+
+    @property
+    def history_window(self) -> timedelta:
+        """
+        How much history needs to be loaded to fully populate the aggregates
+        """
+        return max(self._average_window.window, self._rank_window.window)
+
+    def load(self, records: List[CurrencyTradeVolumeRecord]) -> None:
+        """
+        Replace the aggregates with the given history, which must be sorted by time
+        """
+        self._average_window = RollingVolumeWindow(self._average_window.window)
+        self._rank_window = RollingVolumeWindow(self._rank_window.window)
+        self.record(records)
+
+    def record(self, records: List[CurrencyTradeVolumeRecord]) -> None:
+        for record in sorted(records, key=lambda record: record.time):
+            self._average_window.add(record)
+            self._rank_window.add(record)
+
+    def get_currency_pair_averages(self, now: datetime) -> List[CurrencyPairAvg]:
+        """
+        Equivalent to CurrencyTradeVolumeStore.get_currency_pair_averages
+        """
+        self._average_window.expire(now)
+        averages: List[CurrencyPairAvg] = []
+        for currency_pair in self._average_window.currency_pairs():
+            avg_volume = self._average_window.average(currency_pair)
+            if avg_volume is not None:
+                averages.append(CurrencyPairAvg(currency_pair, avg_volume))
+
+        return averages
+
+    def get_currency_pair_ranks(
+        self, now: datetime, currency_pairs: Optional[AbstractSet[str]] = None
+    ) -> List[CurrencyPairRank]:
+        """
+        Equivalent to CurrencyTradeVolumeStore.get_currency_pair_ranks, including its tie-breaking
+
+        :param currency_pairs: Only rank these, like the store only ranks enabled currency pairs. Every currency pair
+        with trade volumes is ranked without it
+        """
+        self._rank_window.expire(now)
+        return rank_by_std_dev(
+            [
+                (currency_pair, self._rank_window.std_dev(currency_pair))
+                for currency_pair in self._rank_window.currency_pairs()
+                if currency_pairs is None or currency_pair in currency_pairs
+            ]
+        )
@@ -0,0 +1,90 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List
+
+from databases import Database
+
+_PARTITION_PREFIX = "currency_pair_volumes_p"
+
+# Ingest creates partitions this many days ahead so rows never land in the default partition while it keeps running
+DEFAULT_DAYS_AHEAD = 2
+
+
+@dataclass
+class VolumePartition:
+    name: str
+    day: date
+    """
+    The UTC day the partition holds trade volumes for
+    """
+
+    @property
+    def end(self) -> datetime:
+        return datetime.combine(self.day + timedelta(days=1), time(), timezone.utc)
+
+
+class VolumePartitionManager:
+    """
+    Manages the daily partitions of the currency_pair_volumes table
+    """
+
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def ensure_partitions(self, days_ahead: int = DEFAULT_DAYS_AHEAD) -> None:
+        """
+        Create the partitions for today and the next few days if they don't already exist
+        """
+        today = datetime.now(timezone.utc).date()
+        for offset in range(days_ahead + 1):
+            await self._db.execute(
+                "SELECT create_currency_pair_volumes_partition(:day)",
+                {"day": today + timedelta(days=offset)},
+            )
+
+    async def get_partitions(self) -> List[VolumePartition]:
+        """
+        Fetch the daily partitions currently attached to currency_pair_volumes, oldest first
+        """
+        query = """
+            SELECT child.relname AS name
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = 'currency_pair_volumes'
+            AND child.relname LIKE 'currency_pair_volumes_p%'
+            ORDER BY child.relname
+        """
+
+        rows = await self._db.fetch_all(query)
+        return [
+            VolumePartition(
+                name=row["name"],
+                day=datetime.strptime(
+                    row["name"][len(_PARTITION_PREFIX) :], "%Y%m%d"
+                ).date(),
+            )
+            for row in rows
+        ]
+
+    async def get_partitions_before(self, cutoff: datetime) -> List[VolumePartition]:
+        """
+        Every partition that only holds trade volumes older than the given time, oldest first
+        """
+        return [
+            partition
+            for partition in await self.get_partitions()
+            if partition.end <= cutoff
+        ]
+
+    async def detach_partition(self, partition: VolumePartition) -> None:
+        """
+        Detach a partition so it becomes a regular table that can be dropped with drop_partition
+        """
+        # Partition names come from the catalog, not user input, so they're safe to interpolate
+        await self._db.execute(
+            f'ALTER TABLE currency_pair_volumes DETACH PARTITION "{partition.name}"'
+        )
+
+    async def drop_partition(self, partition: VolumePartition) -> None:
+        await self._db.execute(f'DROP TABLE IF EXISTS "{partition.name}"')
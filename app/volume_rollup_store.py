@@ -0,0 +1,255 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+from databases import Database
+
+from app.currency_pair_registry import CurrencyPairRegistry
+from app.read_router import ReadRouter
+from app.types import (
+    CurrencyTradeVolumeRecord,
+    HistoryResolution,
+    VolumeRollupRecord,
+)
+
+ROLLUP_RESOLUTION_SECONDS = {
+    HistoryResolution.ONE_MINUTE: 60,
+    HistoryResolution.FIVE_MINUTES: 5 * 60,
+    HistoryResolution.ONE_HOUR: 60 * 60,
+}
+
+HISTORY_WINDOW = timedelta(hours=24)
+
+# Postgres allows at most 32767 bind parameters in a single statement
+_BUCKET_COLUMNS = 9
+_MAX_BUCKETS_PER_UPSERT = 32767 // _BUCKET_COLUMNS
+
+
+def select_resolution(
+    max_points: int, window: timedelta = HISTORY_WINDOW
+) -> HistoryResolution:
+    """
+    Pick the finest rollup resolution that fits in the given number of points, or the coarsest one if none do
+    """
+    for resolution, seconds in sorted(
+        ROLLUP_RESOLUTION_SECONDS.items(), key=lambda item: item[1]
+    ):
+        if window.total_seconds() / seconds <= max_points:
+            return resolution
+
+    return HistoryResolution.ONE_HOUR
+
+
+@dataclass
+class _Bucket:
+    min_volume: float
+    max_volume: float
+    volume_sum: float
+    sample_count: int
+    last_volume: float
+    last_fetch_time: datetime
+
+
+def _bucket_start(time: datetime, resolution_seconds: int) -> datetime:
+    timestamp = time.timestamp()
+    return datetime.fromtimestamp(
+        timestamp - timestamp % resolution_seconds, timezone.utc
+    )
+
+
+@lru_cache(maxsize=8)
+def _upsert_query(bucket_count: int) -> str:
+    rows = ",".join(
+        f"(:currency_pair_id_{i}, :resolution_seconds_{i}, :bucket_start_{i}, :min_volume_{i}, :max_volume_{i}, "
+        f":volume_sum_{i}, :sample_count_{i}, :last_volume_{i}, :last_fetch_time_{i})"
+        for i in range(bucket_count)
+    )
+    return f"""
+        INSERT INTO currency_pair_volume_rollups AS rollup (
+            currency_pair_id, resolution_seconds, bucket_start, min_volume, max_volume,
+            volume_sum, sample_count, last_volume, last_fetch_time
+        )
+        VALUES {rows}
+        ON CONFLICT (currency_pair_id, resolution_seconds, bucket_start) DO UPDATE SET
+            min_volume = LEAST(rollup.min_volume, EXCLUDED.min_volume),
+            max_volume = GREATEST(rollup.max_volume, EXCLUDED.max_volume),
+            volume_sum = rollup.volume_sum + EXCLUDED.volume_sum,
+            sample_count = rollup.sample_count + EXCLUDED.sample_count,
+            last_volume = CASE
+                WHEN EXCLUDED.last_fetch_time >= rollup.last_fetch_time THEN EXCLUDED.last_volume
+                ELSE rollup.last_volume
+            END,
+            last_fetch_time = GREATEST(rollup.last_fetch_time, EXCLUDED.last_fetch_time)
+    """
+
+
+class VolumeRollupStore:
+    """
+    Per currency pair summaries of trade volumes over fixed buckets of time, kept up to date as volumes are recorded
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        registry: CurrencyPairRegistry,
+        reads: Optional[ReadRouter] = None,
+    ):
+        """
+        :param reads: Where rollup history is read from, the primary database without it
+        """
+        self._db = db
+        self._registry = registry
+        self._reads = reads if reads is not None else ReadRouter(db, [])
+
+    async def record_rollups(self, records: List[CurrencyTradeVolumeRecord]):
+        """
+        Fold the given trade volumes into the buckets of every resolution
+        """
+        # Postgres can't update the same row twice in one upsert, so combine records sharing a bucket first
+        buckets: Dict[Tuple[int, int, datetime], _Bucket] = {}
+        for record in records:
+            volume = float(record.volume)
+            currency_pair_id = self._registry.id(record.currency_pair)
+            for resolution_seconds in ROLLUP_RESOLUTION_SECONDS.values():
+                key = (
+                    currency_pair_id,
+                    resolution_seconds,
+                    _bucket_start(record.time, resolution_seconds),
+                )
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = _Bucket(
+                        volume, volume, volume, 1, volume, record.time
+                    )
+                    continue
+
+                bucket.min_volume = min(bucket.min_volume, volume)
+                bucket.max_volume = max(bucket.max_volume, volume)
+                bucket.volume_sum += volume
+                bucket.sample_count += 1
+                if record.time >= bucket.last_fetch_time:
+                    bucket.last_volume = volume
+                    bucket.last_fetch_time = record.time
+
+        items = list(buckets.items())
+        async with self._db.transaction():
+            for offset in range(0, len(items), _MAX_BUCKETS_PER_UPSERT):
+                batch = items[offset : offset + _MAX_BUCKETS_PER_UPSERT]
+                values: Dict[str, Any] = {}
+                for i, (
+                    (currency_pair_id, resolution_seconds, bucket_start),
+                    bucket,
+                ) in enumerate(batch):
+                    values[f"currency_pair_id_{i}"] = currency_pair_id
+                    values[f"resolution_seconds_{i}"] = resolution_seconds
+                    values[f"bucket_start_{i}"] = bucket_start
+                    values[f"min_volume_{i}"] = bucket.min_volume
+                    values[f"max_volume_{i}"] = bucket.max_volume
+                    values[f"volume_sum_{i}"] = bucket.volume_sum
+                    values[f"sample_count_{i}"] = bucket.sample_count
+                    values[f"last_volume_{i}"] = bucket.last_volume
+                    values[f"last_fetch_time_{i}"] = bucket.last_fetch_time
+
+                await self._db.execute(_upsert_query(len(batch)), values)
+
+    async def get_rollup_history(
+        self,
+        currency_pair: str,
+        resolution: HistoryResolution,
+    ) -> List[VolumeRollupRecord]:
+        """
+        Fetch the buckets of the given resolution for the given currency pair covering the last 24 hours, oldest first
+        """
+        query = """
+            SELECT
+                bucket_start,
+                volume_sum / sample_count AS avg_volume,
+                min_volume,
+                max_volume,
+                last_volume
+            FROM currency_pair_volume_rollups
+            WHERE currency_pair_id = :currency_pair_id
+            AND resolution_seconds = :resolution_seconds
+            AND bucket_start >= :since
+            ORDER BY bucket_start
+        """
+        resolution_seconds = ROLLUP_RESOLUTION_SECONDS[resolution]
+        # Include the bucket that straddles the start of the window
+        since = _bucket_start(
+            datetime.now(timezone.utc) - HISTORY_WINDOW, resolution_seconds
+        )
+
+        rows = await self._reads.fetch_all(
+            query,
+            {
+                "currency_pair_id": self._registry.id(currency_pair),
+                "resolution_seconds": resolution_seconds,
+                "since": since,
+            },
+        )
+        return [
+            VolumeRollupRecord(
+                time=row["bucket_start"],
+                currency_pair=currency_pair,
+                volume=row["avg_volume"],
+                min_volume=row["min_volume"],
+                max_volume=row["max_volume"],
+                last_volume=row["last_volume"],
+            )
+            for row in rows
+        ]
+
+    async def get_rollup_histories(
+        self,
+        currency_pairs: Collection[str],
+        resolution: HistoryResolution,
+    ) -> Dict[str, List[VolumeRollupRecord]]:
+        """
+        Fetch the buckets of the given resolution for several currency pairs in one query, see get_rollup_history
+        """
+        query = """
+            SELECT
+                currency_pair_id,
+                bucket_start,
+                volume_sum / sample_count AS avg_volume,
+                min_volume,
+                max_volume,
+                last_volume
+            FROM currency_pair_volume_rollups
+            WHERE currency_pair_id = ANY(:currency_pair_ids)
+            AND resolution_seconds = :resolution_seconds
+            AND bucket_start >= :since
+            ORDER BY bucket_start
+        """
+        resolution_seconds = ROLLUP_RESOLUTION_SECONDS[resolution]
+        since = _bucket_start(
+            datetime.now(timezone.utc) - HISTORY_WINDOW, resolution_seconds
+        )
+
+        histories: Dict[str, List[VolumeRollupRecord]] = {
+            currency_pair: [] for currency_pair in currency_pairs
+        }
+        rows = await self._reads.fetch_all(
+            query,
+            {
+                "currency_pair_ids": [
+                    self._registry.id(currency_pair) for currency_pair in currency_pairs
+                ],
+                "resolution_seconds": resolution_seconds,
+                "since": since,
+            },
+        )
+        for row in rows:
+            currency_pair = self._registry.symbol(row["currency_pair_id"])
+            histories[currency_pair].append(
+                VolumeRollupRecord(
+                    time=row["bucket_start"],
+                    currency_pair=currency_pair,
+                    volume=row["avg_volume"],
+                    min_volume=row["min_volume"],
+                    max_volume=row["max_volume"],
+                    last_volume=row["last_volume"],
+                )
+            )
+        return histories
@@ -0,0 +1,209 @@
+import math
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, List, Mapping, Optional, Sequence
+
+try:
+    import numpy as np
+
+    _HAS_NUMPY = True
+except ImportError:  # pragma: no cover - numpy is optional
+    _HAS_NUMPY = False
+
+EWMA_ALPHA = 0.1
+"""
+Weight of the newest sample in the exponentially weighted moving average, the weights halve about every 7 samples
+"""
+SPIKE_PERCENTILE = 95
+
+
+class VolumeMetric(str, Enum):
+    """
+    What currency pairs can be ranked by, highest first
+    """
+
+    STD_DEV = "std_dev"
+    COEFFICIENT_OF_VARIATION = "coefficient_of_variation"
+    """
+    Standard deviation relative to the mean, so pairs with large volumes don't always rank first
+    """
+    Z_SCORE = "z_score"
+    """
+    How many standard deviations the latest volume is from the mean
+    """
+    EWMA_RATIO = "ewma_ratio"
+    """
+    Latest volume over the exponentially weighted moving average
+    """
+    PERCENTILE_RATIO = "percentile_ratio"
+    """
+    Latest volume over the SPIKE_PERCENTILE'th percentile volume
+    """
+
+
+@dataclass
+class VolumeStatistics:
+    count: int
+    mean: float
+    std_dev: Optional[float]
+    """
+    Sample standard deviation like postgres' stddev(), None with a single sample
+    """
+    coefficient_of_variation: Optional[float]
+    latest: float
+    z_score: Optional[float]
+    ewma: float
+    percentile: float
+
+    @property
+    def ewma_ratio(self) -> Optional[float]:
+        return self.latest / self.ewma if self.ewma else None
+
+    @property
+    def percentile_ratio(self) -> Optional[float]:
+        return self.latest / self.percentile if self.percentile else None
+
+    def value(self, metric: VolumeMetric) -> Optional[float]:
+        value: Optional[float] = getattr(self, metric.value)
+        return value
+
+
+def numpy_available() -> bool:
+    return _HAS_NUMPY
+
+
+def require_numpy() -> None:
+    if not _HAS_NUMPY:
+        raise RuntimeError("Volume statistics need numpy, pip install numpy")
+
+
+def _optional(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def compute_volume_statistics(
+    volumes: Mapping[str, Sequence[float]],
+    ewma_alpha: float = EWMA_ALPHA,
+    percentile: float = SPIKE_PERCENTILE,
+) -> Dict[str, VolumeStatistics]:
+    """
+    Statistics of every currency pair's volumes, oldest first, computed together with array operations instead of a
+    loop over the samples of each currency pair. Currency pairs without any volumes are left out
+    """
+    require_numpy()
+    currency_pairs = [pair for pair, values in volumes.items() if len(values)]
+    if not currency_pairs:
+        return {}
+
+    counts = np.array([len(volumes[pair]) for pair in currency_pairs])
+    width = int(counts.max())
+    # One row per currency pair, right aligned so the latest volumes share the last column and the EWMA weights line
+    # up by age. Rows with fewer samples are padded with NaN on the left
+    matrix = np.full((len(currency_pairs), width), np.nan)
+    for row, currency_pair in enumerate(currency_pairs):
+        matrix[row, width - counts[row] :] = np.asarray(
+            volumes[currency_pair], dtype=np.float64
+        )
+    present = ~np.isnan(matrix)
+    filled = np.where(present, matrix, 0.0)
+
+    mean = filled.sum(axis=1) / counts
+    deviations = np.where(present, matrix - mean[:, np.newaxis], 0.0)
+    # Divided by n - 1 like postgres' stddev(), left undefined for a single sample
+    variance = (deviations**2).sum(axis=1) / np.maximum(counts - 1, 1)
+    std_dev = np.where(counts > 1, np.sqrt(variance), np.nan)
+    latest = matrix[:, -1]
+
+    weights = (1 - ewma_alpha) ** np.arange(width - 1, -1, -1, dtype=np.float64)
+    ewma = (filled @ weights) / (present @ weights)
+    # np.nanpercentile handles every row on its own, sorting once with the NaN padding at the end is a lot faster
+    ordered = np.sort(matrix, axis=1)
+    position = (counts - 1) * (percentile / 100)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    lower_values = np.take_along_axis(ordered, lower[:, np.newaxis], axis=1)[:, 0]
+    upper_values = np.take_along_axis(ordered, upper[:, np.newaxis], axis=1)[:, 0]
+    percentiles = lower_values + (upper_values - lower_values) * (position - lower)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coefficient_of_variation = np.where(mean != 0, std_dev / mean, np.nan)
+        z_score = np.where(std_dev > 0, (latest - mean) / std_dev, np.nan)
+
+    columns = zip(
+        counts.tolist(),
+        mean.tolist(),
+        std_dev.tolist(),
+        coefficient_of_variation.tolist(),
+        latest.tolist(),
+        z_score.tolist(),
+        ewma.tolist(),
+        percentiles.tolist(),
+    )
+    return {
+        currency_pair: VolumeStatistics(
+            count=count,
+            mean=pair_mean,
+            std_dev=_optional(pair_std_dev),
+            coefficient_of_variation=_optional(pair_cv),
+            latest=pair_latest,
+            z_score=_optional(pair_z_score),
+            ewma=pair_ewma,
+            percentile=pair_percentile,
+        )
+        for currency_pair, (
+            count,
+            pair_mean,
+            pair_std_dev,
+            pair_cv,
+            pair_latest,
+            pair_z_score,
+            pair_ewma,
+            pair_percentile,
+        ) in zip(currency_pairs, columns)
+    }
+
+
+def statistics_from_aggregates(
+    count: int,
+    mean: float,
+    std_dev: Optional[float],
+    latest: float,
+    ewma: float,
+    percentile: float,
+) -> VolumeStatistics:
+    """
+    Statistics of a currency pair whose aggregates were computed elsewhere, like by postgres, with the rest derived the
+    same way as compute_volume_statistics does
+    """
+    return VolumeStatistics(
+        count=count,
+        mean=mean,
+        std_dev=std_dev,
+        coefficient_of_variation=(
+            std_dev / mean if std_dev is not None and mean != 0 else None
+        ),
+        latest=latest,
+        z_score=(latest - mean) / std_dev if std_dev else None,
+        ewma=ewma,
+        percentile=percentile,
+    )
+
+
+def order_by_metric(
+    statistics: Mapping[str, VolumeStatistics], metric: VolumeMetric
+) -> List[str]:
+    """
+    Currency pairs in rank order, ties are broken by currency pair like CurrencyTradeVolumeStore.get_currency_pair_ranks
+    """
+    values = [
+        (currency_pair, pair_statistics.value(metric))
+        for currency_pair, pair_statistics in statistics.items()
+    ]
+    # Postgres sorts NULLs first when sorting descending, so pairs with a single sample come first for STD_DEV to match
+    # the database. Every other metric is about how unusual the latest volume is, and no value means nothing unusual
+    nulls_first = metric == VolumeMetric.STD_DEV
+    values.sort(
+        key=lambda item: ((item[1] is None) == nulls_first, item[1] or 0.0, item[0]),
+        reverse=True,
+    )
+    return [currency_pair for currency_pair, _ in values]
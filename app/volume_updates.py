@@ -0,0 +1,329 @@
+import asyncio
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Collection,
+    Deque,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Set,
+)
+
+from databases import Database
+
+from app.currency_trade_volume_store import CurrencyPairRank
+from app.db_pool import PooledDatabase
+from app.types import CurrencyTradeVolumeRecord
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "volume_updates"
+
+
+@dataclass
+class VolumeTick:
+    """
+    What changed in one ingest tick
+    """
+
+    trade_volumes: List[CurrencyTradeVolumeRecord]
+    ranks: List[CurrencyPairRank]
+    """
+    Every currency pair's rank after the tick
+    """
+    total_tracked_currency_pairs: int
+    updated_at: Optional[datetime] = None
+
+
+@dataclass
+class CurrencyPairUpdate:
+    """
+    The samples a currency pair gained in a tick, pushed to subscribers instead of them downloading the whole history
+    again
+    """
+
+    currency_pair: str
+    history: List[CurrencyTradeVolumeRecord]
+    """
+    Only the new samples, can be empty when just the rank changed
+    """
+    rank: Optional[int]
+    total_tracked_currency_pairs: int
+    updated_at: Optional[datetime] = None
+
+
+class VolumeUpdatePublisher(ABC):
+    @abstractmethod
+    async def publish(self, tick: VolumeTick) -> None:
+        pass
+
+
+class Subscription:
+    """
+    Updates for a set of currency pairs, queued until the subscriber reads them
+    """
+
+    def __init__(self, currency_pairs: Collection[str], max_queued: int):
+        self.currency_pairs: FrozenSet[str] = frozenset(currency_pairs)
+        self._max_queued = max_queued
+        self._pending: Deque[CurrencyPairUpdate] = deque()
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def _push(self, update: CurrencyPairUpdate) -> bool:
+        if len(self._pending) >= self._max_queued:
+            return False
+
+        self._pending.append(update)
+        self._ready.set()
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    async def get(
+        self, timeout: Optional[float] = None
+    ) -> Optional[List[CurrencyPairUpdate]]:
+        """
+        Wait for updates and take every one that's queued
+
+        :return: The updates, an empty list if there weren't any within the timeout, or None once the subscription is
+        closed
+        """
+        if not self._pending and not self.closed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+
+        if not self._pending and self.closed:
+            return None
+
+        updates = list(self._pending)
+        self._pending.clear()
+        self._ready.clear()
+        return updates
+
+    async def stream(
+        self,
+        keepalive_seconds: float,
+        max_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> AsyncIterator[List[CurrencyPairUpdate]]:
+        """
+        Yield updates as they come in, or an empty list after keepalive_seconds without any. Ends once the subscription
+        is closed, or once it's been open for max_seconds. Servers wait for open responses before shutting down, so
+        streams have to end on their own, clients reconnect
+
+        :param max_seconds: Checked between updates and keepalives, so a stream can run up to keepalive_seconds longer
+        """
+        deadline = clock() + max_seconds
+        while clock() < deadline:
+            updates = await self.get(timeout=keepalive_seconds)
+            if updates is None:
+                return
+            yield updates
+
+
+class VolumeUpdateHub(VolumeUpdatePublisher):
+    """
+    Fans ingest ticks out to the subscribers in this process, each only gets the currency pairs it subscribed to
+
+    Every currency pair is only sent samples newer than the last ones it was sent, and a rank only when it changed. So
+    the same tick arriving twice, once published locally and once through postgres, doesn't reach subscribers twice
+    """
+
+    def __init__(self, max_queued: int = 100):
+        """
+        :param max_queued: Updates a subscriber can fall behind by before it's dropped, it has to subscribe again and
+        reload the history it missed
+        """
+        self._max_queued = max_queued
+        self._subscriptions: Set[Subscription] = set()
+        self._latest: Dict[str, datetime] = {}
+        self._ranks: Dict[str, int] = {}
+        self._closed = False
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, currency_pairs: Collection[str]) -> Subscription:
+        """
+        Once the hub is closed the subscription is closed from the start
+        """
+        subscription = Subscription(currency_pairs, self._max_queued)
+        if self._closed:
+            subscription.close()
+        else:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+        subscription.close()
+
+    def close(self) -> None:
+        """
+        End every subscription and any made later, for shutting down
+        """
+        self._closed = True
+        for subscription in list(self._subscriptions):
+            self.unsubscribe(subscription)
+
+    async def publish(self, tick: VolumeTick) -> None:
+        updates = self._updates(tick)
+        if not updates:
+            return
+
+        for subscription in list(self._subscriptions):
+            for currency_pair in subscription.currency_pairs & updates.keys():
+                if not subscription._push(updates[currency_pair]):
+                    logger.warning(
+                        "Dropping a subscriber that fell %d updates behind",
+                        self._max_queued,
+                    )
+                    self.unsubscribe(subscription)
+                    break
+
+    def _updates(self, tick: VolumeTick) -> Dict[str, CurrencyPairUpdate]:
+        history: Dict[str, List[CurrencyTradeVolumeRecord]] = defaultdict(list)
+        for record in sorted(tick.trade_volumes, key=lambda record: record.time):
+            latest = self._latest.get(record.currency_pair)
+            if latest is None or record.time > latest:
+                history[record.currency_pair].append(record)
+        for currency_pair, records in history.items():
+            self._latest[currency_pair] = records[-1].time
+
+        ranks = {rank.currency_pair: rank.rank for rank in tick.ranks}
+        changed = set(history)
+        for currency_pair in ranks.keys() | self._ranks.keys():
+            if ranks.get(currency_pair) != self._ranks.get(currency_pair):
+                changed.add(currency_pair)
+        self._ranks = ranks
+
+        return {
+            currency_pair: CurrencyPairUpdate(
+                currency_pair,
+                history.get(currency_pair, []),
+                ranks.get(currency_pair),
+                tick.total_tracked_currency_pairs,
+                tick.updated_at,
+            )
+            for currency_pair in changed
+        }
+
+
+class PostgresVolumeUpdatePublisher(VolumeUpdatePublisher):
+    """
+    Tells web processes that a tick was recorded through postgres NOTIFY, for when ingest runs in a process of its own
+
+    NOTIFY payloads are limited to 8000 bytes, so only the time the tick's samples start at is sent and listeners load
+    the rest themselves, see PostgresVolumeUpdateListener
+    """
+
+    def __init__(self, db: Database, channel: str = NOTIFY_CHANNEL):
+        self._db = db
+        self._channel = channel
+
+    async def publish(self, tick: VolumeTick) -> None:
+        if not tick.trade_volumes:
+            return
+
+        since = min(record.time for record in tick.trade_volumes)
+        await self._db.execute(
+            "SELECT pg_notify(:channel, :payload)",
+            {
+                "channel": self._channel,
+                "payload": json.dumps({"since": since.isoformat()}),
+            },
+        )
+
+
+class PostgresVolumeUpdateListener:
+    """
+    Listens for ticks published by PostgresVolumeUpdatePublisher, loads them and publishes them to the hub
+
+    The listening connection is taken from the pool for as long as the listener runs. Ticks published while it's
+    reconnecting are missed, subscribers get those samples with the next tick
+    """
+
+    def __init__(
+        self,
+        db: PooledDatabase,
+        hub: VolumeUpdateHub,
+        load_tick: Callable[[datetime], Awaitable[VolumeTick]],
+        channel: str = NOTIFY_CHANNEL,
+        reconnect_seconds: float = 5.0,
+    ):
+        """
+        :param load_tick: Loads the tick of the trade volumes recorded since the given time
+        """
+        self._db = db
+        self._hub = hub
+        self._load_tick = load_tick
+        self._channel = channel
+        self._reconnect_seconds = reconnect_seconds
+        # Created in start so they belong to the running event loop
+        self._notifications: Optional["asyncio.Queue[str]"] = None
+        self._tasks: List["asyncio.Task[None]"] = []
+
+    def start(self) -> None:
+        self._notifications = asyncio.Queue()
+        self._tasks = [
+            asyncio.ensure_future(self._listen()),
+            asyncio.ensure_future(self._work()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _on_notify(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        assert self._notifications is not None
+        self._notifications.put_nowait(payload)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self._db.dedicated_connection() as connection:
+                    raw = connection.raw_connection
+                    await raw.add_listener(self._channel, self._on_notify)
+                    logger.info("Listening for volume updates on %s", self._channel)
+                    # asyncpg only notices a dropped connection when it's used
+                    while not raw.is_closed():
+                        await asyncio.sleep(self._reconnect_seconds)
+                        await raw.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning(
+                    "Lost the connection listening for volume updates, reconnecting",
+                    exc_info=True,
+                )
+            await asyncio.sleep(self._reconnect_seconds)
+
+    async def _work(self) -> None:
+        # One at a time, so subscribers get ticks in the order they were recorded
+        assert self._notifications is not None
+        while True:
+            payload = await self._notifications.get()
+            try:
+                since = datetime.fromisoformat(json.loads(payload)["since"])
+                await self._hub.publish(await self._load_tick(since))
+            except Exception:
+                logger.exception("Failed to publish volume update %s", payload)
@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import os
+import sys
+from typing import List, Tuple
+
+from databases import Database
+
+from app.currency_trade_volume_store import (
+    DEFAULT_INSERT_BATCH_SIZE,
+    MAX_INSERT_BATCH_SIZE,
+)
+from benchmarks.harness import (
+    BenchmarkResult,
+    compare,
+    environment,
+    format_summary,
+    write_results,
+)
+from benchmarks.scenarios import (
+    BenchmarkConfig,
+    bench_fetch_trade_volumes,
+    bench_record_trade_volumes,
+    bench_store_queries,
+    bench_volume_history_api,
+    migrate,
+)
+
+SCENARIOS = ["fetch", "record", "store", "api"]
+# Every scenario but fetch needs a database
+_DATABASE_SCENARIOS = {"record", "store", "api"}
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",")]
+
+
+def _size(value: str) -> Tuple[int, int]:
+    """
+    PAIRSxSAMPLES, like 1000x1440 for a day of one minute ticks of 1000 currency pairs
+    """
+    pairs, samples = value.lower().split("x")
+    return int(pairs), int(samples)
+
+
+def _size_list(value: str) -> List[Tuple[int, int]]:
+    return [_size(item) for item in value.split(",")]
+
+
+async def run(config: BenchmarkConfig, scenarios: List[str]) -> List[BenchmarkResult]:
+    results: List[BenchmarkResult] = []
+
+    def report(new_results: List[BenchmarkResult]):
+        for result in new_results:
+            print(format_summary(result), flush=True)
+        results.extend(new_results)
+
+    if "fetch" in scenarios:
+        report(await bench_fetch_trade_volumes(config))
+
+    if _DATABASE_SCENARIOS.intersection(scenarios):
+        db = Database(config.database_url)
+        await db.connect()
+        try:
+            if "record" in scenarios:
+                report(await bench_record_trade_volumes(config, db))
+            if "store" in scenarios:
+                report(await bench_store_queries(config, db))
+            if "api" in scenarios:
+                report(await bench_volume_history_api(config, db))
+        finally:
+            await db.disconnect()
+
+    return results
+
+
+def run_command(args: argparse.Namespace) -> int:
+    scenarios = args.scenario or SCENARIOS
+    if _DATABASE_SCENARIOS.intersection(scenarios):
+        if not args.database_url:
+            print(
+                "Set BENCHMARK_DATABASE_URL or --database-url to a database the benchmarks can empty",
+                file=sys.stderr,
+            )
+            return 2
+        migrate(args.database_url)
+
+    config = BenchmarkConfig(
+        database_url=args.database_url,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        ticker_sizes=args.ticker_sizes,
+        tracked_pairs=args.tracked_pairs,
+        insert_pairs=args.insert_pairs,
+        insert_batch_sizes=args.insert_batch_sizes,
+        table_sizes=args.table_sizes,
+        api_table_size=args.api_table_size,
+        api_concurrency=args.api_concurrency,
+        api_requests=args.api_requests,
+        api_workers=args.api_workers,
+    )
+    env = environment()
+    results = asyncio.run(run(config, scenarios))
+    if args.output:
+        write_results(args.output, env, results)
+    return 0
+
+
+def compare_command(args: argparse.Namespace) -> int:
+    regressions = 0
+    for key, baseline, current in compare(args.baseline, args.current, args.stat):
+        change = (current - baseline) / baseline * 100 if baseline else 0.0
+        regressed = args.max_regression is not None and change > args.max_regression
+        regressions += regressed
+        print(
+            f"{key:<70} {baseline * 1000:9.2f}ms -> {current * 1000:9.2f}ms {change:+7.1f}%"
+            + ("  REGRESSED" if regressed else "")
+        )
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Measure ingest, the store queries and the history API against synthetic data",
+    )
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    run_parser = commands.add_parser("run", help="Run benchmarks")
+    run_parser.set_defaults(handler=run_command)
+    run_parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=SCENARIOS,
+        help="Only run this scenario, can be repeated. Runs all of them by default",
+    )
+    run_parser.add_argument(
+        "--database-url",
+        default=os.environ.get("BENCHMARK_DATABASE_URL"),
+        help="Migrated and then emptied before every scenario, never point it at real data",
+    )
+    run_parser.add_argument("--output", help="Write the results to this JSON file")
+    run_parser.add_argument("--repeat", type=int, default=20)
+    run_parser.add_argument("--warmup", type=int, default=2)
+    run_parser.add_argument("--ticker-sizes", type=_int_list, default=[1000, 10000])
+    run_parser.add_argument("--tracked-pairs", type=int, default=100)
+    run_parser.add_argument("--insert-pairs", type=_int_list, default=[100, 5000])
+    run_parser.add_argument(
+        "--insert-batch-sizes",
+        type=_int_list,
+        default=[DEFAULT_INSERT_BATCH_SIZE, MAX_INSERT_BATCH_SIZE],
+    )
+    run_parser.add_argument(
+        "--table-sizes", type=_size_list, default=[(100, 1440), (1000, 1440)]
+    )
+    run_parser.add_argument("--api-table-size", type=_size, default=(100, 1440))
+    run_parser.add_argument("--api-concurrency", type=_int_list, default=[1, 10, 50])
+    run_parser.add_argument("--api-requests", type=int, default=500)
+    run_parser.add_argument("--api-workers", type=int, default=1)
+
+    compare_parser = commands.add_parser(
+        "compare", help="Compare the results of two runs"
+    )
+    compare_parser.set_defaults(handler=compare_command)
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--stat", default="p50", choices=["min", "mean", "p50", "p90", "p99", "max"]
+    )
+    compare_parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="Exit with an error if any benchmark got slower by more than this percentage",
+    )
+
+    args = parser.parse_args()
+    exit_code: int = args.handler(args)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
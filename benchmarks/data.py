@@ -0,0 +1,130 @@
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Sequence
+
+from databases import Database
+
+from app.types import CurrencyTradeVolumeRecord
+
+_QUOTE_CURRENCIES = ["BTC", "ETH", "USD"]
+
+
+def make_currency_pairs(count: int) -> List[str]:
+    """
+    Symbols that look like the exchange's, the same ones for the same count
+    """
+    return [
+        f"C{index:05d}/{_QUOTE_CURRENCIES[index % len(_QUOTE_CURRENCIES)]}"
+        for index in range(count)
+    ]
+
+
+def make_ticker(currency_pairs: Sequence[str], seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Full ticker items with every field livecoin sends, not just the ones we read, so parsing skips as much as it would
+    in production
+    """
+    rng = random.Random(seed)
+    items: List[Dict[str, Any]] = []
+    for currency_pair in currency_pairs:
+        last = rng.lognormvariate(-8, 2)
+        items.append(
+            {
+                "cur": currency_pair.split("/")[0],
+                "symbol": currency_pair,
+                "last": last,
+                "high": last * 1.05,
+                "low": last * 0.95,
+                "volume": rng.lognormvariate(8, 2),
+                "vwap": last * 1.01,
+                "max_bid": last * 1.04,
+                "min_ask": last * 0.96,
+                "best_bid": last * 0.999,
+                "best_ask": last * 1.001,
+            }
+        )
+    return items
+
+
+def make_trade_volume_records(
+    currency_pairs: Sequence[str],
+    samples: int,
+    end: datetime,
+    interval: timedelta,
+    seed: int = 0,
+) -> List[CurrencyTradeVolumeRecord]:
+    """
+    samples trade volumes for each currency pair, one tick every interval up to end, oldest first. Volumes follow a
+    random walk per currency pair so the statistics over them aren't degenerate
+    """
+    rng = random.Random(seed)
+    volumes = {pair: rng.lognormvariate(8, 2) for pair in currency_pairs}
+    records: List[CurrencyTradeVolumeRecord] = []
+    for sample in range(samples):
+        time = end - interval * (samples - 1 - sample)
+        for currency_pair in currency_pairs:
+            volumes[currency_pair] *= rng.lognormvariate(0, 0.05)
+            records.append(
+                CurrencyTradeVolumeRecord(time, currency_pair, volumes[currency_pair])
+            )
+    return records
+
+
+async def reset_database(db: Database) -> None:
+    """
+    Remove every currency pair and everything recorded about them. Only ever point this at a database of its own
+    """
+    query = """
+        TRUNCATE tracked_currency_pairs, currency_pair_volumes, currency_pair_ranks,
+            currency_pair_volume_rollups, alert_states
+        RESTART IDENTITY CASCADE
+    """
+
+    await db.execute(query)
+
+
+async def seed_currency_pairs(db: Database, currency_pairs: Sequence[str]) -> None:
+    await db.execute(
+        """
+        INSERT INTO tracked_currency_pairs (symbol)
+        SELECT unnest(CAST(:symbols AS text[]))
+        """,
+        {"symbols": list(currency_pairs)},
+    )
+
+
+async def seed_trade_volumes(
+    db: Database, samples: int, end: datetime, interval: timedelta, seed: float = 0.5
+) -> None:
+    """
+    samples trade volumes for every tracked currency pair, one tick every interval up to end
+
+    Millions of rows take minutes through record_trade_volumes, so they're generated inside postgres instead. The
+    partitions they land in are created first, like ingest does
+    """
+    start = end - interval * (samples - 1)
+    await db.execute(
+        """
+        SELECT create_currency_pair_volumes_partition(day::date)
+        FROM generate_series(
+            CAST(CAST(:start AS timestamptz) AT TIME ZONE 'UTC' AS date),
+            CAST(CAST(:end AS timestamptz) AT TIME ZONE 'UTC' AS date),
+            INTERVAL '1 day'
+        ) AS day
+        """,
+        {"start": start, "end": end},
+    )
+    async with db.transaction():
+        # random() has to be seeded on the connection running the insert
+        await db.execute("SELECT setseed(:seed)", {"seed": seed})
+        await db.execute(
+            """
+            INSERT INTO currency_pair_volumes (currency_pair_id, fetch_time, volume)
+            SELECT pair.id, CAST(:end AS timestamptz) - CAST(:interval AS interval) * sample,
+                round(CAST(exp(8 + 2 * random()) AS numeric), 8)
+            FROM tracked_currency_pairs pair
+            CROSS JOIN generate_series(0, :samples - 1) AS sample
+            """,
+            {"end": end, "interval": interval, "samples": samples},
+        )
+    await db.execute("ANALYZE currency_pair_volumes")
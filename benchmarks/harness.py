@@ -0,0 +1,141 @@
+import json
+import math
+import platform
+import subprocess
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+PERCENTILES = [50, 90, 99]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Linear interpolation between the closest ranks, like numpy's default
+    """
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    params: Dict[str, Any]
+    seconds: List[float]
+    """
+    How long each measured run took, warmup runs aren't included
+    """
+    counters: Dict[str, float] = field(default_factory=dict)
+    """
+    Anything else worth comparing between runs, like rows per second or failed requests
+    """
+
+    @property
+    def key(self) -> str:
+        params = ",".join(f"{name}={value}" for name, value in self.params.items())
+        return f"{self.name}[{params}]"
+
+    def summary(self) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {
+            "name": self.name,
+            "params": self.params,
+            "runs": len(self.seconds),
+            "min": min(self.seconds),
+            "mean": sum(self.seconds) / len(self.seconds),
+            "max": max(self.seconds),
+        }
+        for pct in PERCENTILES:
+            summary[f"p{pct}"] = percentile(self.seconds, pct)
+        summary.update(self.counters)
+        return summary
+
+
+async def measure(
+    run: Callable[[], Awaitable[Any]], repeat: int, warmup: int = 1
+) -> List[float]:
+    """
+    Time repeat runs one after the other, after warmup runs that fill caches and prepare statements
+    """
+    for _ in range(warmup):
+        await run()
+
+    seconds: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await run()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", *args],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ).stdout.decode()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    """
+    What the results were measured on, so runs from different commits or machines aren't mistaken for each other
+    """
+    commit = _git("rev-parse", "HEAD")
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": commit.strip() if commit is not None else None,
+        "dirty": bool(status) if status is not None else None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def write_results(
+    path: str, env: Dict[str, Any], results: List[BenchmarkResult]
+) -> None:
+    with open(path, "w") as output:
+        json.dump(
+            {**env, "results": [result.summary() for result in results]},
+            output,
+            indent=2,
+        )
+
+
+def format_summary(result: BenchmarkResult) -> str:
+    summary = result.summary()
+    line = f"{result.key:<70} p50 {summary['p50'] * 1000:9.2f}ms  p99 {summary['p99'] * 1000:9.2f}ms"
+    for name, value in result.counters.items():
+        line += f"  {name} {value:,.0f}"
+    return line
+
+
+def _load_summaries(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path) as results_file:
+        results = json.load(results_file)["results"]
+    return {
+        BenchmarkResult(result["name"], result["params"], []).key: result
+        for result in results
+    }
+
+
+def compare(
+    baseline_path: str, current_path: str, stat: str = "p50"
+) -> List[Tuple[str, float, float]]:
+    """
+    The given statistic of every benchmark that's in both results files, as (key, baseline, current)
+    """
+    baseline = _load_summaries(baseline_path)
+    current = _load_summaries(current_path)
+    return [
+        (key, baseline[key][stat], current[key][stat])
+        for key in current
+        if key in baseline
+    ]
@@ -0,0 +1,378 @@
+import asyncio
+import itertools
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+
+import httpx
+from databases import Database
+
+from app.currency_pair_registry import CurrencyPairRegistry
+from app.currency_trade_volume_store import CurrencyTradeVolumeStore
+from app.livecoin_api import FetchStrategy, LivecoinApi
+from app.volume_partitions import VolumePartitionManager
+from benchmarks.data import (
+    make_currency_pairs,
+    make_ticker,
+    make_trade_volume_records,
+    reset_database,
+    seed_currency_pairs,
+    seed_trade_volumes,
+)
+from benchmarks.harness import BenchmarkResult, measure, percentile
+from benchmarks.ticker_server import FakeTickerServer
+
+HISTORY_WINDOW = timedelta(hours=24)
+
+# The app refuses to start without these, none of them matter for serving history
+_REQUIRED_SETTINGS = {
+    "SENDGRID_API_KEY": "",
+    "USE_REAL_MAILER": "false",
+    "NOTIFY_EMAILS": "",
+    "PORT": "8000",
+}
+
+
+@dataclass
+class BenchmarkConfig:
+    database_url: str
+    """
+    Every table the benchmarks touch is emptied, so this has to be a database of its own
+    """
+    repeat: int
+    warmup: int
+    ticker_sizes: List[int]
+    tracked_pairs: int
+    """
+    How many of the ticker's currency pairs fetch_trade_volumes keeps
+    """
+    insert_pairs: List[int]
+    insert_batch_sizes: List[int]
+    table_sizes: List[Tuple[int, int]]
+    """
+    Currency pairs and samples per currency pair over the last 24 hours to run the store queries against
+    """
+    api_table_size: Tuple[int, int]
+    api_concurrency: List[int]
+    api_requests: int
+    """
+    Requests sent at each concurrency
+    """
+    api_workers: int
+
+
+def _settings_env(database_url: str) -> Dict[str, str]:
+    env = {**os.environ, "DATABASE_URL": database_url}
+    for name, value in _REQUIRED_SETTINGS.items():
+        env.setdefault(name, value)
+    return env
+
+
+def migrate(database_url: str) -> None:
+    """
+    Bring the benchmark database up to the schema of the code being measured
+    """
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"],
+        check=True,
+        env=_settings_env(database_url),
+        stdout=subprocess.DEVNULL,
+    )
+
+
+async def _seed(db: Database, pairs: int, samples: int) -> List[str]:
+    currency_pairs = make_currency_pairs(pairs)
+    await reset_database(db)
+    await seed_currency_pairs(db, currency_pairs)
+    await seed_trade_volumes(
+        db,
+        samples,
+        end=datetime.now(timezone.utc),
+        interval=HISTORY_WINDOW / samples,
+    )
+    return currency_pairs
+
+
+async def _make_store(db: Database, **kwargs) -> CurrencyTradeVolumeStore:
+    registry = CurrencyPairRegistry(db)
+    await registry.refresh()
+    return CurrencyTradeVolumeStore(db, registry, **kwargs)
+
+
+async def bench_fetch_trade_volumes(config: BenchmarkConfig) -> List[BenchmarkResult]:
+    """
+    Fetching and parsing the ticker from a local fake of livecoin, with each way LivecoinApi can fetch it
+    """
+    results: List[BenchmarkResult] = []
+    for ticker_size in config.ticker_sizes:
+        currency_pairs = make_currency_pairs(ticker_size)
+        # Spread over the ticker, streaming has to get through all of it either way
+        step = max(1, ticker_size // config.tracked_pairs)
+        tracked = set(currency_pairs[::step][: config.tracked_pairs])
+        server = FakeTickerServer(make_ticker(currency_pairs))
+        await server.start()
+        try:
+            async with httpx.AsyncClient() as client:
+                for strategy, streaming in [
+                    (FetchStrategy.FULL_TICKER, False),
+                    (FetchStrategy.FULL_TICKER, True),
+                    (FetchStrategy.PER_SYMBOL, False),
+                ]:
+                    api = LivecoinApi(
+                        client,
+                        streaming=streaming,
+                        base_url=server.base_url,
+                        strategy=strategy,
+                    )
+                    seconds = await measure(
+                        lambda: api.fetch_trade_volumes(tracked),
+                        config.repeat,
+                        config.warmup,
+                    )
+                    results.append(
+                        BenchmarkResult(
+                            "fetch_trade_volumes",
+                            {
+                                "ticker_pairs": ticker_size,
+                                "tracked_pairs": len(tracked),
+                                "strategy": strategy.value,
+                                "streaming": streaming,
+                            },
+                            seconds,
+                            {"ticker_bytes": server.ticker_bytes},
+                        )
+                    )
+        finally:
+            await server.stop()
+    return results
+
+
+async def bench_record_trade_volumes(
+    config: BenchmarkConfig, db: Database
+) -> List[BenchmarkResult]:
+    """
+    Recording one tick of every currency pair at a time
+    """
+    results: List[BenchmarkResult] = []
+    for pairs, batch_size in itertools.product(
+        config.insert_pairs, config.insert_batch_sizes
+    ):
+        currency_pairs = make_currency_pairs(pairs)
+        await reset_database(db)
+        await seed_currency_pairs(db, currency_pairs)
+        await VolumePartitionManager(db).ensure_partitions()
+        store = await _make_store(db, insert_batch_size=batch_size)
+
+        records = make_trade_volume_records(
+            currency_pairs,
+            config.warmup + config.repeat,
+            end=datetime.now(timezone.utc),
+            interval=timedelta(minutes=1),
+        )
+        ticks = iter(
+            [list(tick) for _, tick in itertools.groupby(records, lambda r: r.time)]
+        )
+        seconds = await measure(
+            lambda: store.record_trade_volumes(next(ticks)),
+            config.repeat,
+            config.warmup,
+        )
+        results.append(
+            BenchmarkResult(
+                "record_trade_volumes",
+                {"pairs": pairs, "batch_size": batch_size},
+                seconds,
+                {"rows_per_second": pairs / percentile(seconds, 50)},
+            )
+        )
+    return results
+
+
+async def bench_store_queries(
+    config: BenchmarkConfig, db: Database
+) -> List[BenchmarkResult]:
+    """
+    The queries behind alerts, ranks and the history API, against tables of each size in config.table_sizes
+    """
+    results: List[BenchmarkResult] = []
+    rng = random.Random(0)
+    for pairs, samples in config.table_sizes:
+        currency_pairs = await _seed(db, pairs, samples)
+        store = await _make_store(db)
+        await store.refresh_currency_pair_ranks()
+
+        params = {"pairs": pairs, "samples": samples, "rows": pairs * samples}
+        queries: List[Tuple[str, Callable[[], Awaitable[Any]]]] = [
+            ("get_currency_pair_averages", store.get_currency_pair_averages),
+            ("get_currency_pair_ranks", store.get_currency_pair_ranks),
+            ("refresh_currency_pair_ranks", store.refresh_currency_pair_ranks),
+            ("get_volume_statistics", store.get_volume_statistics),
+            (
+                "get_currency_pair_history",
+                lambda: store.get_currency_pair_history(rng.choice(currency_pairs)),
+            ),
+        ]
+        for name, run in queries:
+            seconds = await measure(run, config.repeat, config.warmup)
+            results.append(BenchmarkResult(name, params, seconds))
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+@asynccontextmanager
+async def run_api(
+    database_url: str, workers: int, startup_seconds: float = 30
+) -> AsyncIterator[str]:
+    """
+    Serve the app from uvicorn in a separate process, like in production, so the load generator doesn't compete with
+    it for the event loop. Yields the base url once it answers requests
+    """
+    port = _free_port()
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app.main:app",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(port),
+                "--workers",
+                str(workers),
+                "--log-level",
+                "warning",
+            ],
+            env={**_settings_env(database_url), "PORT": str(port)},
+            # The app logs every request at debug level to stdout
+            stdout=subprocess.DEVNULL,
+            stderr=errors,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            deadline = time.monotonic() + startup_seconds
+            async with httpx.AsyncClient() as client:
+                while True:
+                    if process.poll() is not None:
+                        errors.seek(0)
+                        raise RuntimeError(
+                            "The API exited on startup:\n" + errors.read().decode()
+                        )
+                    try:
+                        response = await client.get(base_url + "/api/database_pool")
+                        if response.status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    if time.monotonic() > deadline:
+                        raise RuntimeError("The API didn't start in time")
+                    await asyncio.sleep(0.1)
+
+            yield base_url
+        finally:
+            process.terminate()
+            process.wait()
+
+
+async def _send_requests(
+    client: httpx.AsyncClient,
+    base_url: str,
+    currency_pairs: List[str],
+    concurrency: int,
+) -> Tuple[List[float], int, float]:
+    """
+    Send a request for each currency pair from concurrency workers that each wait for their last response before
+    sending another. Returns the latencies of successful requests, the number of failures and the wall clock time
+    """
+    # The workers share the iterator, so every currency pair is requested once
+    remaining = iter(currency_pairs)
+    latencies: List[float] = []
+    failures = 0
+
+    async def worker():
+        nonlocal failures
+        for currency_pair in remaining:
+            start = time.perf_counter()
+            try:
+                response = await client.get(
+                    base_url + "/api/volume_history",
+                    params={"currency_pair": currency_pair},
+                )
+            except httpx.TransportError:
+                failures += 1
+                continue
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, failures, time.perf_counter() - start
+
+
+async def bench_volume_history_api(
+    config: BenchmarkConfig, db: Database
+) -> List[BenchmarkResult]:
+    """
+    /api/volume_history latency at each concurrency, measured end to end over HTTP. The load generator runs in this
+    process, so at high concurrency it can become the bottleneck, compare its requests per second to the API's CPU
+    """
+    pairs, samples = config.api_table_size
+    currency_pairs = await _seed(db, pairs, samples)
+    await (await _make_store(db)).refresh_currency_pair_ranks()
+
+    results: List[BenchmarkResult] = []
+    rng = random.Random(0)
+    async with run_api(config.database_url, config.api_workers) as base_url:
+        async with httpx.AsyncClient(timeout=60) as client:
+            for concurrency in config.api_concurrency:
+                # Warm up every worker's connection and the app's connection pool
+                await _send_requests(
+                    client,
+                    base_url,
+                    rng.choices(currency_pairs, k=concurrency * config.warmup),
+                    concurrency,
+                )
+                latencies, failures, elapsed = await _send_requests(
+                    client,
+                    base_url,
+                    rng.choices(currency_pairs, k=config.api_requests),
+                    concurrency,
+                )
+                if not latencies:
+                    raise RuntimeError(
+                        f"Every request failed at a concurrency of {concurrency}"
+                    )
+                results.append(
+                    BenchmarkResult(
+                        "volume_history_api",
+                        {
+                            "pairs": pairs,
+                            "samples": samples,
+                            "concurrency": concurrency,
+                            "workers": config.api_workers,
+                        },
+                        latencies,
+                        {
+                            "requests_per_second": len(latencies) / elapsed,
+                            "failures": failures,
+                        },
+                    )
+                )
+    return results
@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.data import make_currency_pairs, make_ticker
+
+
+class FakeTickerServer:
+    """
+    Stands in for livecoin's /exchange/ticker endpoint, the full ticker and single currency pairs, over keep-alive
+    HTTP/1.1 connections. Bodies are encoded once up front so the server costs as little as possible next to the
+    client being measured
+    """
+
+    def __init__(self, ticker: List[Dict[str, Any]]):
+        self._ticker_body = json.dumps(ticker).encode()
+        self._item_bodies = {
+            item["symbol"]: json.dumps(item).encode() for item in ticker
+        }
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.base_url = ""
+        self.request_count = 0
+
+    @property
+    def ticker_bytes(self) -> int:
+        return len(self._ticker_body)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        bound_port = self._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound_port}"
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self) -> None:
+        assert self._server is not None
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                # GET requests don't have a body, so the headers are all there is to skip
+                while await reader.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+
+                self.request_count += 1
+                status, body = self._respond(request_line.decode().split(" ")[1])
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, target: str) -> Tuple[int, bytes]:
+        url = urlparse(target)
+        if url.path != "/exchange/ticker":
+            return 404, b"{}"
+
+        symbol = parse_qs(url.query).get("currencyPair", [None])[0]
+        if symbol is None:
+            return 200, self._ticker_body
+        if symbol not in self._item_bodies:
+            return 404, b"{}"
+        return 200, self._item_bodies[symbol]
+
+
+async def _serve(host: str, port: int, pairs: int) -> None:
+    server = FakeTickerServer(make_ticker(make_currency_pairs(pairs)))
+    await server.start(host, port)
+    print(f"Serving {pairs} currency pairs at {server.base_url}/exchange/ticker")
+    await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve a synthetic livecoin ticker, point LIVECOIN_BASE_URL at it"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--pairs", type=int, default=1000)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_serve(args.host, args.port, args.pairs))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""add currency pair fetch time index
+
+Revision ID: 3f9d2b7a1c05
+Revises: c14a6cd36ba8
+Create Date: 2020-05-02 10:12:44.184215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3f9d2b7a1c05"
+down_revision = "c14a6cd36ba8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Every query filters on a time range, and all but the cross-pair aggregates
+    # also filter on a single currency pair
+    op.create_index(
+        "ix_currency_pair_volumes_currency_pair_fetch_time",
+        "currency_pair_volumes",
+        ["currency_pair", "fetch_time"],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_currency_pair_volumes_currency_pair_fetch_time",
+        table_name="currency_pair_volumes",
+    )
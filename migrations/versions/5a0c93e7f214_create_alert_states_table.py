@@ -0,0 +1,31 @@
+"""create alert states table
+
+Revision ID: 5a0c93e7f214
+Revises: d27c5e9a4b18
+Create Date: 2020-05-04 09:21:37.552081
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5a0c93e7f214"
+down_revision = "d27c5e9a4b18"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "alert_states",
+        sa.Column("currency_pair", sa.String, nullable=False),
+        sa.Column("email", sa.String, nullable=False),
+        sa.Column("last_alert_time", sa.types.DateTime(timezone=True), nullable=True),
+        sa.Column("armed", sa.Boolean, nullable=False),
+        sa.PrimaryKeyConstraint("currency_pair", "email"),
+    )
+
+
+def downgrade():
+    op.drop_table("alert_states")
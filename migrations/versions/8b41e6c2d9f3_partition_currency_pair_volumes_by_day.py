@@ -0,0 +1,166 @@
+"""partition currency pair volumes by day
+
+Revision ID: 8b41e6c2d9f3
+Revises: 3f9d2b7a1c05
+Create Date: 2020-05-02 11:40:03.927511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8b41e6c2d9f3"
+down_revision = "3f9d2b7a1c05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "ALTER TABLE currency_pair_volumes RENAME TO currency_pair_volumes_unpartitioned"
+    )
+    op.execute(
+        """
+        ALTER INDEX ix_currency_pair_volumes_currency_pair_fetch_time
+        RENAME TO ix_currency_pair_volumes_unpartitioned_currency_pair_fetch_time
+        """
+    )
+    op.execute(
+        """
+        ALTER TABLE currency_pair_volumes_unpartitioned
+        RENAME CONSTRAINT currency_pair_volumes_pkey TO currency_pair_volumes_unpartitioned_pkey
+        """
+    )
+
+    # Partitioned tables need the partition key in their primary key. Keep using
+    # the existing id sequence so ids carry on where they left off
+    op.execute(
+        """
+        CREATE TABLE currency_pair_volumes (
+            id integer NOT NULL DEFAULT nextval('currency_pair_volumes_id_seq'),
+            fetch_time timestamp with time zone NOT NULL,
+            volume numeric NOT NULL,
+            currency_pair varchar NOT NULL,
+            CONSTRAINT currency_pair_volumes_pkey PRIMARY KEY (id, fetch_time)
+        ) PARTITION BY RANGE (fetch_time)
+        """
+    )
+    op.execute(
+        "ALTER SEQUENCE currency_pair_volumes_id_seq OWNED BY currency_pair_volumes.id"
+    )
+    op.create_index(
+        "ix_currency_pair_volumes_currency_pair_fetch_time",
+        "currency_pair_volumes",
+        ["currency_pair", "fetch_time"],
+    )
+    # Catches anything recorded before its day's partition was created
+    op.execute(
+        "CREATE TABLE currency_pair_volumes_default PARTITION OF currency_pair_volumes DEFAULT"
+    )
+
+    # Partitions cover a single UTC day. Ingest calls this ahead of time (see
+    # app/volume_partitions.py). If rows already landed in the default partition
+    # they are moved over, otherwise attaching the new partition would fail
+    op.execute(
+        """
+        CREATE FUNCTION create_currency_pair_volumes_partition(day date) RETURNS void AS $$
+        DECLARE
+            partition_name text := 'currency_pair_volumes_p' || to_char(day, 'YYYYMMDD');
+            range_start timestamp with time zone := day::timestamp AT TIME ZONE 'UTC';
+            range_end timestamp with time zone := (day + 1)::timestamp AT TIME ZONE 'UTC';
+        BEGIN
+            -- Serialize partition creation between processes
+            PERFORM pg_advisory_xact_lock(hashtext('currency_pair_volumes_partitions'));
+            IF to_regclass(partition_name) IS NOT NULL THEN
+                RETURN;
+            END IF;
+
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE currency_pair_volumes INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                partition_name
+            );
+            EXECUTE format(
+                'WITH moved AS ('
+                '    DELETE FROM currency_pair_volumes_default'
+                '    WHERE fetch_time >= %L AND fetch_time < %L RETURNING *'
+                ') INSERT INTO %I SELECT * FROM moved',
+                range_start, range_end, partition_name
+            );
+            EXECUTE format(
+                'ALTER TABLE currency_pair_volumes ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, range_start, range_end
+            );
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        SELECT create_currency_pair_volumes_partition(day::date)
+        FROM generate_series(
+            COALESCE(
+                (SELECT min(fetch_time AT TIME ZONE 'UTC')::date FROM currency_pair_volumes_unpartitioned),
+                (now() AT TIME ZONE 'UTC')::date
+            ),
+            (now() AT TIME ZONE 'UTC')::date + 2,
+            INTERVAL '1 day'
+        ) AS day
+        """
+    )
+
+    op.execute(
+        """
+        INSERT INTO currency_pair_volumes (id, fetch_time, volume, currency_pair)
+        SELECT id, fetch_time, volume, currency_pair
+        FROM currency_pair_volumes_unpartitioned
+        """
+    )
+    op.drop_table("currency_pair_volumes_unpartitioned")
+
+
+def downgrade():
+    op.execute(
+        "ALTER TABLE currency_pair_volumes RENAME TO currency_pair_volumes_partitioned"
+    )
+    op.execute(
+        """
+        ALTER INDEX ix_currency_pair_volumes_currency_pair_fetch_time
+        RENAME TO ix_currency_pair_volumes_partitioned_currency_pair_fetch_time
+        """
+    )
+    op.execute(
+        """
+        ALTER TABLE currency_pair_volumes_partitioned
+        RENAME CONSTRAINT currency_pair_volumes_pkey TO currency_pair_volumes_partitioned_pkey
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE currency_pair_volumes (
+            id integer DEFAULT nextval('currency_pair_volumes_id_seq')
+                CONSTRAINT currency_pair_volumes_pkey PRIMARY KEY,
+            fetch_time timestamp with time zone NOT NULL,
+            volume numeric NOT NULL,
+            currency_pair varchar NOT NULL
+        )
+        """
+    )
+    op.execute(
+        "ALTER SEQUENCE currency_pair_volumes_id_seq OWNED BY currency_pair_volumes.id"
+    )
+    op.create_index(
+        "ix_currency_pair_volumes_currency_pair_fetch_time",
+        "currency_pair_volumes",
+        ["currency_pair", "fetch_time"],
+    )
+    op.execute(
+        """
+        INSERT INTO currency_pair_volumes (id, fetch_time, volume, currency_pair)
+        SELECT id, fetch_time, volume, currency_pair
+        FROM currency_pair_volumes_partitioned
+        """
+    )
+    # Dropping the parent drops every partition along with it
+    op.drop_table("currency_pair_volumes_partitioned")
+    op.execute("DROP FUNCTION create_currency_pair_volumes_partition(date)")
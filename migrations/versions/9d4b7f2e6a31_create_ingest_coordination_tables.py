@@ -0,0 +1,49 @@
+"""create ingest coordination tables
+
+Revision ID: 9d4b7f2e6a31
+Revises: e6f1a3b8c52d
+Create Date: 2020-05-10 15:03:12.904518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "9d4b7f2e6a31"
+down_revision = "e6f1a3b8c52d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ingest_workers",
+        sa.Column("worker_id", sa.String, primary_key=True),
+        sa.Column("heartbeat_at", sa.types.DateTime(timezone=True), nullable=False),
+    )
+    op.create_table(
+        "ingest_shard_leases",
+        sa.Column("shard", sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column("worker_id", sa.String, nullable=False),
+        sa.Column("expires_at", sa.types.DateTime(timezone=True), nullable=False),
+    )
+    op.create_table(
+        "ingest_ticks",
+        sa.Column("tick", sa.BigInteger, primary_key=True, autoincrement=False),
+        sa.Column("shard_count", sa.Integer, nullable=False),
+        sa.Column(
+            "completed_shards",
+            postgresql.ARRAY(sa.Integer),
+            nullable=False,
+            server_default="{}",
+        ),
+        sa.Column("finalized_at", sa.types.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table("ingest_ticks")
+    op.drop_table("ingest_shard_leases")
+    op.drop_table("ingest_workers")
@@ -0,0 +1,51 @@
+"""create currency pair ranks table
+
+Revision ID: b7e2c4f91a08
+Revises: 9d4b7f2e6a31
+Create Date: 2020-05-12 10:47:55.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b7e2c4f91a08"
+down_revision = "9d4b7f2e6a31"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "currency_pair_ranks",
+        sa.Column(
+            "currency_pair_id",
+            sa.Integer,
+            sa.ForeignKey("tracked_currency_pairs.id"),
+            primary_key=True,
+            autoincrement=False,
+        ),
+        sa.Column("rank", sa.Integer, nullable=False),
+        sa.Column("volume_std_dev", sa.Float, nullable=True),
+        sa.Column("computed_at", sa.types.DateTime(timezone=True), nullable=False),
+    )
+    # Rank what's already been recorded so snapshots keep working until the next ingest tick
+    op.execute(
+        """
+        INSERT INTO currency_pair_ranks (currency_pair_id, rank, volume_std_dev, computed_at)
+        SELECT
+            pair.id,
+            row_number() OVER (ORDER BY stddev(volume) DESC, pair.symbol DESC),
+            stddev(volume),
+            now()
+        FROM currency_pair_volumes volume
+        JOIN tracked_currency_pairs pair ON pair.id = volume.currency_pair_id
+        WHERE fetch_time >= NOW() - INTERVAL '24 HOURS'
+        GROUP BY pair.id, pair.symbol
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("currency_pair_ranks")
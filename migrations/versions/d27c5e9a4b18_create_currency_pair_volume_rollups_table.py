@@ -0,0 +1,46 @@
+"""create currency pair volume rollups table
+
+Revision ID: d27c5e9a4b18
+Revises: 8b41e6c2d9f3
+Create Date: 2020-05-03 14:05:51.310472
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d27c5e9a4b18"
+down_revision = "8b41e6c2d9f3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "currency_pair_volume_rollups",
+        sa.Column("currency_pair", sa.String, nullable=False),
+        sa.Column("resolution_seconds", sa.Integer, nullable=False),
+        sa.Column("bucket_start", sa.types.DateTime(timezone=True), nullable=False),
+        sa.Column("min_volume", sa.Numeric, nullable=False),
+        sa.Column("max_volume", sa.Numeric, nullable=False),
+        # Average is volume_sum / sample_count, keeping both lets buckets be
+        # updated incrementally as samples arrive
+        sa.Column("volume_sum", sa.Numeric, nullable=False),
+        sa.Column("sample_count", sa.Integer, nullable=False),
+        sa.Column("last_volume", sa.Numeric, nullable=False),
+        sa.Column(
+            "last_fetch_time", sa.types.DateTime(timezone=True), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("currency_pair", "resolution_seconds", "bucket_start"),
+    )
+    # Used to prune old buckets of a resolution across all currency pairs
+    op.create_index(
+        "ix_currency_pair_volume_rollups_resolution_seconds_bucket_start",
+        "currency_pair_volume_rollups",
+        ["resolution_seconds", "bucket_start"],
+    )
+
+
+def downgrade():
+    op.drop_table("currency_pair_volume_rollups")
@@ -0,0 +1,143 @@
+"""create tracked currency pairs table
+
+Revision ID: e6f1a3b8c52d
+Revises: 5a0c93e7f214
+Create Date: 2020-05-09 10:12:44.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e6f1a3b8c52d"
+down_revision = "5a0c93e7f214"
+branch_labels = None
+depends_on = None
+
+# The pairs that used to be hard coded in app/currency_trade_volume_service.py
+_SEED_PAIRS = ["XEM/BTC", "OTON/BTC", "DGB/BTC"]
+
+
+def upgrade():
+    op.create_table(
+        "tracked_currency_pairs",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("symbol", sa.String, nullable=False, unique=True),
+        sa.Column(
+            "enabled", sa.Boolean, nullable=False, server_default=sa.sql.true()
+        ),
+    )
+    op.bulk_insert(
+        sa.table("tracked_currency_pairs", sa.column("symbol", sa.String)),
+        [{"symbol": symbol} for symbol in _SEED_PAIRS],
+    )
+    # Anything recorded that's no longer tracked still needs an id for its history,
+    # but isn't fetched any more
+    op.execute(
+        """
+        INSERT INTO tracked_currency_pairs (symbol, enabled)
+        SELECT DISTINCT currency_pair, false FROM currency_pair_volumes
+        UNION
+        SELECT DISTINCT currency_pair, false FROM currency_pair_volume_rollups
+        ON CONFLICT (symbol) DO NOTHING
+        """
+    )
+
+    op.add_column(
+        "currency_pair_volumes",
+        sa.Column(
+            "currency_pair_id",
+            sa.Integer,
+            sa.ForeignKey("tracked_currency_pairs.id"),
+        ),
+    )
+    op.execute(
+        """
+        UPDATE currency_pair_volumes volume SET currency_pair_id = pair.id
+        FROM tracked_currency_pairs pair
+        WHERE pair.symbol = volume.currency_pair
+        """
+    )
+    op.alter_column("currency_pair_volumes", "currency_pair_id", nullable=False)
+    op.drop_index(
+        "ix_currency_pair_volumes_currency_pair_fetch_time", "currency_pair_volumes"
+    )
+    op.drop_column("currency_pair_volumes", "currency_pair")
+    op.create_index(
+        "ix_currency_pair_volumes_currency_pair_id_fetch_time",
+        "currency_pair_volumes",
+        ["currency_pair_id", "fetch_time"],
+    )
+
+    op.add_column(
+        "currency_pair_volume_rollups",
+        sa.Column(
+            "currency_pair_id",
+            sa.Integer,
+            sa.ForeignKey("tracked_currency_pairs.id"),
+        ),
+    )
+    op.execute(
+        """
+        UPDATE currency_pair_volume_rollups rollup SET currency_pair_id = pair.id
+        FROM tracked_currency_pairs pair
+        WHERE pair.symbol = rollup.currency_pair
+        """
+    )
+    op.alter_column(
+        "currency_pair_volume_rollups", "currency_pair_id", nullable=False
+    )
+    op.drop_constraint(
+        "currency_pair_volume_rollups_pkey", "currency_pair_volume_rollups"
+    )
+    op.drop_column("currency_pair_volume_rollups", "currency_pair")
+    op.create_primary_key(
+        "currency_pair_volume_rollups_pkey",
+        "currency_pair_volume_rollups",
+        ["currency_pair_id", "resolution_seconds", "bucket_start"],
+    )
+
+
+def downgrade():
+    op.add_column(
+        "currency_pair_volume_rollups", sa.Column("currency_pair", sa.String)
+    )
+    op.execute(
+        """
+        UPDATE currency_pair_volume_rollups rollup SET currency_pair = pair.symbol
+        FROM tracked_currency_pairs pair
+        WHERE pair.id = rollup.currency_pair_id
+        """
+    )
+    op.alter_column("currency_pair_volume_rollups", "currency_pair", nullable=False)
+    op.drop_constraint(
+        "currency_pair_volume_rollups_pkey", "currency_pair_volume_rollups"
+    )
+    op.drop_column("currency_pair_volume_rollups", "currency_pair_id")
+    op.create_primary_key(
+        "currency_pair_volume_rollups_pkey",
+        "currency_pair_volume_rollups",
+        ["currency_pair", "resolution_seconds", "bucket_start"],
+    )
+
+    op.add_column("currency_pair_volumes", sa.Column("currency_pair", sa.String))
+    op.execute(
+        """
+        UPDATE currency_pair_volumes volume SET currency_pair = pair.symbol
+        FROM tracked_currency_pairs pair
+        WHERE pair.id = volume.currency_pair_id
+        """
+    )
+    op.alter_column("currency_pair_volumes", "currency_pair", nullable=False)
+    op.drop_index(
+        "ix_currency_pair_volumes_currency_pair_id_fetch_time", "currency_pair_volumes"
+    )
+    op.drop_column("currency_pair_volumes", "currency_pair_id")
+    op.create_index(
+        "ix_currency_pair_volumes_currency_pair_fetch_time",
+        "currency_pair_volumes",
+        ["currency_pair", "fetch_time"],
+    )
+
+    op.drop_table("tracked_currency_pairs")